@@ -0,0 +1,281 @@
+# bank.py
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Local question bank: the built-in fallback questions plus every generated batch that passed quality.py
+QUESTION_BANK_PATH = os.environ.get("QUESTION_BANK_PATH", os.path.join("data", "questions.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    exam TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    question TEXT NOT NULL,
+    options TEXT NOT NULL,
+    correct_answer INTEGER NOT NULL,
+    explanation TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL,
+    fingerprint TEXT NOT NULL UNIQUE,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_by_subject ON questions (exam, subject, id);
+"""
+# Calibrated by calibrate.py from the answer history (NULL until a question has enough answers):
+# difficulty on the IRT logit scale (0 = a typical learner gets it right half the time)
+CALIBRATION_COLUMNS = {'difficulty': 'REAL', 'discrimination': 'REAL'}
+# Calibrated difficulty ranges of /quiz easy|medium|hard <keywords>
+DIFFICULTY_BANDS = {'easy': (float('-inf'), -0.5), 'medium': (-0.5, 0.5), 'hard': (0.5, float('inf'))}
+
+# Full-text index over question text, options and explanation. add_batch indexes the rows it
+# inserts with one INSERT ... SELECT (twice as fast as a per-row trigger on bulk imports);
+# triggers keep it in step with edits and deletes
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+    question, options, explanation, content='questions', content_rowid='id'
+);
+DROP TRIGGER IF EXISTS questions_fts_insert;
+CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, question, options, explanation)
+    VALUES ('delete', old.id, old.question, old.options, old.explanation);
+END;
+-- Only edits of indexed text re-index a row (not calibration updates); recreated so older banks get this
+DROP TRIGGER IF EXISTS questions_fts_update;
+CREATE TRIGGER questions_fts_update AFTER UPDATE OF question, options, explanation ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, question, options, explanation)
+    VALUES ('delete', old.id, old.question, old.options, old.explanation);
+    INSERT INTO questions_fts (rowid, question, options, explanation)
+    VALUES (new.id, new.question, new.options, new.explanation);
+END;
+"""
+# Words too common to narrow a search
+STOP_WORDS = {"a", "an", "and", "the", "of", "on", "in", "for", "to", "about", "quiz", "questions", "question"}
+
+_db = None
+_fts_available = False
+# One connection shared by the event loop and worker threads; hold db_lock while using it
+# (re-entrant: opening the bank seeds it)
+db_lock = threading.RLock()
+
+def fingerprint(exam: str, question: str) -> str:
+    """Identity of a question for deduplication: exam plus its text, ignoring case, spacing and numbering."""
+    text = " ".join(question.lower().split())
+    # Fallback batches are numbered "3. ..." when they are repeated to fill a quiz
+    head, _, rest = text.partition(". ")
+    if head.isdigit() and rest:
+        text = rest
+    return hashlib.sha1(f"{exam}\n{text}".encode("utf-8")).hexdigest()
+
+def get_db() -> sqlite3.Connection:
+    global _db
+    with db_lock:
+        if _db is None:
+            directory = os.path.dirname(QUESTION_BANK_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(QUESTION_BANK_PATH, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            # WAL with synchronous=NORMAL: commits do not wait for an fsync
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            _add_calibration_columns(db)
+            _create_search_index(db)
+            _db = db
+            _seed_fallbacks()
+        return _db
+
+def _add_calibration_columns(db: sqlite3.Connection):
+    """Add the calibration columns to a bank created before they existed."""
+    existing = {row[1] for row in db.execute("PRAGMA table_info(questions)")}
+    with db:
+        for column, column_type in CALIBRATION_COLUMNS.items():
+            if column not in existing:
+                db.execute(f"ALTER TABLE questions ADD COLUMN {column} {column_type}")
+
+def _create_search_index(db: sqlite3.Connection):
+    global _fts_available
+    existed = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").fetchone() is not None
+    try:
+        db.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5: everything but keyword search still works
+        logger.error(f"Question search disabled: {e}")
+        return
+    if not existed:
+        # A bank from before the index existed
+        with db:
+            db.execute("INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')")
+    _fts_available = True
+
+def _seed_fallbacks():
+    """Make sure the built-in questions are in the bank (no-op after the first run)."""
+    sources = []
+    try:
+        from personal import fallback_questions
+        sources.append(('12th', fallback_questions))
+    except ImportError:
+        pass
+    try:
+        from upsc import upsc_fallback_questions
+        sources.append(('upsc', upsc_fallback_questions))
+    except ImportError:
+        pass
+    added = 0
+    for exam, by_subject in sources:
+        for subject, questions in by_subject.items():
+            added += add_questions(exam, subject, questions, 'fallback')
+    if added:
+        logger.info(f"Seeded the question bank with {added} built-in questions")
+
+def close():
+    global _db
+    if _db is not None:
+        with db_lock:
+            _db.close()
+            _db = None
+
+def _row_values(exam: str, subject: str, question: dict, source: str, now: float) -> tuple:
+    return (exam, subject, question['question'], json.dumps(question['options'], ensure_ascii=False),
+            question['correct_answer'], question.get('explanation') or "", source,
+            fingerprint(exam, question['question']), now)
+
+def add_questions(exam: str, subject: str, questions: list, source: str) -> int:
+    """Store questions in one transaction, skipping ones already banked; returns how many were new."""
+    return add_batch([(exam, subject, question) for question in questions], source)
+
+def add_batch(entries: list, source: str) -> int:
+    """add_questions for (exam, subject, question) entries of any exams and subjects."""
+    if not entries:
+        return 0
+    now = time.time()
+    rows = [_row_values(exam, subject, question, source, now) for exam, subject, question in entries]
+    with db_lock, get_db() as db:
+        last_id = db.execute("SELECT MAX(id) FROM questions").fetchone()[0] or 0
+        # rowcount, not total_changes: that also counts the search index rows
+        added = db.executemany(
+            "INSERT OR IGNORE INTO questions (exam, subject, question, options, correct_answer, explanation, "
+            "source, fingerprint, added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows).rowcount
+        if added and _fts_available:
+            # New rows always get ids above the previous maximum
+            db.execute("INSERT INTO questions_fts (rowid, question, options, explanation) "
+                       "SELECT id, question, options, explanation FROM questions WHERE id > ?", (last_id,))
+        return added
+
+def attach_ids(exam: str, questions: list):
+    """Set each question's bank 'id' and 'subject' (when it is banked) so answers can be tracked per question."""
+    by_fingerprint = {fingerprint(exam, question['question']): question for question in questions}
+    placeholders = ", ".join("?" * len(by_fingerprint))
+    with db_lock:
+        rows = get_db().execute(
+            f"SELECT id, subject, fingerprint FROM questions WHERE fingerprint IN ({placeholders})", list(by_fingerprint)).fetchall()
+    for row in rows:
+        by_fingerprint[row['fingerprint']]['id'] = row['id']
+        by_fingerprint[row['fingerprint']]['subject'] = row['subject']
+
+def cache_generated(exam: str, subject: str, questions: list):
+    """Keep a generated batch for solo practice and tag it with bank ids; a bank problem never fails the quiz itself."""
+    try:
+        added = add_questions(exam, subject, questions, 'generated')
+        attach_ids(exam, questions)
+    except (sqlite3.Error, OSError, KeyError, TypeError) as e:
+        logger.error(f"Could not cache generated {exam} {subject} questions: {e}")
+        return
+    if added:
+        logger.info(f"Banked {added} new {exam} {subject} questions")
+
+def _to_question(row) -> dict:
+    return {
+        'id': row['id'],
+        'question': row['question'],
+        'options': json.loads(row['options']),
+        'correct_answer': row['correct_answer'],
+        'explanation': row['explanation'],
+    }
+
+def set_calibration(rows: list, batch_size: int = 5000):
+    """Write (difficulty, discrimination, question id) rows, a batch per lock hold so quizzes are not held up."""
+    for start in range(0, len(rows), batch_size):
+        with db_lock, get_db() as db:
+            db.executemany("UPDATE questions SET difficulty = ?, discrimination = ? WHERE id = ?",
+                           rows[start:start + batch_size])
+
+def sample(exam: str, subject: str, limit: int) -> list:
+    """Up to `limit` distinct banked questions of a subject (with their 'id'), in random order."""
+    with db_lock:
+        rows = get_db().execute("SELECT * FROM questions WHERE exam = ? AND subject = ? ORDER BY RANDOM() LIMIT ?",
+                                (exam, subject, limit)).fetchall()
+    return [_to_question(row) for row in rows]
+
+def count(exam: str, subject: str) -> int:
+    with db_lock:
+        return get_db().execute(
+            "SELECT COUNT(*) FROM questions WHERE exam = ? AND subject = ?", (exam, subject)).fetchone()[0]
+
+def get_question(question_id: int):
+    """One question as the quiz dict (with its 'id'), or None if it is gone."""
+    with db_lock:
+        row = get_db().execute("SELECT * FROM questions WHERE id = ?", (question_id,)).fetchone()
+    return _to_question(row) if row is not None else None
+
+def iter_questions(exam: str = None, subject: str = None, page_size: int = 1000):
+    """Every banked question (with 'exam' and 'subject'), in id order, a page per lock hold."""
+    last_id = 0
+    sql = "SELECT * FROM questions WHERE id > ?"
+    filters = []
+    if exam:
+        sql += " AND exam = ?"
+        filters.append(exam)
+    if subject:
+        sql += " AND subject = ?"
+        filters.append(subject)
+    sql += " ORDER BY id LIMIT ?"
+    while True:
+        with db_lock:
+            rows = get_db().execute(sql, [last_id, *filters, page_size]).fetchall()
+        for row in rows:
+            question = _to_question(row)
+            question['exam'] = row['exam']
+            question['subject'] = row['subject']
+            yield question
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]['id']
+
+def search(keywords: str, exam: str = None, limit: int = 20, band: str = None) -> list:
+    """Banked questions matching every keyword (prefix match), best first by bm25 with the
+    question text weighted above the explanation and options. Each result also has 'exam' and 'subject'.
+
+    `band` ('easy', 'medium', 'hard') keeps only calibrated questions of that difficulty."""
+    terms = [term for term in re.findall(r"\w+", keywords.lower()) if term not in STOP_WORDS]
+    db = get_db()
+    if not terms or not _fts_available:
+        return []
+    match = " ".join(f'"{term}"*' for term in terms)
+    sql = ("SELECT questions.* FROM questions_fts JOIN questions ON questions.id = questions_fts.rowid "
+           "WHERE questions_fts MATCH ?")
+    params = [match]
+    if exam:
+        sql += " AND questions.exam = ?"
+        params.append(exam)
+    if band:
+        sql += " AND questions.difficulty >= ? AND questions.difficulty < ?"
+        params.extend(DIFFICULTY_BANDS[band])
+    sql += " ORDER BY bm25(questions_fts, 5.0, 1.0, 2.0) LIMIT ?"
+    params.append(limit)
+    with db_lock:
+        rows = db.execute(sql, params).fetchall()
+    results = []
+    for row in rows:
+        question = _to_question(row)
+        question['exam'] = row['exam']
+        question['subject'] = row['subject']
+        results.append(question)
+    return results
@@ -0,0 +1,289 @@
+# bank_tool.py
+"""Bulk import and export of the question bank.
+
+Files are CSV with the columns exam, subject, question, option_a .. option_d, correct_answer (A-D)
+and explanation, or JSON Lines with one question per line (the same keys, `options` as a list and
+`correct_answer` as a 0-based index or a letter). Both are streamed row by row and written in batched
+transactions, so a 100k-row file is never held in memory:
+
+    python bank_tool.py import questions.csv --exam 12th --subject Accountancy
+    python bank_tool.py export upsc.jsonl --exam upsc
+
+The owner can also send such a file to the bot in a private chat (caption: `[exam] [subject]` for rows
+without them) and get an export with /export [12th|upsc] [subject].
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import bank
+import profiler
+import quality
+
+logger = logging.getLogger(__name__)
+
+# Rows written per transaction; the bank is free for quizzes between batches
+IMPORT_BATCH_SIZE = 2000
+# Telegram polls in group quizzes always have four options
+POLL_OPTIONS = 4
+# Rejected rows listed individually in an import report
+REPORTED_ERRORS = 10
+# Bots can download files up to 20 MB
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+CSV_FIELDS = ("exam", "subject", "question", "option_a", "option_b", "option_c", "option_d", "correct_answer", "explanation")
+EXAMS = ('12th', 'upsc')
+
+_subjects = None
+
+def _key(name: str) -> str:
+    """Subject names compared without case, spaces or punctuation ("Science & Tech" is "Science_Tech")."""
+    return "".join(char for char in name.lower() if char.isalnum())
+
+def _known_subjects() -> dict:
+    """exam -> {subject key: subject name as the menus use it}."""
+    global _subjects
+    if _subjects is None:
+        from personal import quiz_topics
+        from upsc import upsc_subjects
+        _subjects = {exam: {_key(subject): subject for subject in subjects}
+                     for exam, subjects in (('12th', quiz_topics), ('upsc', upsc_subjects))}
+    return _subjects
+
+def canonical_subject(exam: str, name: str):
+    """The menu name of a subject of `exam` written in any case or spacing, or None if there is no such subject."""
+    return _known_subjects()[exam].get(_key(name or ""))
+
+def _answer_index(value):
+    """A 0-based option index from an int, a digit string or a letter A-D; None if it is neither."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        if len(value) == 1 and value.upper() in "ABCD":
+            return "ABCD".index(value.upper())
+    return None
+
+def _read_csv(f):
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, {
+            'exam': row.get('exam'),
+            'subject': row.get('subject'),
+            'question': (row.get('question') or "").strip(),
+            'options': [(row.get(f"option_{letter}") or "").strip() for letter in "abcd"],
+            'correct_answer': row.get('correct_answer'),
+            'explanation': (row.get('explanation') or "").strip(),
+        }
+
+def _read_jsonl(f):
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError:
+            yield line_number, None
+
+def read_rows(f, csv_format: bool):
+    """(line number, raw question dict or None if unreadable) for each row of an open file."""
+    return _read_csv(f) if csv_format else _read_jsonl(f)
+
+def validate(row, exam: str = None, subject: str = None) -> tuple:
+    """Check one imported row against what a group quiz poll needs.
+
+    Returns (exam, subject, question) ready for the bank, or (None, None, reason)."""
+    if not isinstance(row, dict):
+        return None, None, "malformed"
+    exam = row.get('exam') or exam or ""
+    subject = row.get('subject') or subject
+    if not isinstance(exam, str) or not isinstance(subject, (str, type(None))):
+        return None, None, "malformed"
+    exam = exam.strip().lower()
+    if exam not in EXAMS:
+        return None, None, "unknown_exam"
+    subject = canonical_subject(exam, subject)
+    if subject is None:
+        return None, None, "unknown_subject"
+    question = {
+        'question': row.get('question'),
+        'options': row.get('options'),
+        'correct_answer': _answer_index(row.get('correct_answer')),
+        'explanation': row.get('explanation') or "",
+    }
+    if isinstance(question['options'], list) and len(question['options']) != POLL_OPTIONS:
+        return None, None, "not_four_options"
+    reason = quality.question_problem(question)
+    if reason is not None:
+        return None, None, reason
+    return exam, subject, question
+
+def import_file(path: str, exam: str = None, subject: str = None, source: str = 'import') -> dict:
+    """Validate and bank every row of a CSV or JSONL file; `exam`/`subject` fill in rows without them.
+
+    Duplicates (of the bank or earlier rows) are skipped by fingerprint. Returns a report dict."""
+    report = {'rows': 0, 'added': 0, 'duplicates': 0, 'rejected': Counter(), 'errors': [], 'seconds': 0.0}
+    started = time.perf_counter()
+    batch = []
+
+    def write_batch():
+        added = bank.add_batch(batch, source)
+        report['added'] += added
+        report['duplicates'] += len(batch) - added
+        batch.clear()
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line_number, row in read_rows(f, path.lower().endswith('.csv')):
+            report['rows'] += 1
+            row_exam, row_subject, question = validate(row, exam, subject)
+            if row_exam is None:
+                report['rejected'][question] += 1
+                if len(report['errors']) < REPORTED_ERRORS:
+                    report['errors'].append((line_number, question))
+                continue
+            batch.append((row_exam, row_subject, question))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                write_batch()
+    write_batch()
+    report['seconds'] = time.perf_counter() - started
+    logger.info(f"Imported {path}: {report['added']} added, {report['duplicates']} duplicates, "
+                f"{sum(report['rejected'].values())} rejected of {report['rows']} rows")
+    return report
+
+def format_import_report(report: dict) -> str:
+    lines = [
+        f"Rows: {report['rows']} in {report['seconds']:.1f}s",
+        f"Added: {report['added']}",
+        f"Already in the bank: {report['duplicates']}",
+        f"Rejected: {sum(report['rejected'].values())}",
+    ]
+    for reason, number in report['rejected'].most_common():
+        lines.append(f"  {reason}: {number}")
+    for line_number, reason in report['errors']:
+        lines.append(f"  line {line_number}: {reason}")
+    return "\n".join(lines)
+
+def export_file(path: str, exam: str = None, subject: str = None) -> int:
+    """Write the bank (or one exam/subject) to a CSV or JSONL file that import_file reads back; returns the count."""
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            for question in bank.iter_questions(exam, subject):
+                options = (question['options'] + [""] * POLL_OPTIONS)[:POLL_OPTIONS]
+                answer = "ABCD"[question['correct_answer']] if question['correct_answer'] < POLL_OPTIONS else ""
+                writer.writerow([question['exam'], question['subject'], question['question'], *options, answer,
+                                 question['explanation']])
+                written += 1
+        else:
+            for question in bank.iter_questions(exam, subject):
+                del question['id']
+                f.write(json.dumps(question, ensure_ascii=False) + "\n")
+                written += 1
+    return written
+
+def _is_owner(update: Update) -> bool:
+    return profiler.OWNER_ID is not None and update.effective_user.id == profiler.OWNER_ID
+
+def _exam_and_subject(words: list) -> tuple:
+    """`[exam] [subject words]` from a caption or command arguments."""
+    exam = None
+    if words and words[0].lower() in EXAMS:
+        exam, words = words[0].lower(), words[1:]
+    return exam, " ".join(words) or None
+
+async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """A CSV/JSONL file sent by the owner in a private chat is imported into the bank."""
+    if not _is_owner(update):
+        # Stay silent so the feature is not discoverable
+        return
+    document = update.message.document
+    name = document.file_name or ""
+    if not name.lower().endswith(('.csv', '.jsonl')):
+        await update.message.reply_text("📄 Send questions as a .csv or .jsonl file.")
+        return
+    if document.file_size and document.file_size > MAX_UPLOAD_BYTES:
+        await update.message.reply_text("❌ Files over 20 MB cannot be downloaded by bots; use `python bank_tool.py import` on the server.",
+                                        parse_mode='Markdown')
+        return
+    exam, subject = _exam_and_subject((update.message.caption or "").split())
+    await update.message.reply_text(f"⏳ Importing {name}...")
+    directory = tempfile.mkdtemp(prefix="quizbot-import-")
+    path = os.path.join(directory, "upload.csv" if name.lower().endswith('.csv') else "upload.jsonl")
+    try:
+        telegram_file = await context.bot.get_file(document.file_id)
+        await telegram_file.download_to_drive(path)
+        # Off the event loop; quizzes keep using the bank between batches
+        report = await asyncio.to_thread(import_file, path, exam, subject, 'upload')
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        logger.error(f"Import of {name} failed: {e}")
+        await update.message.reply_text(f"❌ Import failed: {e}")
+        return
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rmdir(directory)
+    await update.message.reply_text(f"📥 *Import finished*\n\n```\n{format_import_report(report)}\n```", parse_mode='Markdown')
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [12th|upsc] [subject] - owner only, the bank as a JSONL document."""
+    if not _is_owner(update):
+        return
+    exam, subject = _exam_and_subject(context.args or [])
+    if subject and exam:
+        subject = canonical_subject(exam, subject) or subject
+    name = "questions" + "".join(f"-{part}" for part in (exam, subject) if part) + ".jsonl"
+    directory = tempfile.mkdtemp(prefix="quizbot-export-")
+    path = os.path.join(directory, name)
+    try:
+        written = await asyncio.to_thread(export_file, path, exam, subject)
+        if not written:
+            await update.message.reply_text("📭 No matching questions in the bank.")
+            return
+        with open(path, 'rb') as f:
+            await update.message.reply_document(document=f, filename=name.replace(" ", "_"),
+                                                caption=f"📤 {written} questions")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rmdir(directory)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export the question bank as CSV or JSON Lines")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="Add the valid, new questions of a file to the bank")
+    importer.add_argument("path", help="A .csv or .jsonl file")
+    importer.add_argument("--exam", choices=EXAMS, help="Exam of rows without an exam column")
+    importer.add_argument("--subject", help="Subject of rows without a subject column")
+    exporter = commands.add_parser("export", help="Write banked questions to a file (.csv or .jsonl)")
+    exporter.add_argument("path")
+    exporter.add_argument("--exam", choices=EXAMS)
+    exporter.add_argument("--subject")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        if args.command == "import":
+            report = import_file(args.path, args.exam, args.subject)
+            print(format_import_report(report))
+            return 0 if report['added'] or report['duplicates'] else 1
+        print(f"Exported {export_file(args.path, args.exam, args.subject)} questions to {args.path}")
+        return 0
+    finally:
+        bank.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
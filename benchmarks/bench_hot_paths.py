@@ -0,0 +1,321 @@
+# benchmarks/bench_hot_paths.py
+"""Microbenchmarks of the bot's hot paths, compared against stored baselines.
+
+Run: python benchmarks/bench_hot_paths.py [--threshold 0.3] [--only poll_answer] [--update-baselines]
+
+Handlers run for real against fakebot's in-process Bot API (no network, no token), so
+Bot API calls cost their PTB serialisation but no latency. Each result is the time per
+operation in the fastest of several rounds; the run fails when any result is slower than
+its baseline by more than the threshold. Baselines are machine specific - refresh them
+with --update-baselines on the machine that runs the comparison.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stay offline and keep the event log out of the working tree
+os.environ.pop("LOG_CHANNEL_ID", None)
+os.environ.pop("PERPLEXITY_API_KEY", None)
+os.environ.setdefault("EVENT_LOG_DIR", tempfile.mkdtemp(prefix="quizbot-bench-"))
+os.environ.setdefault("QUESTION_BANK_PATH", os.path.join(os.environ["EVENT_LOG_DIR"], "questions.db"))
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+import bank
+import group
+import main
+import mastery
+import perplexity
+import quality
+from fakebot import BOT_USER, FakeBotAPI, FakeBotRequest
+
+# main configures INFO logging on import; keep the results table readable
+logging.getLogger().setLevel(logging.WARNING)
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+CHAT_ID = -1001234
+ADMIN_ID = 4242
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}"}
+
+def _chat() -> dict:
+    return {'id': CHAT_ID, 'type': 'supergroup', 'title': "Bench Group"}
+
+def _update(application, data: dict):
+    update = Update.de_json(data, application.bot)
+    return update, CallbackContext.from_update(update, application)
+
+def button_update(application, data: str, update_id: int = 1):
+    message = {'message_id': 1, 'date': 0, 'chat': _chat(), 'from': BOT_USER, 'text': "Menu"}
+    return _update(application, {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'chat_instance': "bench", 'from': _user(ADMIN_ID), 'message': message, 'data': data}})
+
+def command_update(application, text: str, update_id: int = 1):
+    return _update(application, {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': _chat(), 'from': _user(ADMIN_ID), 'text': text,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]}})
+
+def realistic_response(questions: int = 20) -> str:
+    """A ~4000-token model reply: prose around a pretty-printed JSON array."""
+    items = []
+    for i in range(questions):
+        items.append({
+            'question': f"Q{i + 1}. Under the Companies Act, which statement about the treatment of "
+                        f"securities premium in scenario {i + 1} is correct when shares are issued at a premium?",
+            'options': [f"Option {n}: it is credited to a reserve that may be used for specified purposes only, case {i}"
+                        for n in range(4)],
+            'correct_answer': i % 4,
+            'explanation': "Securities premium must be credited to the Securities Premium Account and can only "
+                           "be applied for purposes listed in Section 52, such as issuing fully paid bonus shares, "
+                           "writing off preliminary expenses or commission, and buying back shares.",
+        })
+    return ("Sure! Here is a 20-question quiz based on the topic you asked for. Each question has four "
+            "options and an explanation.\n\n```json\n" + json.dumps(items, indent=2) +
+            "\n```\n\nLet me know if you would like the difficulty adjusted or more questions.")
+
+async def _best_per_op(func, ops: int, rounds: int) -> float:
+    """Seconds per operation of `await func(i)` in the fastest of `rounds` rounds of `ops` calls
+    (the fastest round is the least disturbed by the rest of the machine)."""
+    results = []
+    for _ in range(rounds):
+        # Like timeit: no collector pauses inside the timed region
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for i in range(ops):
+                await func(i)
+            results.append((time.perf_counter() - started) / ops)
+        finally:
+            gc.enable()
+    return min(results)
+
+def _start_quiz_state(questions: int = 20):
+    group.group_quizzes[CHAT_ID] = {
+        'exam_type': '12th Board', 'subject': "Economics", 'current_question': 0, 'active': True,
+        'questions': [{'question': "q", 'options': ["a", "b", "c", "d"], 'correct_answer': 1, 'explanation': ""}] * questions,
+        'poll_ids': [], 'started_by': ADMIN_ID, 'group_name': "Bench Group",
+    }
+
+async def bench_poll_answer(application):
+    _start_quiz_state()
+    group.user_scores[CHAT_ID] = {}
+    group.poll_answers["bench-poll"] = {'chat_id': CHAT_ID, 'question_index': 0, 'correct': False, 'explanation': ''}
+    prepared = [
+        _update(application, {'update_id': i, 'poll_answer': {'poll_id': "bench-poll", 'user': _user(10_000 + i % 500),
+                                                              'option_ids': [i % 4]}})
+        for i in range(2000)
+    ]
+
+    async def answer(i):
+        update, context = prepared[i]
+        await group.handle_poll_answer(update, context)
+
+    try:
+        return await _best_per_op(answer, len(prepared), 20)
+    finally:
+        group.poll_answers.pop("bench-poll", None)
+        group.group_quizzes.pop(CHAT_ID, None)
+        group.user_scores.pop(CHAT_ID, None)
+
+def bench_leaderboard(participants: int, rounds: int):
+    async def bench(application):
+        group.user_scores[CHAT_ID] = {10_000 + i: i % 20 for i in range(participants)}
+        _, context = command_update(application, "/stop")
+
+        async def render(i):
+            await group.send_leaderboard(context, CHAT_ID, "Bench Group")
+
+        try:
+            return await _best_per_op(render, 1, rounds)
+        finally:
+            group.user_scores.pop(CHAT_ID, None)
+    return bench
+
+async def bench_extract_questions(application):
+    content = realistic_response()
+
+    async def extract(i):
+        questions = perplexity.extract_questions(content)
+        assert len(questions) == 20
+
+    return await _best_per_op(extract, 200, 10)
+
+async def bench_quality_batch(application):
+    """A 20-question batch through the process pool. The first poll goes out a second after the
+    quiz starts, so this has to stay far below 1 s."""
+    batch = perplexity.extract_questions(realistic_response())
+
+    async def check(i):
+        await quality.check(batch)
+
+    return await _best_per_op(check, 20, 5)
+
+async def bench_quality_inline(application):
+    """The same checks run directly: the CPU time kept off the event loop."""
+    batch = perplexity.extract_questions(realistic_response())
+
+    async def check(i):
+        quality.check_batch(batch)
+
+    return await _best_per_op(check, 20, 5)
+
+LOAD_WORDS = ("partnership", "goodwill", "depreciation", "inflation", "monsoon", "constitution", "parliament",
+              "tariff", "dividend", "equity", "plateau", "glacier", "census", "budget", "treaty", "audit")
+
+def _seed_load_bank(user_id: int, now: float):
+    """60k banked questions in one subject, 50k of them answered by `user_id`."""
+    if bank.count('bench', "Load"):
+        return
+    bank.add_questions('bench', "Load", [
+        {'question': f"Load question {i} on {LOAD_WORDS[i % 16]} and {LOAD_WORDS[i * 7 % 13]}",
+         'options': ["a", "b", "c", "d"], 'correct_answer': i % 4}
+        for i in range(60_000)], 'bench')
+    with bank.db_lock, mastery._db() as db:
+        ids = [row[0] for row in db.execute("SELECT id FROM questions WHERE exam = 'bench' ORDER BY id LIMIT 50000")]
+        db.executemany(
+            "INSERT OR IGNORE INTO progress (user_id, question_id, exam, subject, box, attempts, correct, last_seen, due) "
+            "VALUES (?, ?, 'bench', 'Load', ?, 1, 1, ?, ?)",
+            [(user_id, question_id, i % 6, now - 86400, now + (i % 200 - 100) * 3600) for i, question_id in enumerate(ids)])
+        db.execute("INSERT OR REPLACE INTO new_cursor VALUES (?, 'bench', 'Load', ?)", (user_id, ids[-1]))
+
+async def bench_mastery_select(application):
+    """Choosing 20 questions for a user with 50k answered items in a 60k-question subject."""
+    user_id, now = 555, time.time()
+    _seed_load_bank(user_id, now)
+
+    async def select(i):
+        assert len(mastery.select_questions(user_id, 'bench', "Load", 20, now)) == 20
+
+    return await _best_per_op(select, 200, 5)
+
+async def bench_bank_search(application):
+    """/quiz <keywords> lookup: the top 20 of ~300 keyword matches among 60k banked questions."""
+    _seed_load_bank(555, time.time())
+
+    async def search(i):
+        assert len(bank.search("partnership audit", 'bench')) == 20
+
+    return await _best_per_op(search, 100, 5)
+
+async def bench_button_dispatch(application):
+    # Menu buttons that need no quiz state, plus the fallback branch
+    buttons = ('main_help', 'main_status', 'main_add_group', 'main_back', 'unknown_action')
+    prepared = [button_update(application, data, i) for i, data in enumerate(buttons * 100)]
+
+    async def press(i):
+        update, context = prepared[i]
+        await main.button_handler(update, context)
+
+    try:
+        return await _best_per_op(press, len(prepared), 5)
+    finally:
+        # Let the concurrent answer_callback_query tasks finish
+        await asyncio.sleep(0.05)
+
+async def bench_session_lifecycle(application):
+    """Subject selection (fallback questions, job scheduled) followed by /stop."""
+    async def lifecycle(i):
+        update, context = button_update(application, "group_subject_Economics", i)
+        await group.handle_group_subject_selection(update, context, "Economics")
+        update, context = command_update(application, "/stop", i)
+        await group.stop_command(update, context)
+
+    return await _best_per_op(lifecycle, 50, 5)
+
+BENCHMARKS = {
+    'poll_answer': bench_poll_answer,
+    'leaderboard_10': bench_leaderboard(10, 20),
+    'leaderboard_1k': bench_leaderboard(1_000, 5),
+    'leaderboard_10k': bench_leaderboard(10_000, 3),
+    'extract_questions': bench_extract_questions,
+    'quality_batch': bench_quality_batch,
+    'quality_inline': bench_quality_inline,
+    'mastery_select_50k': bench_mastery_select,
+    'bank_search': bench_bank_search,
+    'button_dispatch': bench_button_dispatch,
+    'session_lifecycle': bench_session_lifecycle,
+}
+
+async def run(names, repeat: int) -> dict:
+    api = FakeBotAPI()
+    application = main.build_application("123456:BENCH", request=FakeBotRequest(api))
+    await application.initialize()
+    await application.start()
+    api.note_user(CHAT_ID, ADMIN_ID)
+    quality.start()
+    results = {}
+    try:
+        for _ in range(repeat):
+            for name in names:
+                result = await BENCHMARKS[name](application)
+                results[name] = min(result, results.get(name, result))
+    finally:
+        quality.shutdown()
+        await application.stop()
+        await application.shutdown()
+    return results
+
+def load_baselines() -> dict:
+    try:
+        with open(BASELINES_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threshold", type=float, default=0.3, help="allowed slowdown vs baseline (0.3 = 30%%)")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="run the suite this many times and keep the best")
+    parser.add_argument("--update-baselines", action="store_true", help="store these results as the new baselines")
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    results = asyncio.run(run(names, args.repeat))
+    baselines = load_baselines()
+    regressions = []
+    print(f"{'benchmark':<20}{'per op':>12}{'baseline':>12}{'change':>10}")
+    for name in names:
+        current = results[name]
+        baseline = baselines.get(name)
+        if baseline:
+            change = current / baseline - 1
+            flag = "  REGRESSION" if change > args.threshold else ""
+            if flag:
+                regressions.append(name)
+            print(f"{name:<20}{format_time(current):>12}{format_time(baseline):>12}{change:>+10.0%}{flag}")
+        else:
+            print(f"{name:<20}{format_time(current):>12}{'-':>12}{'':>10}")
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baselines written to {BASELINES_PATH}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} regression(s) past {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
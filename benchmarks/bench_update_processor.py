@@ -0,0 +1,107 @@
+# benchmarks/bench_update_processor.py
+"""Handler latency under a mixed multi-group load: PTB's sequential processing vs ChatUpdateProcessor.
+
+Run: python benchmarks/bench_update_processor.py [--groups 50] [--seconds 10] [--rate 200]
+
+Each group sends poll answers (fast), menu clicks (one Bot API round trip) and, rarely,
+a subject selection that waits on question generation. Latency is measured from the
+update's arrival to the end of its handler; per-chat ordering is checked on the way.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import SimpleUpdateProcessor
+
+import group
+from processor import ChatUpdateProcessor
+
+# Simulated handler costs in seconds
+HANDLER_COST = {'poll_answer': 0.002, 'callback': 0.08, 'subject_selection': 3.0}
+MIX = (('poll_answer', 0.85), ('callback', 0.14), ('subject_selection', 0.01))
+
+def make_update(update_id: int, kind: str, chat_id: int, user_id: int):
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"U{user_id}"}
+    if kind == 'poll_answer':
+        poll_id = f"poll-{chat_id}"
+        group.poll_answers[poll_id] = {'chat_id': chat_id, 'question_index': 0, 'correct': False, 'explanation': ''}
+        data = {'update_id': update_id, 'poll_answer': {'poll_id': poll_id, 'user': user, 'option_ids': [0]}}
+    else:
+        message = {'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'supergroup', 'title': 'G'}}
+        data = {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': str(chat_id), 'data': kind, 'message': message}}
+    return Update.de_json(data, None)
+
+def build_workload(groups: int, seconds: float, rate: float, seed: int = 7):
+    rng = random.Random(seed)
+    kinds, weights = zip(*MIX)
+    workload, at = [], 0.0
+    for update_id in range(int(seconds * rate)):
+        at += rng.expovariate(rate)
+        chat_id = -1000 - rng.randrange(groups)
+        kind = rng.choices(kinds, weights)[0]
+        workload.append((at, kind, chat_id, make_update(update_id, kind, chat_id, rng.randrange(10_000))))
+    return workload
+
+async def run(processor, workload):
+    latencies = {kind: [] for kind in HANDLER_COST}
+    last_seen = {}
+    order_violations = 0
+
+    async def handler(arrived, kind, chat_id, update_id):
+        nonlocal order_violations
+        if last_seen.get(chat_id, -1) > update_id:
+            order_violations += 1
+        last_seen[chat_id] = update_id
+        await asyncio.sleep(HANDLER_COST[kind])
+        latencies[kind].append(time.perf_counter() - arrived)
+
+    await processor.initialize()
+    started = time.perf_counter()
+    tasks = []
+    # Feed updates the way Application's fetcher does: one task per update, in arrival order
+    for at, kind, chat_id, update in workload:
+        delay = started + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        arrived = time.perf_counter()
+        coroutine = handler(arrived, kind, chat_id, update.update_id)
+        tasks.append(asyncio.create_task(processor.process_update(update, coroutine)))
+    await asyncio.gather(*tasks)
+    await processor.shutdown()
+    return latencies, order_violations
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+def report(name, latencies, violations):
+    print(f"\n{name}  (per-chat order violations: {violations})")
+    print(f"  {'handler':<18}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, values in latencies.items():
+        print(f"  {kind:<18}{len(values):>7}{percentile(values, 50) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}{max(values, default=0) * 1000:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rate", type=float, default=200, help="updates per second across all groups")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    workload = build_workload(args.groups, args.seconds, args.rate)
+    print(f"{len(workload)} updates from {args.groups} groups over {args.seconds:.0f}s")
+    # The sequential run cannot keep up with slow handlers, so it gets a shorter slice of the same load
+    sequential_slice = [item for item in workload if item[0] <= min(args.seconds, 3)]
+    report("sequential (PTB default)", *asyncio.run(run(SimpleUpdateProcessor(1), sequential_slice)))
+    report(f"ChatUpdateProcessor({args.concurrency})", *asyncio.run(run(ChatUpdateProcessor(args.concurrency), workload)))
+
+if __name__ == '__main__':
+    main()
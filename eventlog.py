@@ -0,0 +1,218 @@
+# eventlog.py
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Local audit log - every log.* event is written here as one JSON line
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR", "logs")
+EVENT_LOG_MAX_BYTES = int(os.environ.get("EVENT_LOG_MAX_BYTES", 10 * 1024 * 1024))
+EVENT_LOG_ROTATE_SECONDS = int(os.environ.get("EVENT_LOG_ROTATE_SECONDS", 24 * 60 * 60))
+EVENT_LOG_COMPRESS = os.environ.get("EVENT_LOG_COMPRESS", "1") == "1"
+
+CURRENT_FILE = "events.jsonl"
+# When the current file was started, for time-based rotation (its mtime is the last write)
+OPENED_FILE = "events.opened"
+ROTATED_PREFIX = "events-"
+ROTATED_TIME_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+class EventLogWriter:
+    """Buffered JSONL writer running on its own thread with size/time based rotation."""
+
+    def __init__(self, directory=EVENT_LOG_DIR, max_bytes=EVENT_LOG_MAX_BYTES,
+                 rotate_seconds=EVENT_LOG_ROTATE_SECONDS, compress=EVENT_LOG_COMPRESS,
+                 flush_interval=1.0, batch_size=500, queue_size=10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._file = None
+        self._opened_at = 0.0
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, CURRENT_FILE)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="eventlog-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record: dict):
+        """Hand a record to the writer thread without blocking the caller."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        opened_path = os.path.join(self.directory, OPENED_FILE)
+        if self._file.tell():
+            # An existing file keeps its original age for time-based rotation
+            try:
+                with open(opened_path, encoding="utf-8") as f:
+                    self._opened_at = float(f.read())
+                return
+            except (OSError, ValueError):
+                # Written before the open time was kept: its last write is the best guess left
+                self._opened_at = os.path.getmtime(self.path)
+                return
+        self._opened_at = time.time()
+        with open(opened_path, "w", encoding="utf-8") as f:
+            f.write(repr(self._opened_at))
+
+    def _run(self):
+        self._open()
+        buffer = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = False
+            if record:
+                buffer.append(json.dumps(record, ensure_ascii=False, default=str))
+            if record is None or len(buffer) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(buffer)
+                buffer = []
+                deadline = time.monotonic() + self.flush_interval
+            if record is None:
+                self._file.close()
+                return
+
+    def _flush(self, lines: list):
+        try:
+            if lines:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+                self.written += len(lines)
+            if self._should_rotate():
+                self._rotate()
+        except OSError as e:
+            logger.error(f"Error writing event log: {e}")
+
+    def _should_rotate(self):
+        if not self._file.tell():
+            return False
+        return self._file.tell() >= self.max_bytes or time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        self._file.close()
+        rotated = os.path.join(self.directory, f"{ROTATED_PREFIX}{datetime.now().strftime(ROTATED_TIME_FORMAT)}.jsonl")
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self._open()
+
+_writer = None
+
+def record(event: dict):
+    """Write a structured event to the local event log, starting the writer on first use."""
+    global _writer
+    try:
+        if _writer is None:
+            _writer = EventLogWriter()
+            _writer.start()
+        entry = {'ts': time.time()}
+        entry.update(event)
+        _writer.write(entry)
+    except Exception as e:
+        logger.error(f"Error recording event: {e}")
+
+def stop_event_log():
+    """Flush and close the event log."""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+def _log_files(directory: str, since: float = None):
+    """Event log files oldest first; rotated files ending before `since` are skipped."""
+    files = []
+    for path in sorted(glob.glob(os.path.join(directory, f"{ROTATED_PREFIX}*.jsonl*"))):
+        stamp = os.path.basename(path)[len(ROTATED_PREFIX):].split(".")[0]
+        try:
+            rotated_at = datetime.strptime(stamp, ROTATED_TIME_FORMAT).timestamp()
+        except ValueError:
+            continue
+        if since is None or rotated_at >= since:
+            files.append(path)
+    current = os.path.join(directory, CURRENT_FILE)
+    if os.path.exists(current):
+        files.append(current)
+    return files
+
+def iter_events(directory: str = EVENT_LOG_DIR, chat_id: int = None, user_id: int = None,
+                event_type: str = None, since: float = None, until: float = None):
+    """Stream matching events from the event log files without loading them into memory."""
+    for path in _log_files(directory, since):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if chat_id is not None and event.get('chat_id') != chat_id:
+                    continue
+                if user_id is not None and event.get('user_id') != user_id:
+                    continue
+                if event_type is not None and event_type not in (event.get('event'), event.get('type')):
+                    continue
+                if since is not None and event.get('ts', 0) < since:
+                    continue
+                if until is not None and event.get('ts', 0) > until:
+                    continue
+                yield event
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+def main(argv=None):
+    """Query the event log: python eventlog.py --chat -100123 --type quiz_started --since 2024-01-01"""
+    parser = argparse.ArgumentParser(description="Filter the local JSONL event log")
+    parser.add_argument("--dir", default=EVENT_LOG_DIR, help="event log directory")
+    parser.add_argument("--chat", type=int, help="chat/group id")
+    parser.add_argument("--user", type=int, help="user id")
+    parser.add_argument("--type", dest="event_type", help="event name, e.g. quiz_started or ERROR")
+    parser.add_argument("--since", type=_parse_time, help="ISO time, e.g. 2024-05-01T20:00")
+    parser.add_argument("--until", type=_parse_time, help="ISO time")
+    parser.add_argument("--count", action="store_true", help="only print the number of matches")
+    args = parser.parse_args(argv)
+
+    matches = 0
+    for event in iter_events(args.dir, args.chat, args.user, args.event_type, args.since, args.until):
+        matches += 1
+        if not args.count:
+            sys.stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+    if args.count:
+        print(matches)
+
+if __name__ == '__main__':
+    main()
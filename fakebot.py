@@ -0,0 +1,417 @@
+# fakebot.py
+"""Local stand-ins for the Telegram Bot API and the Perplexity API.
+
+Used in-process by replay.py (FakeBotRequest) and over HTTP by simulate.py, or on its own:
+
+    python fakebot.py --port 8081 --latency 0.05 --error-rate 0.01 --retry-after-rate 0.01
+
+and start the bot with TELEGRAM_API_URL=http://127.0.0.1:8081/bot and
+PERPLEXITY_API_URL=http://127.0.0.1:8081/perplexity/chat/completions.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+
+import httpx
+import tornado.netutil
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram.request import BaseRequest
+
+import instrument
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': "Quiz Bot", 'username': "quiz_test_bot",
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+ADMIN_RIGHTS = dict.fromkeys((
+    'can_be_edited', 'is_anonymous', 'can_manage_chat', 'can_delete_messages', 'can_manage_video_chats',
+    'can_restrict_members', 'can_promote_members', 'can_change_info', 'can_invite_users',
+    'can_post_stories', 'can_edit_stories', 'can_delete_stories'), False)
+
+# Methods that never get injected errors (start-up would fail before anything is measured)
+NO_INJECTION_METHODS = ('getMe', 'getUpdates', 'setWebhook', 'deleteWebhook')
+
+def _user(user_id: int) -> dict:
+    if user_id == BOT_USER['id']:
+        return BOT_USER
+    return {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}"}
+
+def _chat(chat_id) -> dict:
+    chat_id = int(chat_id)
+    if chat_id < 0:
+        return {'id': chat_id, 'type': 'supergroup', 'title': f"Group {chat_id}"}
+    return {'id': chat_id, 'type': 'private', 'first_name': f"User {chat_id}"}
+
+class FakeBotAPI:
+    """In-memory stand-in for the Bot API methods the bot uses.
+
+    `latency` is seconds per call (a number, or a dict of method -> seconds with an
+    optional 'default'). `error_rate` and `retry_after_rate` are the fractions of calls
+    answered with a 500 error or a 429 "retry after `retry_after` seconds". With
+    `everyone_admin` every user seen in a chat is reported as an admin so the admin-only
+    paths run during replays and simulations."""
+
+    def __init__(self, latency=0.0, everyone_admin: bool = True, error_rate: float = 0.0,
+                 retry_after_rate: float = 0.0, retry_after: int = 1, seed: int = None):
+        self.latency = latency
+        self.everyone_admin = everyone_admin
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.injected = Counter()
+        self.chat_users = {}
+        self.last_poll = {}
+        self.pending_updates = []
+        self.webhook = None
+        # Callables (chat_id, poll dict) told about every poll sent
+        self.poll_listeners = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self._poll_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+
+    def note_user(self, chat_id: int, user_id: int):
+        """Remember that a user is in a chat (used for admin lists)."""
+        self.chat_users.setdefault(chat_id, set()).add(user_id)
+
+    def push_update(self, data: dict) -> int:
+        """Queue an update for getUpdates or webhook delivery; returns its update_id."""
+        with self._lock:
+            data.setdefault('update_id', next(self._update_ids))
+            self.pending_updates.append(data)
+        for key in ('message', 'callback_query'):
+            if key in data:
+                sender = data[key]['from']['id']
+                message = data[key] if key == 'message' else data[key].get('message') or {}
+                if 'chat' in message:
+                    self.note_user(message['chat']['id'], sender)
+        return data['update_id']
+
+    def take_updates(self, offset: int = None, limit: int = 100) -> list:
+        """Updates from `offset` on; earlier ones are confirmed and forgotten (getUpdates semantics)."""
+        with self._lock:
+            if offset:
+                self.pending_updates = [u for u in self.pending_updates if u['update_id'] >= offset]
+            return self.pending_updates[:limit]
+
+    def _delay(self, method: str) -> float:
+        if isinstance(self.latency, dict):
+            return self.latency.get(method, self.latency.get('default', 0.0))
+        return self.latency
+
+    def _message(self, chat_id, **extra) -> dict:
+        message = {'message_id': next(self._message_ids), 'date': int(time.time()),
+                   'chat': _chat(chat_id), 'from': BOT_USER}
+        message.update(extra)
+        return message
+
+    def _member(self, chat_id: int, user_id: int) -> dict:
+        if user_id == BOT_USER['id'] or (self.everyone_admin and user_id in self.chat_users.get(chat_id, ())):
+            return dict(ADMIN_RIGHTS, status='administrator', user=_user(user_id))
+        return {'status': 'member', 'user': _user(user_id)}
+
+    def result(self, method: str, params: dict):
+        """Result object for a method call, or raise KeyError for unknown methods."""
+        chat_id = params.get('chat_id')
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'sendMessage':
+            return self._message(chat_id, text=params.get('text', ''))
+        if method == 'editMessageText':
+            return self._message(chat_id or 0, text=params.get('text', '')) if chat_id else True
+        if method == 'sendPoll':
+            options = [option['text'] if isinstance(option, dict) else option for option in params.get('options', [])]
+            poll = {
+                'id': str(next(self._poll_ids)), 'question': params.get('question', ''),
+                'options': [{'text': text, 'voter_count': 0} for text in options],
+                'total_voter_count': 0, 'is_closed': False, 'is_anonymous': params.get('is_anonymous', True),
+                'type': params.get('type', 'regular'), 'allows_multiple_answers': False,
+                'correct_option_id': params.get('correct_option_id'),
+                'open_period': params.get('open_period'),
+            }
+            self.last_poll[int(chat_id)] = poll['id']
+            for listener in self.poll_listeners:
+                listener(int(chat_id), poll)
+            return self._message(chat_id, poll=poll)
+        if method == 'getChatMember':
+            return self._member(int(chat_id), int(params['user_id']))
+        if method == 'getChatAdministrators':
+            admins = {BOT_USER['id']} | (self.chat_users.get(int(chat_id), set()) if self.everyone_admin else set())
+            return [self._member(int(chat_id), user_id) for user_id in sorted(admins)]
+        if method == 'getUpdates':
+            return self.take_updates(params.get('offset'), params.get('limit') or 100)
+        if method == 'setWebhook':
+            self.webhook = {'url': params['url'], 'secret_token': params.get('secret_token')}
+            return True
+        if method == 'deleteWebhook':
+            self.webhook = None
+            return True
+        if method in ('answerCallbackQuery', 'sendChatAction', 'setMyCommands', 'close', 'logOut', 'stopPoll'):
+            return True
+        raise KeyError(method)
+
+    def _injected_error(self, method: str):
+        if method in NO_INJECTION_METHODS:
+            return None
+        roll = self._random.random()
+        if roll < self.retry_after_rate:
+            self.injected['retry_after'] += 1
+            return 429, {'ok': False, 'error_code': 429, 'description': f"Too Many Requests: retry after {self.retry_after}",
+                         'parameters': {'retry_after': self.retry_after}}
+        if roll < self.retry_after_rate + self.error_rate:
+            self.injected['error'] += 1
+            return 500, {'ok': False, 'error_code': 500, 'description': "Internal Server Error"}
+        return None
+
+    async def call(self, method: str, params: dict):
+        """Serve one Bot API call; returns (HTTP status, response body dict)."""
+        self.calls[method] += 1
+        delay = self._delay(method)
+        if delay:
+            await asyncio.sleep(delay)
+        injected = self._injected_error(method)
+        if injected:
+            return injected
+        try:
+            return 200, {'ok': True, 'result': self.result(method, params)}
+        except KeyError:
+            return 404, {'ok': False, 'error_code': 404, 'description': f"Not Found: method {method} not faked"}
+
+class FakeBotRequest(BaseRequest):
+    """PTB request backend that answers from a FakeBotAPI instead of the network."""
+
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        started = time.perf_counter()
+        status, body = await self.api.call(api_method, params)
+        instrument.add_time('api', time.perf_counter() - started, api_method)
+        return status, json.dumps(body).encode()
+
+def _decode_value(value: str):
+    # PTB sends non-string parameters JSON encoded
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+class BotMethodHandler(tornado.web.RequestHandler):
+    """POST/GET /bot<token>/<method> answered from the FakeBotAPI."""
+
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self, method):
+        if self.request.headers.get("Content-Type", "").startswith("application/json") and self.request.body:
+            params = json.loads(self.request.body)
+        else:
+            params = {key: _decode_value(values[-1].decode()) for key, values in self.request.arguments.items()}
+        if method == 'getUpdates' and params.get('timeout'):
+            # Long polling: hold the request until an update arrives or the timeout passes
+            deadline = time.monotonic() + float(params['timeout'])
+            while not self.api.take_updates(params.get('offset'), 1) and time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+        status, body = await self.api.call(method, params)
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(body))
+
+    get = post
+
+SYNTHETIC_WORDS = ("ledger", "tariff", "monsoon", "equity", "treaty", "plateau", "audit", "subsidy", "delta",
+                   "mandate", "reserve", "glacier", "dividend", "charter", "census", "inflation", "estuary", "quorum")
+
+class PerplexityMock:
+    """Synthesises quiz JSON in the shape the bot asks for, after `delay` seconds (±`jitter`)."""
+
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, canned: list = None, seed: int = None):
+        self.delay = delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.canned = canned
+        self.requests = 0
+        self._random = random.Random(seed)
+
+    def questions(self, prompt: str) -> list:
+        if self.canned is not None:
+            return self.canned
+        match = re.search(r"(\d+)-question", prompt) or re.search(r"(\d+) questions", prompt)
+        count = int(match.group(1)) if match else 10
+        questions = []
+        for i in range(count):
+            correct = self._random.randrange(4)
+            # Random words keep the questions apart for quality.py's near-duplicate check
+            words = " ".join(self._random.choice(SYNTHETIC_WORDS) for _ in range(6))
+            questions.append({
+                'question': f"Synthetic question {i + 1} on {words}: which option is number {correct + 1}?",
+                'options': [f"Option {n + 1}" for n in range(4)],
+                'correct_answer': correct,
+                'explanation': f"Option {correct + 1} is the one asked for.",
+            })
+        return questions
+
+    async def respond(self, payload: dict):
+        """Returns (HTTP status, response body dict) for a chat completion request."""
+        self.requests += 1
+        delay = max(0.0, self.delay + self._random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+        if self._random.random() < self.error_rate:
+            return 500, {'error': {'message': "mock failure"}}
+        prompt = payload['messages'][-1]['content']
+        content = "Here is your quiz:\n" + json.dumps(self.questions(prompt), indent=2)
+        return 200, {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+
+class PerplexityHandler(tornado.web.RequestHandler):
+
+    def initialize(self, mock):
+        self.mock = mock
+
+    async def post(self):
+        status, body = await self.mock.respond(json.loads(self.request.body))
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(body))
+
+async def _deliver_webhooks(api: FakeBotAPI):
+    """Push pending updates to the webhook set with setWebhook, like Telegram does."""
+    async with httpx.AsyncClient(timeout=10) as client:
+        while True:
+            webhook = api.webhook
+            updates = api.take_updates() if webhook else []
+            if not updates:
+                await asyncio.sleep(0.01)
+                continue
+            for update in updates:
+                headers = {}
+                if webhook['secret_token']:
+                    headers["X-Telegram-Bot-Api-Secret-Token"] = webhook['secret_token']
+                try:
+                    response = await client.post(webhook['url'], json=update, headers=headers)
+                    delivered = response.status_code == HTTPStatus.OK
+                except httpx.HTTPError:
+                    delivered = False
+                if not delivered:
+                    # Telegram retries later; keep the update and back off
+                    await asyncio.sleep(0.5)
+                    break
+                api.take_updates(update['update_id'] + 1, 0)
+
+class FakeTelegramServer:
+    """Serves a FakeBotAPI on /bot<token>/<method> and a PerplexityMock on
+    /perplexity/chat/completions, optionally on its own thread and event loop so the
+    bot under test does not share a loop with its stand-ins."""
+
+    def __init__(self, api: FakeBotAPI = None, perplexity_mock: PerplexityMock = None, port: int = 0):
+        self.api = api or FakeBotAPI()
+        self.perplexity_mock = perplexity_mock or PerplexityMock()
+        self.port = port
+        self._server = None
+        self._webhook_task = None
+        self._thread = None
+        self._loop = None
+
+    @property
+    def bot_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def perplexity_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/perplexity/chat/completions"
+
+    def start(self):
+        """Start serving on the running event loop."""
+        app = tornado.web.Application([
+            (r"/bot[^/]+/(\w+)", BotMethodHandler, dict(api=self.api)),
+            (r"/perplexity/chat/completions", PerplexityHandler, dict(mock=self.perplexity_mock)),
+        ], log_function=lambda handler: None)  # injected errors would flood the access log
+        self._server = HTTPServer(app)
+        sockets = tornado.netutil.bind_sockets(self.port, "127.0.0.1")
+        self.port = sockets[0].getsockname()[1]
+        self._server.add_sockets(sockets)
+        self._webhook_task = asyncio.create_task(_deliver_webhooks(self.api))
+        logger.info(f"Fake Telegram/Perplexity server on port {self.port}")
+
+    def stop(self):
+        if self._webhook_task is not None:
+            self._webhook_task.cancel()
+        if self._server is not None:
+            self._server.stop()
+
+    def start_in_thread(self):
+        """Start on a background thread; returns once the port is bound."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._async_start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-telegram", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    async def _async_start(self):
+        self.start()
+
+    def stop_thread(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.stop)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the fake Telegram Bot API and Perplexity API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every Bot API call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Bot API calls answered with 500")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="Fraction of Bot API calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds in 429 answers")
+    parser.add_argument("--perplexity-delay", type=float, default=0.0, help="Seconds before the mock answers")
+    parser.add_argument("--perplexity-error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    async def serve():
+        server = FakeTelegramServer(
+            FakeBotAPI(args.latency, error_rate=args.error_rate, retry_after_rate=args.retry_after_rate,
+                       retry_after=args.retry_after),
+            PerplexityMock(args.perplexity_delay, error_rate=args.perplexity_error_rate),
+            args.port,
+        )
+        server.start()
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
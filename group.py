@@ -1,10 +1,26 @@
 # group.py
+import asyncio
+import html
 import logging
+import os
 import random
+import re
+import sqlite3
+import time
+from collections import Counter
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Poll
+from telegram.constants import MessageLimit, PollLimit
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest, Forbidden
 
+import bank
+import instrument
+import mastery
+import metrics
+import perplexity
+import prefetch
+import quality
+
 logger = logging.getLogger(__name__)
 
 # Store group quizzes and user scores with multi-group support
@@ -13,6 +29,56 @@ poll_answers = {}
 user_scores = {}
 active_group_quizzes = set()  # Track active quizzes across groups
 
+# Question bank exam key of each session's exam_type
+EXAM_KEYS = {'12th Board': '12th', 'UPSC CSE': 'upsc'}
+EXAM_TYPES = {exam: exam_type for exam_type, exam in EXAM_KEYS.items()}
+
+# /quiz <keywords> generates questions when fewer than this many banked ones match
+SEARCH_MIN_QUESTIONS = int(os.environ.get("SEARCH_MIN_QUESTIONS", 10))
+
+# Quiz pacing - a question every QUESTION_INTERVAL seconds, each poll open for POLL_OPEN_PERIOD
+QUESTION_INTERVAL = int(os.environ.get("QUESTION_INTERVAL", 30))
+POLL_OPEN_PERIOD = int(os.environ.get("POLL_OPEN_PERIOD", 25))
+
+# Explanations too long for the poll's explanation field are sent after the leaderboard,
+# packed into as few messages as they fit (`1` or `0`)
+QUIZ_REVIEW = os.environ.get("QUIZ_REVIEW", "1") == "1"
+# Longer explanations are cut in the review, which bounds the messages per quiz
+REVIEW_EXPLANATION_LENGTH = 600
+
+# Per-chat admin cache: chat_id -> {'admins': set of user ids, 'expires': monotonic time}
+ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", 600))
+ADMIN_STATUSES = ('administrator', 'creator')
+admin_cache = {}
+admin_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+async def get_group_admins(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> set:
+    """Return the admin user ids of a chat, refreshing from get_chat_administrators after the TTL."""
+    now = time.monotonic()
+    entry = admin_cache.get(chat_id)
+    if entry and entry['expires'] > now:
+        admin_cache_stats['hits'] += 1
+        return entry['admins']
+    
+    admin_cache_stats['misses'] += 1
+    administrators = await context.bot.get_chat_administrators(chat_id)
+    admins = {member.user.id for member in administrators}
+    admin_cache[chat_id] = {'admins': admins, 'expires': now + ADMIN_CACHE_TTL}
+    return admins
+
+def invalidate_admin_cache(chat_id: int):
+    """Drop the cached admin list of a chat."""
+    if admin_cache.pop(chat_id, None) is not None:
+        admin_cache_stats['invalidations'] += 1
+
+def get_admin_cache_stats():
+    """Get admin cache counters with the current hit rate."""
+    lookups = admin_cache_stats['hits'] + admin_cache_stats['misses']
+    stats = dict(admin_cache_stats)
+    stats['cached_chats'] = len(admin_cache)
+    stats['hit_rate'] = admin_cache_stats['hits'] / lookups if lookups else 0.0
+    return stats
+
 # Admin permissions check
 async def is_group_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Check if the user is admin in the group"""
@@ -20,15 +86,119 @@ async def is_group_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         chat_id = update.effective_chat.id
         user_id = update.effective_user.id
         
-        # Get chat member information
-        chat_member = await context.bot.get_chat_member(chat_id, user_id)
-        
-        # Check if user is admin or creator
-        return chat_member.status in ['administrator', 'creator']
+        # Admin list is served from the per-chat cache
+        return user_id in await get_group_admins(context, chat_id)
     except Exception as e:
         logger.error(f"Error checking admin status: {e}")
         return False
 
+async def handle_chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Invalidate the admin cache when someone is promoted, demoted or the bot leaves."""
+    member_update = update.chat_member or update.my_chat_member
+    if not member_update:
+        return
+    
+    old_status = member_update.old_chat_member.status
+    new_status = member_update.new_chat_member.status
+    
+    # Only admin changes (or the bot being removed) affect the cached list
+    if (old_status in ADMIN_STATUSES) != (new_status in ADMIN_STATUSES) or new_status in ('left', 'kicked'):
+        invalidate_admin_cache(member_update.chat.id)
+
+def record_last_poll(chat_id: int, quiz_data: dict):
+    """Feed the group's result on its latest poll into the mastery model (once per poll)."""
+    if not quiz_data['poll_ids']:
+        return
+    poll_data = poll_answers.get(quiz_data['poll_ids'][-1])
+    if poll_data is None or poll_data.get('recorded'):
+        return
+    poll_data['recorded'] = True
+    question = quiz_data['questions'][poll_data['question_index']]
+    # Banked questions carry their own subject (a keyword quiz mixes several)
+    mastery.record_group_poll(chat_id, EXAM_KEYS.get(quiz_data['exam_type'], '12th'),
+                              question.get('subject', quiz_data['subject']), question,
+                              poll_data.get('answered', 0), poll_data.get('right', 0))
+
+def poll_explanation(question: dict):
+    """The explanation if it fits a quiz poll (players see it as they answer), else None."""
+    explanation = str(question.get('explanation') or "").strip()
+    if (explanation and quality.telegram_length(explanation) <= PollLimit.MAX_EXPLANATION_LENGTH
+            and explanation.count("\n") <= PollLimit.MAX_EXPLANATION_LINE_FEEDS):
+        return explanation
+    return None
+
+def pack_review(numbered_questions: list, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> list:
+    """HTML messages reviewing (number, question) pairs in order, each entry whole and each message within `limit`."""
+    messages = []
+    text = "📖 <b>Answer Review</b>\n\n"
+    for number, question in numbered_questions:
+        explanation = str(question.get('explanation') or "").strip()
+        if len(explanation) > REVIEW_EXPLANATION_LENGTH:
+            explanation = explanation[:REVIEW_EXPLANATION_LENGTH - 1].rstrip() + "…"
+        entry = (f"<b>{number}. {html.escape(question['question'])}</b>\n"
+                 f"✅ {html.escape(question['options'][question['correct_answer']])}\n"
+                 f"💡 {html.escape(explanation)}\n\n")
+        # Tags count here though Telegram does not count them, so a message never ends up too long
+        if quality.telegram_length(text) + quality.telegram_length(entry) > limit:
+            messages.append(text.rstrip())
+            text = ""
+        text += entry
+    if numbered_questions:
+        messages.append(text.rstrip())
+    return messages
+
+async def send_review(context: ContextTypes.DEFAULT_TYPE, chat_id: int, quiz_data: dict):
+    """End of quiz: the explanations of posted questions that did not fit in their polls."""
+    if not QUIZ_REVIEW:
+        return
+    posted = quiz_data['questions'][:quiz_data['current_question']]
+    pending = [(number, question) for number, question in enumerate(posted, 1)
+               if question.get('explanation') and poll_explanation(question) is None]
+    for text in pack_review(pending):
+        try:
+            await context.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+        except (BadRequest, Forbidden) as e:
+            logger.error(f"Could not send the answer review to group {chat_id}: {e}")
+            return
+
+def generating_markup() -> InlineKeyboardMarkup:
+    """Cancel button shown while the questions are being generated."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data='group_cancel')]])
+
+async def run_generation(chat_id: int, exam: str, subject: str, generate, message=None):
+    """Get the questions (prefetched or from `generate()`) in a task owned by the chat's session,
+    so /stop and cancel can abort the request. Returns (still_wanted, questions); still_wanted is
+    False when the session was stopped or cancelled meanwhile.
+
+    `message` is the "Generating..." message with the Cancel button, for /stop to close."""
+    session = group_quizzes[chat_id]
+    session['generating_message'] = message
+
+    async def questions():
+        prefetched, quiz = await prefetch.claim(chat_id, exam, subject)
+        return quiz if prefetched else await generate()
+
+    task = asyncio.create_task(questions())
+    session['generation'] = task
+    try:
+        quiz = await task
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise
+        return False, None
+    finally:
+        session.pop('generation', None)
+        session.pop('generating_message', None)
+    return group_quizzes.get(chat_id) is session and session['active'], quiz
+
+def cancel_generation(chat_id: int) -> bool:
+    """Abort the chat's in-flight question generation; True if one was running."""
+    task = group_quizzes.get(chat_id, {}).get('generation')
+    if task is None or task.done():
+        return False
+    task.cancel()
+    return True
+
 async def group_quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start a new group quiz by asking for exam type first."""
     chat_id = update.effective_chat.id
@@ -59,6 +229,11 @@ async def group_quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
     # Clear previous user scores for this group
     user_scores[chat_id] = {}
+    
+    # /quiz <keywords>: a quiz on any topic from the question bank
+    if context.args:
+        await start_keyword_quiz(update, context, context.args)
+        return
         
     # Ask for exam type first
     keyboard = [
@@ -75,12 +250,117 @@ async def group_quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         reply_markup=reply_markup
     )
 
+async def start_keyword_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, words: list):
+    """Start a quiz from the banked questions matching the keywords, generating one only when
+    fewer than SEARCH_MIN_QUESTIONS match. Leading '12th'/'upsc' and 'easy'/'medium'/'hard'
+    words (in either order) pick the exam and the calibrated difficulty."""
+    chat_id = update.effective_chat.id
+    group_name = update.effective_chat.title or f"Group {chat_id}"
+    exam = band = None
+    while words:
+        word = words[0].lower()
+        if exam is None and word in EXAM_TYPES:
+            exam = word
+        elif band is None and word in bank.DIFFICULTY_BANDS:
+            band = word
+        else:
+            break
+        words = words[1:]
+    # Plain words only, so the keywords are safe to echo back in Markdown
+    keywords = " ".join(re.findall(r"[^\W_]+", " ".join(words)))
+    if not keywords:
+        await update.message.reply_text("Usage: /quiz [12th|upsc] [easy|medium|hard] <keywords>, e.g. /quiz easy Partnership Accounts")
+        return
+    
+    found = bank.search(keywords, exam, limit=20, band=band)
+    if exam is None:
+        # The exam most of the matches belong to
+        exam = Counter(question['exam'] for question in found).most_common(1)[0][0] if found else '12th'
+        found = [question for question in found if question['exam'] == exam]
+    
+    if chat_id in group_quizzes and group_quizzes[chat_id].get('active', False):
+        await update.message.reply_text("⚠️ A quiz is already running in this group! Use /stop to stop it first.")
+        return
+    group_quizzes[chat_id] = {
+        'exam_type': EXAM_TYPES[exam],
+        'subject': keywords,
+        'questions': [],
+        'current_question': 0,
+        'active': True,
+        'poll_ids': [],
+        'started_by': update.effective_user.id,
+        'group_name': group_name
+    }
+    active_group_quizzes.add(chat_id)
+    
+    message = None
+    questions = found
+    if len(found) < SEARCH_MIN_QUESTIONS:
+        message = await update.message.reply_text(f"🔄 Generating a quiz on {keywords}...", reply_markup=generating_markup())
+        # Bank the batch under a menu subject: the one the keywords name, else the one most matches
+        # belong to; with neither it is used for this quiz only
+        from bank_tool import canonical_subject
+        subject = canonical_subject(exam, keywords)
+        if subject is None and found:
+            subject = Counter(question['subject'] for question in found).most_common(1)[0][0]
+        if exam == 'upsc':
+            from upsc import generate_upsc_questions
+            generate = lambda: generate_upsc_questions(subject, band or "advanced", 20, topic=keywords)
+        else:
+            generate = lambda: generate_quiz_with_perplexity(subject, band or "medium", 20, topic=keywords)
+        wanted, generated = await run_generation(chat_id, exam, keywords, generate, message)
+        if not wanted:
+            # /stop or cancel ended the session and already answered
+            return
+        questions = generated or found
+    
+    if not questions:
+        group_quizzes[chat_id]['active'] = False
+        active_group_quizzes.discard(chat_id)
+        del group_quizzes[chat_id]
+        reply = message.edit_text if message is not None else update.message.reply_text
+        await reply(f"❌ Sorry, I couldn't find or generate questions on {keywords}. Try other keywords.")
+        return
+    
+    group_quizzes[chat_id]['questions'] = questions
+    
+    try:
+        import log
+        await log.log_group_quiz_started(update, context, keywords, group_name)
+        await log.log_admin_action(update, context, f"Started {keywords} quiz ({len(found)} banked matches)", group_name)
+    except ImportError:
+        pass
+    
+    if exam == 'upsc':
+        from upsc import post_upsc_question as post_question
+    else:
+        post_question = post_group_question
+    context.job_queue.run_repeating(
+        post_question,
+        interval=QUESTION_INTERVAL,
+        first=1,
+        data=chat_id,
+        name=str(chat_id)
+    )
+    text = (f"✅ **{keywords} Quiz Started!**\n\n"
+            f"• {len(questions)} questions, one every {QUESTION_INTERVAL} seconds\n"
+            f"• Each poll stays open for {POLL_OPEN_PERIOD} seconds\n"
+            f"• Use /stop to end quiz early\n"
+            f"• Leaderboard at the end!")
+    if message is not None:
+        await message.edit_text(text=text, parse_mode='Markdown')
+    else:
+        await update.message.reply_text(text=text, parse_mode='Markdown')
+
 async def handle_exam_selection(update: Update, context: ContextTypes.DEFAULT_TYPE, exam_type: str):
     """Handle exam type selection."""
     query = update.callback_query
-    await query.answer()
     
     if exam_type == '12th':
+        # Start generating the group's likely subjects while the admin is still choosing
+        if await is_group_admin(update, context):
+            prefetch.start(query.message.chat_id, '12th', lambda subject: generate_quiz_with_perplexity(subject, "medium", 20))
+        
         # Show 12th board subjects
         keyboard = [
             [
@@ -116,6 +396,8 @@ async def handle_exam_selection(update: Update, context: ContextTypes.DEFAULT_TY
             )
     
     elif exam_type == 'back':
+        prefetch.cancel(query.message.chat_id)
+        
         # Go back to exam selection
         keyboard = [
             [InlineKeyboardButton("12th Board Commerce", callback_data='exam_12th')],
@@ -136,13 +418,16 @@ async def handle_group_subject_selection(update: Update, context: ContextTypes.D
     chat_id = query.message.chat_id
     group_name = query.message.chat.title or f"Group {chat_id}"
     
-    await query.answer()
-    
     # Check if user is admin
     if not await is_group_admin(update, context):
         await query.edit_message_text("❌ Only group admins can start quizzes!")
         return
     
+    # Check if quiz already running
+    if chat_id in group_quizzes and group_quizzes[chat_id].get('active', False):
+        await query.edit_message_text("⚠️ A quiz is already running in this group! Use /stop to stop it first.")
+        return
+    
     # Initialize group quiz
     group_quizzes[chat_id] = {
         'exam_type': '12th Board',
@@ -158,89 +443,79 @@ async def handle_group_subject_selection(update: Update, context: ContextTypes.D
     # Add to active quizzes
     active_group_quizzes.add(chat_id)
     
-    await query.edit_message_text(text=f"🔄 Generating {subject} quiz for the group...")
+    await query.edit_message_text(text=f"🔄 Generating {subject} quiz for the group...", reply_markup=generating_markup())
     
-    # Generate questions for the group quiz
-    quiz = await generate_quiz_with_perplexity(subject, "medium", 20)
+    # Use the speculative generation started from the subject menu, if there is one
+    prefetch.record_pick(chat_id, '12th', subject)
+    wanted, quiz = await run_generation(chat_id, '12th', subject, lambda: generate_quiz_with_perplexity(subject, "medium", 20),
+                                       query.message)
+    if not wanted:
+        # /stop or cancel ended the session and already answered
+        return
     
-    if quiz:
-        group_quizzes[chat_id]['questions'] = quiz
-        
-        # Log quiz start
-        try:
-            import log
-            await log.log_group_quiz_started(update, context, subject, group_name)
-            await log.log_admin_action(update, context, f"Started {subject} quiz", group_name)
-        except ImportError:
-            pass
-        
-        # Start posting questions every 30 seconds
-        context.job_queue.run_repeating(
-            post_group_question, 
-            interval=30, 
-            first=1, 
-            data=chat_id, 
-            name=str(chat_id)
-        )
+    fallback = not quiz
+    if fallback:
+        # Use fallback questions if API fails
+        quiz = fallback_quiz('12th', subject)
+    if not quiz:
+        group_quizzes[chat_id]['active'] = False
+        active_group_quizzes.discard(chat_id)
+        del group_quizzes[chat_id]
         await query.edit_message_text(
-            text=f"✅ **{subject} Quiz Started!**\n\n"
-                 f"• Questions will be posted every 30 seconds\n"
-                 f"• Each poll stays open for 25 seconds\n"
-                 f"• Use /stop to end quiz early\n"
-                 f"• Leaderboard at the end!",
-            parse_mode='Markdown'
+            text="❌ Sorry, I couldn't generate a quiz right now. Please try again later."
         )
-    else:
-        # Use fallback questions if API fails
-        from personal import fallback_questions
-        if subject in fallback_questions:
-            # Create questions by repeating and modifying fallback questions
-            questions = []
-            for i in range(20):
-                base_q = fallback_questions[subject][i % len(fallback_questions[subject])]
-                new_q = base_q.copy()
-                new_q['question'] = f"{i+1}. {base_q['question']}"
-                questions.append(new_q)
-            
-            group_quizzes[chat_id]['questions'] = questions
-            
-            # Log quiz start with fallback
-            try:
-                import log
-                await log.log_group_quiz_started(update, context, subject, group_name)
-                await log.log_admin_action(update, context, f"Started {subject} quiz (Fallback)", group_name)
-            except ImportError:
-                pass
-            
-            # Start posting questions every 30 seconds
-            context.job_queue.run_repeating(
-                post_group_question, 
-                interval=30, 
-                first=1, 
-                data=chat_id, 
-                name=str(chat_id)
-            )
-            await query.edit_message_text(
-                text=f"✅ **{subject} Quiz Started!**\n\n"
-                     f"• Questions will be posted every 30 seconds\n"
-                     f"• Each poll stays open for 25 seconds\n"
-                     f"• Use /stop to end quiz early\n"
-                     f"• Leaderboard at the end!",
-                parse_mode='Markdown'
-            )
-        else:
-            await query.edit_message_text(
-                text="❌ Sorry, I couldn't generate a quiz right now. Please try again later."
-            )
+        return
+    
+    group_quizzes[chat_id]['questions'] = mastery.with_group_reviews(chat_id, '12th', subject, quiz)
+    
+    # Log quiz start
+    try:
+        import log
+        await log.log_group_quiz_started(update, context, subject, group_name)
+        await log.log_admin_action(update, context, f"Started {subject} quiz{' (Fallback)' if fallback else ''}", group_name)
+    except ImportError:
+        pass
+    
+    # Start posting a question every QUESTION_INTERVAL seconds
+    context.job_queue.run_repeating(
+        post_group_question, 
+        interval=QUESTION_INTERVAL, 
+        first=1, 
+        data=chat_id, 
+        name=str(chat_id)
+    )
+    await query.edit_message_text(
+        text=f"✅ **{subject} Quiz Started!**\n\n"
+             f"• Questions will be posted every {QUESTION_INTERVAL} seconds\n"
+             f"• Each poll stays open for {POLL_OPEN_PERIOD} seconds\n"
+             f"• Use /stop to end quiz early\n"
+             f"• Leaderboard at the end!",
+        parse_mode='Markdown'
+    )
 
 async def handle_group_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle quiz cancellation."""
     query = update.callback_query
-    await query.answer()
+    chat_id = query.message.chat_id
+    prefetch.cancel(chat_id)
+    
+    # Cancelled while the questions were being generated: abort the request and drop the session
+    session = group_quizzes.get(chat_id, {})
+    generation = session.get('generation')
+    if generation is not None and not generation.done():
+        # Like /stop, ending a starting quiz is admin only
+        if not await is_group_admin(update, context):
+            return
+        if group_quizzes.get(chat_id) is session:
+            cancel_generation(chat_id)
+            session['active'] = False
+            active_group_quizzes.discard(chat_id)
+            del group_quizzes[chat_id]
+    
     await query.edit_message_text("❌ Quiz setup cancelled.")
 
 async def post_group_question(context: ContextTypes.DEFAULT_TYPE):
-    """Post a question as a poll to the group every 30 seconds."""
+    """Post a question as a poll to the group every QUESTION_INTERVAL seconds."""
     chat_id = context.job.data
     
     if chat_id not in group_quizzes or not group_quizzes[chat_id]['active']:
@@ -251,6 +526,8 @@ async def post_group_question(context: ContextTypes.DEFAULT_TYPE):
     
     quiz_data = group_quizzes[chat_id]
     current_index = quiz_data['current_question']
+    # The previous poll has closed by now
+    record_last_poll(chat_id, quiz_data)
     
     if current_index >= len(quiz_data['questions']):
         # End of quiz
@@ -264,8 +541,9 @@ async def post_group_question(context: ContextTypes.DEFAULT_TYPE):
             text="🎉 Group quiz completed! Use /quiz to start a new one."
         )
         
-        # Send leaderboard
+        # Send leaderboard, then the explanations that did not fit in the polls
         await send_leaderboard(context, chat_id, quiz_data['group_name'])
+        await send_review(context, chat_id, quiz_data)
         
         # Log quiz completion
         try:
@@ -295,16 +573,20 @@ async def post_group_question(context: ContextTypes.DEFAULT_TYPE):
         poll_options = question['options']
         
         # Send the poll
+        started = time.perf_counter()
         message = await context.bot.send_poll(
             chat_id=chat_id,
             question=poll_question,
             options=poll_options,
             type=Poll.QUIZ,
             correct_option_id=question['correct_answer'],
+            explanation=poll_explanation(question),
             is_anonymous=False,
-            open_period=25  # Poll stays open for 25 seconds
+            open_period=POLL_OPEN_PERIOD
         )
         
+        metrics.SEND_POLL_LATENCY.observe(time.perf_counter() - started, exam='12th')
+        
         # Store poll information
         poll_id = message.poll.id
         quiz_data['poll_ids'].append(poll_id)
@@ -312,12 +594,15 @@ async def post_group_question(context: ContextTypes.DEFAULT_TYPE):
             'chat_id': chat_id,
             'question_index': current_index,
             'correct': False,
-            'explanation': question.get('explanation', '')
+            'explanation': question.get('explanation', ''),
+            'answered': 0,
+            'right': 0
         }
         
         quiz_data['current_question'] += 1
         
     except (BadRequest, Forbidden) as e:
+        metrics.SEND_POLL_ERRORS.inc(exam='12th', error=type(e).__name__)
         logger.error(f"Error sending poll to group {chat_id}: {e}")
         # Skip this question and continue
         quiz_data['current_question'] += 1
@@ -342,9 +627,17 @@ async def handle_poll_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
     question_index = poll_data['question_index']
     question = quiz_data['questions'][question_index]
     
+    # Per-user answer history for spaced repetition (banked questions only)
+    correct = selected_option == question['correct_answer']
+    poll_data['answered'] = poll_data.get('answered', 0) + 1
+    if 'id' in question:
+        mastery.record_answer(user_id, question['id'], EXAM_KEYS.get(quiz_data['exam_type'], '12th'),
+                              question.get('subject', quiz_data['subject']), correct)
+    
     # Check if answer is correct
-    if selected_option == question['correct_answer']:
+    if correct:
         poll_data['correct'] = True
+        poll_data['right'] = poll_data.get('right', 0) + 1
         
         # Update user score
         if chat_id not in user_scores:
@@ -355,8 +648,7 @@ async def handle_poll_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         user_scores[chat_id][user_id] += 1
         
-        # 🚫 REMOVED: DM explanation sending
-        # Now only score is updated, no DM is sent to user
+        # No per-user DMs: explanations come with the poll or in the end-of-quiz review
 
 async def send_leaderboard(context, chat_id, group_name):
     """Send the leaderboard with all participants' scores."""
@@ -369,7 +661,8 @@ async def send_leaderboard(context, chat_id, group_name):
     
     # Get user names and scores
     leaderboard_data = []
-    for user_id, score in user_scores[chat_id].items():
+    # A snapshot: answers still arriving would change the dict between the awaits
+    for user_id, score in list(user_scores[chat_id].items()):
         try:
             user = await context.bot.get_chat_member(chat_id, user_id)
             user_name = user.user.first_name
@@ -430,8 +723,17 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get group name for logging
     group_name = update.effective_chat.title or f"Group {chat_id}"
     
-    # Stop the quiz
-    group_quizzes[chat_id]['active'] = False
+    # Stop the quiz (and abort its question generation if still running)
+    session = group_quizzes[chat_id]
+    session['active'] = False
+    record_last_poll(chat_id, session)
+    generating_message = session.get('generating_message')
+    if cancel_generation(chat_id) and generating_message is not None:
+        # Take the Cancel button away from the "Generating..." message
+        try:
+            await generating_message.edit_text("⏹ Quiz stopped before it started.")
+        except BadRequest as e:
+            logger.error(f"Could not close the generating message in group {chat_id}: {e}")
     
     # Remove from active quizzes set
     if chat_id in active_group_quizzes:
@@ -445,8 +747,9 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get scores for logging
     scores = user_scores.get(chat_id, {})
     
-    # Send leaderboard
+    # Send leaderboard, then the explanations of the questions posted so far
     await send_leaderboard(context, chat_id, group_name)
+    await send_review(context, chat_id, session)
     
     # Log quiz stop
     try:
@@ -456,25 +759,50 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ImportError:
         pass
     
-    # Clean up
-    if chat_id in group_quizzes:
+    # Clean up (unless a new quiz was started meanwhile)
+    if group_quizzes.get(chat_id) is session:
         del group_quizzes[chat_id]
     
     await update.message.reply_text("✅ Quiz stopped successfully! Leaderboard has been posted.")
 
-async def generate_quiz_with_perplexity(subject: str, difficulty: str, num_questions: int = 20):
-    """Generate quiz questions using Perplexity AI API."""
+def fallback_quiz(exam: str, subject: str, num_questions: int = 20):
+    """A quiz for when generation fails: distinct banked questions of the subject (every accepted
+    batch ends up there), or while the bank has fewer than QUALITY_MIN_QUESTIONS of them, the
+    built-in questions repeated and numbered. None if there are neither."""
+    try:
+        questions = bank.sample(exam, subject, num_questions)
+    except sqlite3.Error as e:
+        logger.error(f"Could not read banked {exam} {subject} questions: {e}")
+        questions = []
+    if len(questions) >= quality.QUALITY_MIN_QUESTIONS:
+        return questions
+    if exam == 'upsc':
+        from upsc import upsc_fallback_questions as fallback_questions
+    else:
+        from personal import fallback_questions
+    base = fallback_questions.get(subject)
+    if not base:
+        return None
+    questions = []
+    for i in range(num_questions):
+        question = base[i % len(base)].copy()
+        question['question'] = f"{i+1}. {question['question']}"
+        questions.append(question)
+    return questions
+
+@instrument.timed_section('generator')
+async def generate_quiz_with_perplexity(subject: str, difficulty: str, num_questions: int = 20, topic: str = None):
+    """Generate quiz questions using Perplexity AI API (on `topic`, or a random topic of the subject).
+
+    With no subject (a keyword quiz outside the menu subjects) the questions are not banked."""
     try:
         from personal import quiz_topics
         # Select a random topic from the available topics for this subject
-        topic = random.choice(quiz_topics[subject])
-        
-        # Perplexity API endpoint
-        url = "https://api.perplexity.ai/chat/completions"
+        topic = topic or random.choice(quiz_topics[subject])
         
         # Prepare the prompt
         prompt = f"""
-        Create a {num_questions}-question multiple choice quiz on {subject} for 12th grade Commerce students.
+        Create a {num_questions}-question multiple choice quiz on {subject or topic} for 12th grade Commerce students.
         Focus on the topic: {topic}
         Difficulty level: {difficulty}.
         For each question, provide:
@@ -494,48 +822,16 @@ async def generate_quiz_with_perplexity(subject: str, difficulty: str, num_quest
         ]
         """
         
-        # Headers for the API request
-        from main import PERPLEXITY_API_KEY
-        headers = {
-            "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # Payload for the API request
-        payload = {
-            "model": "sonar",
-            "messages": [
-                {"role": "system", "content": "You are a helpful educational assistant that creates quiz questions for 12th grade Commerce students."},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 4000,
-            "temperature": 0.7
-        }
-        
-        # Make the API request
-        import requests
-        response = requests.post(url, headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            # Parse the response
-            response_data = response.json()
-            content = response_data['choices'][0]['message']['content']
-            
-            # Extract JSON from the response
-            import json
-            try:
-                # Try to find JSON array in the response
-                start_idx = content.find('[')
-                end_idx = content.rfind(']') + 1
-                json_str = content[start_idx:end_idx]
-                quiz_data = json.loads(json_str)
-                return quiz_data
-            except (json.JSONDecodeError, KeyError, IndexError):
-                logger.error("Failed to parse JSON from Perplexity response")
-                return None
-        else:
-            logger.error(f"Perplexity API error: {response.status_code} - {response.text}")
-            return None
+        questions = await perplexity.generate(
+            '12th',
+            "You are a helpful educational assistant that creates quiz questions for 12th grade Commerce students.",
+            prompt
+        )
+        # Drop unusable questions off the event loop, then keep the rest for solo practice
+        questions = await quality.filter_questions('12th', questions)
+        if questions and subject:
+            bank.cache_generated('12th', subject, questions)
+        return questions
             
     except Exception as e:
         logger.error(f"Error generating quiz with Perplexity: {e}")
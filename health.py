@@ -0,0 +1,139 @@
+# health.py
+import asyncio
+import logging
+import os
+import resource
+import sys
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Status surfaces read a cached snapshot that is refreshed in the background
+HEALTH_REFRESH_SECONDS = float(os.environ.get("HEALTH_REFRESH_SECONDS", 5))
+LAG_SAMPLE_SECONDS = 1.0
+
+_snapshot = {}
+_loop_lag = {'current': 0.0, 'max': 0.0, 'sampled_at': 0.0}
+_monitor_task = None
+_started_at = time.time()
+
+metrics.Gauge("quizbot_event_loop_lag_seconds", "Most recent event-loop lag sample", lambda: _loop_lag['current'])
+metrics.Gauge("quizbot_resident_memory_bytes", "Resident set size of the bot process", lambda: _rss_bytes())
+
+def _rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def _collect(application, active_groups) -> dict:
+    snapshot = {
+        'taken_at': time.time(),
+        'uptime_seconds': time.time() - _started_at,
+        'loop_lag_ms': _loop_lag['current'] * 1000,
+        'loop_lag_max_ms': _loop_lag['max'] * 1000,
+        'lag_sampled_at': _loop_lag['sampled_at'],
+        'rss_mb': _rss_bytes() / (1024 * 1024),
+        'heap_blocks': sys.getallocatedblocks(),
+        'active_groups': len(active_groups),
+        'group_quizzes': 0,
+        'poll_answers': 0,
+        'user_scores': 0,
+        'active_quizzes': 0,
+        'scheduler_jobs': 0,
+        'log_queue_depth': 0,
+        'breaker_state': 'unknown',
+    }
+    try:
+        import group
+        snapshot['group_quizzes'] = len(group.group_quizzes)
+        snapshot['poll_answers'] = len(group.poll_answers)
+        snapshot['user_scores'] = sum(len(scores) for scores in group.user_scores.values())
+        snapshot['active_quizzes'] = group.get_active_quizzes_count()
+    except ImportError:
+        pass
+    try:
+        import log
+        snapshot['log_queue_depth'] = log.get_log_queue_depth()
+    except ImportError:
+        pass
+    try:
+        import perplexity
+        snapshot['breaker_state'] = perplexity.breaker.state
+    except ImportError:
+        pass
+    if application.job_queue:
+        snapshot['scheduler_jobs'] = len(application.job_queue.jobs())
+    return snapshot
+
+async def _monitor(application, active_groups):
+    """Sample event-loop lag every second and rebuild the snapshot every HEALTH_REFRESH_SECONDS."""
+    global _snapshot
+    loop = asyncio.get_running_loop()
+    last_refresh = 0.0
+    while True:
+        expected = loop.time() + LAG_SAMPLE_SECONDS
+        await asyncio.sleep(LAG_SAMPLE_SECONDS)
+        lag = max(0.0, loop.time() - expected)
+        _loop_lag['current'] = lag
+        _loop_lag['max'] = max(_loop_lag['max'], lag)
+        _loop_lag['sampled_at'] = time.time()
+        if loop.time() - last_refresh >= HEALTH_REFRESH_SECONDS:
+            try:
+                _snapshot = _collect(application, active_groups)
+            except Exception as e:
+                logger.error(f"Error collecting health snapshot: {e}")
+            last_refresh = loop.time()
+
+def start_health_monitor(application, active_groups):
+    """Start the background sampler; `active_groups` is main's live set of groups."""
+    global _monitor_task, _snapshot
+    if _monitor_task is None:
+        _snapshot = _collect(application, active_groups)
+        _monitor_task = asyncio.create_task(_monitor(application, active_groups))
+
+async def stop_health_monitor():
+    global _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        try:
+            await _monitor_task
+        except asyncio.CancelledError:
+            pass
+        _monitor_task = None
+
+def get_snapshot() -> dict:
+    """Latest cached snapshot (empty until the monitor has started)."""
+    return _snapshot
+
+def get_loop_lag() -> dict:
+    return dict(_loop_lag)
+
+def format_uptime(seconds: float) -> str:
+    hours, remainder = divmod(int(seconds), 3600)
+    return f"{hours}h {remainder // 60}m"
+
+def render_status_lines(snapshot: dict = None) -> str:
+    """Bullet lines describing runtime health, shared by /status, /health and the status button."""
+    snapshot = snapshot or get_snapshot()
+    if not snapshot:
+        return "• Runtime health: collecting...\n"
+    breaker_icons = {'closed': '✅ Connected', 'half_open': '⚠️ Recovering', 'open': '❌ Unavailable (using fallback questions)'}
+    age = max(0, time.time() - snapshot['taken_at'])
+    return (
+        f"• Active quizzes: {snapshot['active_quizzes']}\n"
+        f"• Active groups: {snapshot['active_groups']}\n"
+        f"• Tracked polls: {snapshot['poll_answers']}\n"
+        f"• Scored participants: {snapshot['user_scores']}\n"
+        f"• Scheduled jobs: {snapshot['scheduler_jobs']}\n"
+        f"• Event loop lag: {snapshot['loop_lag_ms']:.1f} ms (max {snapshot['loop_lag_max_ms']:.0f} ms)\n"
+        f"• Memory: {snapshot['rss_mb']:.1f} MB RSS, {snapshot['heap_blocks']:,} heap blocks\n"
+        f"• Log queue: {snapshot['log_queue_depth']} pending\n"
+        f"• Question API: {breaker_icons.get(snapshot['breaker_state'], snapshot['breaker_state'])}\n"
+        f"• Uptime: {format_uptime(snapshot['uptime_seconds'])} (updated {age:.0f}s ago)\n"
+    )
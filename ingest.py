@@ -0,0 +1,130 @@
+# ingest.py
+import asyncio
+import logging
+import os
+from collections import deque
+
+from telegram import Update
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Webhook updates wait here (acknowledged already) until the processor has room
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 2000))
+INGEST_DEDUPE_WINDOW = int(os.environ.get("INGEST_DEDUPE_WINDOW", 10000))
+# Updates handed to the Application but not finished yet
+INGEST_MAX_IN_FLIGHT = int(os.environ.get("INGEST_MAX_IN_FLIGHT", 256))
+
+# These keep the quiz running, everything else can be shed first
+HIGH_PRIORITY_KEYS = ('poll_answer', 'callback_query', 'chat_member', 'my_chat_member')
+HIGH_PRIORITY_COMMANDS = ('/quiz', '/stop')
+
+WEBHOOK_UPDATES = metrics.Counter("quizbot_webhook_updates_total", "Webhook updates by ingest outcome", ("outcome",))
+
+def is_high_priority(data: dict) -> bool:
+    """Classify a raw update without building the Update object."""
+    if any(key in data for key in HIGH_PRIORITY_KEYS):
+        return True
+    text = (data.get('message') or {}).get('text') or ""
+    return text.split('@', 1)[0].split(' ', 1)[0] in HIGH_PRIORITY_COMMANDS
+
+class UpdateIngest:
+    """Bounded two-level queue in front of the Application's update queue.
+
+    accept() never waits: duplicates (by update_id) are dropped and, when the queue is
+    full, low-priority updates are shed before poll answers and button presses.
+
+    High-priority updates are dispatched first, so they can overtake earlier low-priority
+    updates of the same chat: ChatUpdateProcessor keeps the order it receives, not the
+    order Telegram sent."""
+
+    def __init__(self, application, queue_size: int = INGEST_QUEUE_SIZE,
+                 dedupe_window: int = INGEST_DEDUPE_WINDOW, max_in_flight: int = INGEST_MAX_IN_FLIGHT):
+        self.application = application
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight
+        self._high = deque()
+        self._low = deque()
+        self._recent_ids = deque(maxlen=dedupe_window)
+        self._recent_set = set()
+        self._ready = asyncio.Event()
+        self._task = None
+        metrics.Gauge("quizbot_ingest_queue_depth", "Webhook updates waiting for dispatch", lambda: self.depth)
+
+    @property
+    def depth(self) -> int:
+        return len(self._high) + len(self._low)
+
+    def _seen(self, update_id) -> bool:
+        if update_id in self._recent_set:
+            return True
+        if len(self._recent_ids) == self._recent_ids.maxlen:
+            self._recent_set.discard(self._recent_ids[0])
+        self._recent_ids.append(update_id)
+        self._recent_set.add(update_id)
+        return False
+
+    def accept(self, data: dict) -> str:
+        """Queue a raw update; returns the ingest outcome."""
+        if self._seen(data.get('update_id')):
+            outcome = 'duplicate'
+        elif self.depth < self.queue_size:
+            (self._high if is_high_priority(data) else self._low).append(data)
+            outcome = 'accepted'
+        elif is_high_priority(data):
+            if self._low:
+                # Make room by shedding the oldest low-priority update
+                self._low.popleft()
+                WEBHOOK_UPDATES.inc(outcome='shed_low')
+                self._high.append(data)
+                outcome = 'accepted'
+            else:
+                outcome = 'shed_high'
+        else:
+            outcome = 'shed_low'
+        WEBHOOK_UPDATES.inc(outcome=outcome)
+        if outcome == 'accepted':
+            self._ready.set()
+        return outcome
+
+    def _in_flight(self) -> int:
+        processor = self.application.update_processor
+        return getattr(processor, 'pending', 0) + self.application.update_queue.qsize()
+
+    async def _dispatch(self):
+        while True:
+            await self._ready.wait()
+            if not self.depth:
+                self._ready.clear()
+                continue
+            # Backpressure: wait for the processor instead of growing its queue
+            while self._in_flight() >= self.max_in_flight:
+                done = getattr(self.application.update_processor, 'update_done', None)
+                if done is None:
+                    # A processor that does not signal: check again shortly
+                    await asyncio.sleep(0.01)
+                    continue
+                done.clear()
+                await done.wait()
+            data = self._high.popleft() if self._high else self._low.popleft()
+            try:
+                update = Update.de_json(data, self.application.bot)
+            except Exception as e:
+                logger.error(f"Could not parse webhook update {data.get('update_id')}: {e}")
+                continue
+            if update:
+                await self.application.update_queue.put(update)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,113 @@
+# instrument.py
+import contextvars
+import functools
+import logging
+import os
+import time
+from collections import Counter
+
+from telegram.request import HTTPXRequest
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Updates slower than this are reported with their time breakdown
+SLOW_UPDATE_MS = float(os.environ.get("SLOW_UPDATE_MS", 2000))
+# At most one log-channel report per handler in this many seconds (all go to the event log)
+SLOW_REPORT_INTERVAL = float(os.environ.get("SLOW_REPORT_INTERVAL", 60))
+
+# Timing of the update currently being handled; tasks started by a handler share it
+_current_timing = contextvars.ContextVar("update_timing", default=None)
+_last_slow_report = {}
+# Callables (handler, wall_seconds, outcome) called after every handled update, e.g. by replay.py
+handler_observers = []
+
+HANDLER_PHASE = metrics.Histogram("quizbot_handler_phase_seconds", "Handler wall time split by phase", ("handler", "phase"))
+BOT_API_LATENCY = metrics.Histogram("quizbot_bot_api_latency_seconds", "Bot API call latency", ("method",))
+SLOW_UPDATES = metrics.Counter("quizbot_slow_updates_total", "Updates slower than SLOW_UPDATE_MS", ("handler",))
+
+def add_time(phase: str, seconds: float, call: str = None):
+    """Charge time to a phase of the update being handled, if any."""
+    timing = _current_timing.get()
+    if timing is not None:
+        timing[phase] += seconds
+        if call:
+            timing['calls'][call] += 1
+
+class TimingRequest(HTTPXRequest):
+    """HTTPXRequest that charges every Bot API round trip to the current update."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            api_method = url.rsplit("/", 1)[-1]
+            BOT_API_LATENCY.observe(elapsed, method=api_method)
+            add_time('api', elapsed, api_method)
+
+def timed_section(phase: str):
+    """Decorator charging the wall time of an async function to a phase (e.g. 'generator')."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                add_time(phase, time.perf_counter() - started, func.__name__)
+        return wrapper
+    return decorator
+
+def _report_slow_update(name: str, update, wall: float, breakdown: dict, calls: Counter):
+    SLOW_UPDATES.inc(handler=name)
+    calls_text = ", ".join(f"{method}×{count}" for method, count in calls.most_common()) or "none"
+    logger.warning(
+        f"Slow update in {name}: {wall * 1000:.0f} ms "
+        f"(api {breakdown['api'] * 1000:.0f} ms, generator {breakdown['generator'] * 1000:.0f} ms, "
+        f"cpu {breakdown['cpu'] * 1000:.0f} ms) calls: {calls_text}"
+    )
+    try:
+        import log
+    except ImportError:
+        return
+    now = time.monotonic()
+    notify_channel = now - _last_slow_report.get(name, 0) >= SLOW_REPORT_INTERVAL
+    if notify_channel:
+        _last_slow_report[name] = now
+    log.log_slow_update(update, name, wall, breakdown, calls_text, notify_channel)
+
+def instrument_handler(name: str, callback):
+    """Wrap a PTB handler callback: count it, time it and split wall time into
+    Bot API, generator and CPU (the remainder) phases; slow updates are reported."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        timing = {'api': 0.0, 'generator': 0.0, 'calls': Counter()}
+        token = _current_timing.set(timing)
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await callback(update, context)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            wall = time.perf_counter() - started
+            _current_timing.reset(token)
+            breakdown = {
+                'api': timing['api'],
+                'generator': timing['generator'],
+                # Concurrent API calls can overlap, so the remainder is clamped at zero
+                'cpu': max(0.0, wall - timing['api'] - timing['generator']),
+            }
+            metrics.HANDLER_LATENCY.observe(wall, handler=name)
+            metrics.HANDLER_UPDATES.inc(handler=name, outcome=outcome)
+            for phase, seconds in breakdown.items():
+                HANDLER_PHASE.observe(seconds, handler=name, phase=phase)
+            for observer in handler_observers:
+                observer(name, wall, outcome)
+            if wall * 1000 >= SLOW_UPDATE_MS:
+                _report_slow_update(name, update, wall, breakdown, timing['calls'])
+    return wrapper
@@ -1,33 +1,177 @@
 # log.py
+import asyncio
+import hashlib
 import logging
+import re
+import sys
+import time
 from telegram import Update
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 import os
+from collections import Counter
 from datetime import datetime
 
+import eventlog
+
 logger = logging.getLogger(__name__)
 
 # Log channel ID - Environment variable से लें
 LOG_CHANNEL_ID = os.environ.get("LOG_CHANNEL_ID")
 
-async def send_log_to_channel(context: ContextTypes.DEFAULT_TYPE, message: str, message_type: str = "INFO"):
-    """Send logs to the log channel"""
+# Log pipeline: handlers only enqueue, a background consumer sends digests
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 1000))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 5))
+# 'full' posts every event, 'summary' posts event counts (errors still in full)
+LOG_CHANNEL_MODE = os.environ.get("LOG_CHANNEL_MODE", "full")
+DIGEST_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+# Created on first use and dropped on stop, so a restart on a new event loop gets a fresh one
+_log_queue = None
+_consumer_task = None
+_log_bot = None
+log_stats = {'queued': 0, 'dropped': 0, 'digests_sent': 0, 'send_failures': 0}
+_dropped_since_digest = 0
+
+# Error deduplication: one channel report per fingerprint per window
+ERROR_REPORT_WINDOW = float(os.environ.get("ERROR_REPORT_WINDOW", 300))
+_error_windows = {}
+error_stats = {'reported': 0, 'suppressed': 0}
+_NUMBER_RE = re.compile(r"0x[0-9a-fA-F]+|\b[0-9a-fA-F]{12,}\b|\d+(?:\.\d+)?")
+# Files of the bot itself, for error call sites
+_APP_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+def _get_log_queue() -> asyncio.Queue:
+    global _log_queue
+    if _log_queue is None:
+        _log_queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+    return _log_queue
+
+def _enqueue_log(message_type: str, message: str, **fields):
+    """Record a log event locally and push it onto the channel queue, shedding it if the queue is full."""
+    global _dropped_since_digest
+    eventlog.record(dict(fields, type=message_type))
+    if not LOG_CHANNEL_ID:
+        return
+    event = {'type': message_type, 'time': datetime.now(), 'text': message}
+    event.update(fields)
     try:
-        if LOG_CHANNEL_ID:
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            formatted_message = f"📊 **{message_type}** - `{current_time}`\n\n{message}"
-            await context.bot.send_message(
-                chat_id=LOG_CHANNEL_ID,
-                text=formatted_message,
-                parse_mode='Markdown'
-            )
+        _get_log_queue().put_nowait(event)
+        log_stats['queued'] += 1
+    except asyncio.QueueFull:
+        log_stats['dropped'] += 1
+        _dropped_since_digest += 1
+
+def get_log_queue_depth():
+    """Get number of log events waiting to be sent."""
+    return _log_queue.qsize() if _log_queue is not None else 0
+
+def _format_event(event: dict) -> str:
+    current_time = event['time'].strftime("%Y-%m-%d %H:%M:%S")
+    text = f"📊 **{event['type']}** - `{current_time}`\n\n{event['text']}"
+    # A single oversized event is cut so it still fits in one message
+    return text[:MessageLimit.MAX_TEXT_LENGTH]
+
+def _summarise_events(events: list) -> list:
+    """Collapse a batch into per-type counts; errors are kept in full."""
+    counts = Counter(event['type'] for event in events)
+    first, last = events[0]['time'], events[-1]['time']
+    summary = f"📈 *Activity Summary* ({first.strftime('%H:%M:%S')} - {last.strftime('%H:%M:%S')})\n\n"
+    summary += "\n".join(f"• {message_type}: {count}" for message_type, count in counts.most_common())
+    return [summary] + [_format_event(event) for event in events if event['type'].startswith("ERROR")]
+
+def _build_digests(events: list) -> list:
+    """Pack formatted events into as few messages as the 4096-char limit allows."""
+    global _dropped_since_digest
+    if LOG_CHANNEL_MODE == 'summary':
+        parts = _summarise_events(events)
+    else:
+        parts = [_format_event(event) for event in events]
+    if _dropped_since_digest:
+        parts.append(f"⚠️ *{_dropped_since_digest} log events dropped* (queue full)")
+        _dropped_since_digest = 0
+    
+    digests = []
+    current = ""
+    for part in parts:
+        if current and len(current) + len(DIGEST_SEPARATOR) + len(part) > MessageLimit.MAX_TEXT_LENGTH:
+            digests.append(current)
+            current = ""
+        current = f"{current}{DIGEST_SEPARATOR}{part}" if current else part
+    if current:
+        digests.append(current)
+    return digests
+
+async def _send_digest(bot, text: str):
+    try:
+        await bot.send_message(chat_id=LOG_CHANNEL_ID, text=text, parse_mode='Markdown')
+    except BadRequest:
+        # Unescaped names break Markdown; send the digest as plain text instead
+        await bot.send_message(chat_id=LOG_CHANNEL_ID, text=text)
+    log_stats['digests_sent'] += 1
+
+async def _flush_events(events: list):
+    for digest in _build_digests(events):
+        try:
+            await _send_digest(_log_bot, digest)
+        except Exception as e:
+            log_stats['send_failures'] += 1
+            logger.error(f"Error sending log to channel: {e}")
+
+def _drain_queue(events: list):
+    if _log_queue is None:
+        return events
+    while True:
+        try:
+            events.append(_log_queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return events
+
+async def _consume_logs():
+    """Every LOG_FLUSH_INTERVAL, close expired error windows and send what is queued as digests."""
+    while True:
+        await asyncio.sleep(LOG_FLUSH_INTERVAL)
+        _report_error_windows()
+        events = _drain_queue([])
+        if events:
+            await _flush_events(events)
+
+def start_log_pipeline(bot):
+    """Start the background consumer that sends queued logs to the log channel."""
+    global _consumer_task, _log_bot
+    _log_bot = bot
+    if LOG_CHANNEL_ID and _consumer_task is None:
+        _consumer_task = asyncio.create_task(_consume_logs())
+        logger.info("Log pipeline started")
+
+async def stop_log_pipeline():
+    """Stop the consumer and send whatever is still queued."""
+    global _consumer_task, _log_queue
+    if _consumer_task is not None:
+        _consumer_task.cancel()
+        try:
+            await _consumer_task
+        except asyncio.CancelledError:
+            pass
+        _consumer_task = None
+    _report_error_windows(force=True)
+    events = _drain_queue([])
+    _log_queue = None
+    if events and _log_bot:
+        await _flush_events(events)
+
+async def send_log_to_channel(context: ContextTypes.DEFAULT_TYPE, message: str, message_type: str = "INFO", **fields):
+    """Queue a log for the log channel. Never waits on Telegram."""
+    try:
+        _enqueue_log(message_type, message, **fields)
     except Exception as e:
-        logger.error(f"Error sending log to channel: {e}")
+        logger.error(f"Error queueing log for channel: {e}")
 
 async def log_bot_started(context: ContextTypes.DEFAULT_TYPE):
     """Log when bot is started"""
     message = "🤖 *Bot Started Successfully!*\n\nBot is now active and ready to serve multiple groups."
-    await send_log_to_channel(context, message, "BOT STATUS")
+    await send_log_to_channel(context, message, "BOT STATUS", event='bot_started')
 
 async def log_group_quiz_started(update: Update, context: ContextTypes.DEFAULT_TYPE, subject: str, group_name: str):
     """Log when a group quiz is started"""
@@ -42,7 +186,8 @@ async def log_group_quiz_started(update: Update, context: ContextTypes.DEFAULT_T
             f"**Subject:** {subject}\n"
             f"**Time:** {update.message.date if update.message else 'N/A'}"
         )
-        await send_log_to_channel(context, message, "QUIZ STARTED")
+        await send_log_to_channel(context, message, "QUIZ STARTED", event='quiz_started',
+                                  chat_id=update.effective_chat.id, user_id=user.id, group=group_name, subject=subject)
     except Exception as e:
         logger.error(f"Error logging quiz start: {e}")
 
@@ -67,7 +212,8 @@ async def log_quiz_stopped(update: Update, context: ContextTypes.DEFAULT_TYPE, g
             f"**Stopped by:** {user.first_name} (@{user.username if user.username else 'N/A'}) - {user.id}"
             f"{participants_info}"
         )
-        await send_log_to_channel(context, message, "QUIZ STOPPED")
+        await send_log_to_channel(context, message, "QUIZ STOPPED", event='quiz_stopped',
+                                  chat_id=chat_id, user_id=user.id, group=group_name, participants=len(scores) if scores else 0)
     except Exception as e:
         logger.error(f"Error logging quiz stop: {e}")
 
@@ -87,13 +233,84 @@ async def log_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE,
             f"**Activity:** {activity}\n"
             f"**Time:** {update.message.date if update.message else 'N/A'}"
         )
-        await send_log_to_channel(context, message, "USER ACTIVITY")
+        await send_log_to_channel(context, message, "USER ACTIVITY", event='user_activity',
+                                  chat_id=chat.id, user_id=user.id, group=group_name, activity=activity)
     except Exception as e:
         logger.error(f"Error logging user activity: {e}")
 
-async def log_error(context: ContextTypes.DEFAULT_TYPE, error: str, update: Update = None):
-    """Log errors to channel"""
+def _is_app_file(path: str) -> bool:
+    path = os.path.abspath(path)
+    return path.startswith(_APP_DIR) and 'site-packages' not in path
+
+def _error_fingerprint(error: str, exc: BaseException = None, call_site: str = ""):
+    """Fingerprint an error by exception type, message with ids/numbers masked and call site."""
+    error_type = type(exc).__name__ if exc is not None else "Error"
+    if exc is not None and exc.__traceback__ is not None:
+        # The innermost frame of our own code, so the same httpx/telegram error raised from
+        # different handlers stays apart (the innermost frame when none is ours)
+        frames = []
+        tb = exc.__traceback__
+        while tb is not None:
+            frames.append(tb)
+            tb = tb.tb_next
+        own = [frame for frame in frames if _is_app_file(frame.tb_frame.f_code.co_filename)]
+        site = (own or frames)[-1]
+        call_site = f"{site.tb_frame.f_code.co_filename.rsplit('/', 1)[-1]}:{site.tb_lineno}"
+    normalised = _NUMBER_RE.sub("<n>", error)[:200]
+    key = f"{error_type}|{normalised}|{call_site}"
+    return hashlib.sha1(key.encode()).hexdigest()[:10], error_type, call_site
+
+def _report_error_windows(force: bool = False):
+    """Close expired error windows, queueing a summary for fingerprints that repeated."""
+    now = time.time()
+    for fingerprint, window in list(_error_windows.items()):
+        if not force and now - window['first_seen'] < ERROR_REPORT_WINDOW:
+            continue
+        del _error_windows[fingerprint]
+        if window['count'] > 1:
+            first_seen = datetime.fromtimestamp(window['first_seen']).strftime('%H:%M:%S')
+            last_seen = datetime.fromtimestamp(window['last_seen']).strftime('%H:%M:%S')
+            message = (
+                f"🔁 *Repeated Error* `{fingerprint}`\n\n"
+                f"**Error:** `{window['error']}`\n"
+                f"**Type:** {window['error_type']} at {window['call_site']}\n"
+                f"**Occurrences:** {window['count']}\n"
+                f"**First seen:** {first_seen}\n"
+                f"**Last seen:** {last_seen}"
+            )
+            _enqueue_log("ERROR SUMMARY", message, event='error_summary', fingerprint=fingerprint,
+                         occurrences=window['count'], first_seen=window['first_seen'],
+                         last_seen=window['last_seen'])
+
+def get_error_stats():
+    """Get error report counters and the number of open fingerprint windows."""
+    return dict(error_stats, open_windows=len(_error_windows))
+
+async def log_error(context: ContextTypes.DEFAULT_TYPE, error: str, update: Update = None, exc: BaseException = None):
+    """Log errors to channel - repeats of the same error are counted and reported once per window"""
     try:
+        caller = sys._getframe(1)
+        call_site = f"{caller.f_code.co_filename.rsplit('/', 1)[-1]}:{caller.f_code.co_name}"
+        fingerprint, error_type, call_site = _error_fingerprint(error, exc, call_site)
+        now = time.time()
+        
+        window = _error_windows.get(fingerprint)
+        if window and now - window['first_seen'] < ERROR_REPORT_WINDOW:
+            window['count'] += 1
+            window['last_seen'] = now
+            error_stats['suppressed'] += 1
+            eventlog.record({'event': 'error', 'type': "ERROR", 'fingerprint': fingerprint,
+                             'error': error, 'suppressed': True})
+            return
+        
+        # New fingerprint (or expired window): report now, count repeats until the window closes
+        _report_error_windows()
+        _error_windows[fingerprint] = {
+            'count': 1, 'first_seen': now, 'last_seen': now,
+            'error': error[:300], 'error_type': error_type, 'call_site': call_site
+        }
+        error_stats['reported'] += 1
+        
         error_info = ""
         if update:
             user = update.effective_user
@@ -106,14 +323,46 @@ async def log_error(context: ContextTypes.DEFAULT_TYPE, error: str, update: Upda
             )
         
         message = (
-            f"❌ *Error Occurred*\n\n"
+            f"❌ *Error Occurred* `{fingerprint}`\n\n"
             f"**Error:** `{error}`"
-            f"{error_info}"
+            f"{error_info}\n"
+            f"_Repeats within {int(ERROR_REPORT_WINDOW)}s are counted and summarised_"
         )
-        await send_log_to_channel(context, message, "ERROR")
+        await send_log_to_channel(context, message, "ERROR", event='error', fingerprint=fingerprint,
+                                  chat_id=update.effective_chat.id if update and update.effective_chat else None,
+                                  user_id=update.effective_user.id if update and update.effective_user else None,
+                                  error=error)
     except Exception as e:
         logger.error(f"Error logging error: {e}")
 
+def log_slow_update(update: Update, handler: str, wall: float, breakdown: dict, calls: str, notify_channel: bool = True):
+    """Log an update that exceeded the slow-path threshold with its time breakdown"""
+    try:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        user = update.effective_user if isinstance(update, Update) else None
+        fields = {
+            'event': 'slow_update', 'handler': handler,
+            'chat_id': chat.id if chat else None, 'user_id': user.id if user else None,
+            'wall_ms': round(wall * 1000), 'api_ms': round(breakdown['api'] * 1000),
+            'generator_ms': round(breakdown['generator'] * 1000), 'cpu_ms': round(breakdown['cpu'] * 1000),
+            'calls': calls
+        }
+        if not notify_channel:
+            eventlog.record(dict(fields, type="SLOW UPDATE"))
+            return
+        message = (
+            f"🐢 *Slow Update*\n\n"
+            f"**Handler:** {handler}\n"
+            f"**Group ID:** {chat.id if chat else 'N/A'}\n"
+            f"**Total:** {fields['wall_ms']} ms\n"
+            f"**Bot API:** {fields['api_ms']} ms ({calls})\n"
+            f"**Generator:** {fields['generator_ms']} ms\n"
+            f"**CPU/other:** {fields['cpu_ms']} ms"
+        )
+        _enqueue_log("SLOW UPDATE", message, **fields)
+    except Exception as e:
+        logger.error(f"Error logging slow update: {e}")
+
 async def log_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, target_group: str = ""):
     """Log admin actions"""
     try:
@@ -129,10 +378,22 @@ async def log_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE, a
             f"{group_info}"
             f"**Time:** {update.message.date if update.message else 'N/A'}"
         )
-        await send_log_to_channel(context, message, "ADMIN ACTION")
+        await send_log_to_channel(context, message, "ADMIN ACTION", event='admin_action',
+                                  chat_id=update.effective_chat.id if update.effective_chat else None,
+                                  user_id=user.id, action=action, target_group=target_group)
     except Exception as e:
         logger.error(f"Error logging admin action: {e}")
 
+async def log_profile_report(seconds: float, summary: list, path: str):
+    """Log the summary of a finished /profile window"""
+    message = (
+        f"🔬 *Profile Report* ({seconds:.0f}s)\n\n"
+        + "\n".join(summary)
+        + f"\n\n📄 Full report: `{path or 'not written'}`"
+    )
+    # Started from a timer rather than an update, so there is no context to pass
+    _enqueue_log("PROFILE", message, event='profile_report', seconds=round(seconds, 1), path=path)
+
 async def log_multi_group_activity(activity: str, groups_count: int, active_quizzes: int):
     """Log multi-group activity"""
     try:
@@ -143,7 +404,8 @@ async def log_multi_group_activity(activity: str, groups_count: int, active_quiz
             f"**Active Quizzes:** {active_quizzes}\n"
             f"**Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         )
-        # We need to get context from somewhere, so this will be called from main.py with context
-        # This function signature will be updated when called
+        # The pipeline holds its own bot reference, so no context is needed here
+        _enqueue_log("MULTI-GROUP", message, event='multi_group_activity',
+                     groups_count=groups_count, active_quizzes=active_quizzes)
     except Exception as e:
         logger.error(f"Error logging multi-group activity: {e}")
@@ -1,10 +1,27 @@
 # main.py
 import os
 import logging
+import signal
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, PollAnswerHandler
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ChatMemberHandler, ContextTypes, MessageHandler, PollAnswerHandler, filters
 import asyncio
 
+import bank
+import bank_tool
+import calibrate
+import health
+import mastery
+import metrics
+import perplexity
+import profiler
+import quality
+import replay
+import scheduler
+import webserver
+from ingest import UpdateIngest
+from instrument import TimingRequest, instrument_handler
+from processor import ChatUpdateProcessor
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -20,25 +37,22 @@ PERPLEXITY_API_KEY = os.environ.get("PERPLEXITY_API_KEY")
 WEBHOOK_URL = os.environ.get("RENDER_EXTERNAL_HOSTNAME", "localhost")
 WEBHOOK_PATH = "/webhook"
 
+# Bot API endpoint, e.g. http://127.0.0.1:8081/bot for the local stand-in in fakebot.py
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL")
+
+# Optional metrics server port for polling mode (webhook mode serves /metrics on PORT)
+METRICS_PORT = os.environ.get("METRICS_PORT")
+http_server = None
+
 # Global variables for multi-group management
 active_groups = set()
 
 # Health check endpoint for UptimeRobot
 async def health_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Health check command."""
-    active_quizzes = 0
-    try:
-        from group import get_active_quizzes_count
-        active_quizzes = get_active_quizzes_count()
-    except ImportError:
-        pass
-    
     health_text = (
         "🤖 *Bot Status: Active & Healthy* ✅\n\n"
-        f"• Bot is running smoothly\n"
-        f"• Active quizzes: {active_quizzes}\n"
-        f"• Multi-group support: Enabled\n"
-        f"• Admin-only mode: Enabled\n"
+        f"{health.render_status_lines()}"
         f"• Available Exams: 12th Board & UPSC CSE"
     )
     await update.message.reply_text(health_text, parse_mode='Markdown')
@@ -163,7 +177,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 *Available Commands (Group):*
 /quiz - Start a new quiz (Admin only)
+/quiz [easy|medium|hard] <keywords> - Quiz on any topic, e.g. /quiz upsc hard Fundamental Rights (Admin only)
 /stop - Stop ongoing quiz (Admin only)
+/schedule - Daily or weekly quizzes at a set time (Admin only)
+
+*Private Chat:*
+/quiz - Self-paced solo practice
+/stop - Finish your practice
 /subjects - Show available subjects
 /help - Show this help message
 /status - Check bot status
@@ -219,23 +239,21 @@ Use /quiz to start a quiz and select your examination type!
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show bot status and active quizzes."""
-    active_quizzes = 0
+    admin_cache_hit_rate = 0.0
     try:
-        from group import get_active_quizzes_count
-        active_quizzes = get_active_quizzes_count()
+        from group import get_admin_cache_stats
+        admin_cache_hit_rate = get_admin_cache_stats()['hit_rate']
     except ImportError:
         pass
     
+    # Runtime numbers come from the cached health snapshot
     status_text = (
         "📊 *Bot Status Report*\n\n"
-        f"• Active groups: {len(active_groups)}\n"
-        f"• Active quizzes: {active_quizzes}\n"
+        f"{health.render_status_lines()}"
+        f"• Admin cache hit rate: {admin_cache_hit_rate:.1%}\n"
         f"• Multi-group support: ✅ Enabled\n"
         f"• Admin-only mode: ✅ Enabled\n"
-        f"• Available Exams: ✅ 12th Board & UPSC CSE\n"
-        f"• Logging: ✅ Active\n"
-        f"• API Status: ✅ Connected\n\n"
-        "🤖 Bot is running smoothly with all enhanced features!"
+        f"• Available Exams: ✅ 12th Board & UPSC CSE"
     )
     await update.message.reply_text(status_text, parse_mode='Markdown')
     
@@ -253,10 +271,14 @@ async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await log.log_user_activity(update, context, activity)
     
     if chat_type == "private":
-        await update.message.reply_text(
-            "❌ Quizzes are only available in groups!\n\n"
-            "Please add me to a group and make me admin, then use /quiz in the group to start quizzes."
-        )
+        if personal:
+            # Self-paced practice from the local question bank
+            await personal.solo_quiz_command(update, context)
+        else:
+            await update.message.reply_text(
+                "❌ Quizzes are only available in groups!\n\n"
+                "Please add me to a group and make me admin, then use /quiz in the group to start quizzes."
+            )
     else:
         if group:
             try:
@@ -264,34 +286,41 @@ async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception as e:
                 logger.error(f"Error in group.group_quiz_command: {e}")
                 if log:
-                    await log.log_error(context, str(e), update)
+                    await log.log_error(context, str(e), update, exc=e)
                 await update.message.reply_text("❌ Group quiz functionality temporarily unavailable. Please try again later.")
         else:
             await update.message.reply_text("❌ Group module not available.")
 
 async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /stop command for group quizzes."""
-    if group:
+    """Handle /stop command for group quizzes (and solo practice in private chat)."""
+    if update.effective_chat.type == "private" and personal:
+        await personal.stop_solo_command(update, context)
+    elif group:
         try:
             await group.stop_command(update, context)
         except Exception as e:
             logger.error(f"Error in group.stop_command: {e}")
             if log:
-                await log.log_error(context, str(e), update)
+                await log.log_error(context, str(e), update, exc=e)
             await update.message.reply_text("❌ Stop command error occurred. Quiz may continue running.")
     else:
         await update.message.reply_text("❌ Group module not available.")
 
+async def answer_callback_query(query):
+    """Answer a callback query to stop the button's loading spinner."""
+    try:
+        await query.answer()
+    except Exception as e:
+        logger.error(f"Error answering callback query: {e}")
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks."""
     query = update.callback_query
     data = query.data
     
-    # Always answer the callback query first to prevent timeout
-    try:
-        await query.answer()
-    except Exception as e:
-        logger.error(f"Error answering callback query: {e}")
+    # Answer the callback query alongside the menu edit instead of before it,
+    # so a button press costs a single edit_message_text round trip
+    context.application.create_task(answer_callback_query(query), update=update)
     
     try:
         if data == 'help':
@@ -317,6 +346,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception as e:
                 logger.error(f"Error in UPSC subject selection: {e}")
                 await query.edit_message_text("❌ UPSC module error. Please try again.")
+        elif data.startswith('solo_') and personal:
+            await personal.handle_solo_callback(update, context)
         elif data == 'group_cancel' and group:
             await group.handle_group_cancel(update, context)
         else:
@@ -333,17 +364,24 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Error in button handler: {e}")
         if log:
-            await log.log_error(context, str(e), update)
+            await log.log_error(context, str(e), update, exc=e)
 
 async def poll_answer_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle poll answers."""
-    if group:
+    if personal and personal.is_solo_poll(update.poll_answer.poll_id):
+        try:
+            await personal.handle_solo_answer(update, context)
+        except Exception as e:
+            logger.error(f"Error in solo poll handler: {e}")
+            if log:
+                await log.log_error(context, str(e), update, exc=e)
+    elif group:
         try:
             await group.handle_poll_answer(update, context)
         except Exception as e:
             logger.error(f"Error in poll handler: {e}")
             if log:
-                await log.log_error(context, str(e), update)
+                await log.log_error(context, str(e), update, exc=e)
     else:
         logger.error("Group module not available for poll handling.")
 
@@ -355,12 +393,24 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     # Log error to channel
     if log:
         update_obj = update if isinstance(update, Update) else None
-        await log.log_error(context, str(context.error), update_obj)
+        await log.log_error(context, str(context.error), update_obj, exc=context.error)
 
 async def on_bot_start(application):
     """Callback when bot starts successfully."""
     logger.info("Bot started successfully! Sending startup log...")
+    global http_server
+    if METRICS_PORT and http_server is None:
+        http_server = webserver.start_server(application, int(METRICS_PORT))
+    health.start_health_monitor(application, active_groups)
+    profiler.start_profile_on_boot(application)
+    quality.start()
+    mastery.start()
+    scheduler.start(application)
+    calibrate.start()
+    if personal:
+        personal.start(application)
     if log:
+        log.start_log_pipeline(application.bot)
         try:
             # Create a minimal context for logging
             class MinimalContext:
@@ -386,10 +436,110 @@ async def on_bot_start(application):
                 f"• Ready for multiple groups\n"
                 f"• Logging system: Active"
             )
-            await log.send_log_to_channel(minimal_context, multi_group_msg, "SYSTEM STARTUP")
+            await log.send_log_to_channel(minimal_context, multi_group_msg, "SYSTEM STARTUP", event='system_startup')
         except Exception as e:
             logger.error(f"Error in startup logging: {e}")
 
+async def on_bot_stop(application):
+    """Callback when bot stops - flush queued channel logs while the bot can still send."""
+    global http_server
+    if http_server is not None:
+        http_server.stop()
+        http_server = None
+    await profiler.stop_profiler()
+    await health.stop_health_monitor()
+    await perplexity.close()
+    quality.shutdown()
+    await calibrate.stop()
+    await mastery.stop()
+    bank.close()
+    replay.stop_recorder()
+    if log:
+        await log.stop_log_pipeline()
+        log.eventlog.stop_event_log()
+
+async def run_webhook_server(application, port: int, webhook_url: str, secret_token: str):
+    """Serve the Telegram webhook and /metrics from one HTTP server until SIGINT/SIGTERM."""
+    global http_server
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    await application.initialize()
+    update_ingest = UpdateIngest(application)
+    update_ingest.start()
+    http_server = webserver.start_server(application, port, WEBHOOK_PATH, secret_token, update_ingest)
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            url=webhook_url,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=secret_token
+        )
+        await application.start()
+        await stop_event.wait()
+    finally:
+        await update_ingest.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+
+def build_application(token: str, request=None, base_url: str = None) -> Application:
+    """Create the Application with every handler registered.
+
+    `request` replaces the Bot API transport (replay.py passes a fake one) and
+    `base_url` the Bot API endpoint (simulate.py points it at fakebot.py)."""
+    # TimingRequest charges Bot API round trips to the update being handled;
+    # ChatUpdateProcessor keeps each chat in order while chats run in parallel
+    builder = (
+        Application.builder()
+        .token(token)
+        .request(request or TimingRequest(connection_pool_size=256))
+        .concurrent_updates(ChatUpdateProcessor())
+    )
+    base_url = base_url or TELEGRAM_API_URL
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    
+    # Optional capture of incoming updates for replay (RECORD_UPDATES)
+    replay.add_recorder(application)
+    
+    # Add handlers - every callback is counted, timed and split into API/generator/CPU time
+    instrument = instrument_handler
+    application.add_handler(CommandHandler("start", instrument("start", start)))
+    application.add_handler(CommandHandler("help", instrument("help", help_command)))
+    application.add_handler(CommandHandler("quiz", instrument("quiz", quiz_command)))
+    application.add_handler(CommandHandler("stop", instrument("stop", stop_command)))
+    application.add_handler(CommandHandler("subjects", instrument("subjects", subjects_command)))
+    application.add_handler(CommandHandler("status", instrument("status", status_command)))
+    application.add_handler(CommandHandler("health", instrument("health", health_check)))
+    application.add_handler(CommandHandler("schedule", instrument("schedule", scheduler.schedule_command)))
+    application.add_handler(CommandHandler("unschedule", instrument("unschedule", scheduler.unschedule_command)))
+    application.add_handler(CommandHandler("profile", instrument("profile", profiler.profile_command)))
+    # Owner-only bulk import (a CSV/JSONL document in private chat) and export of the question bank
+    application.add_handler(CommandHandler("export", instrument("export", bank_tool.export_command)))
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.ChatType.PRIVATE,
+                                           instrument("document", bank_tool.document_handler)))
+    application.add_handler(CallbackQueryHandler(instrument("button", button_handler)))
+    application.add_handler(PollAnswerHandler(instrument("poll_answer", poll_answer_handler)))
+    if group:
+        # Promotions/demotions invalidate the cached admin lists
+        application.add_handler(ChatMemberHandler(instrument("chat_member", group.handle_chat_member_update), ChatMemberHandler.ANY_CHAT_MEMBER))
+    metrics.register_runtime_gauges()
+    
+    # Add error handler
+    application.add_error_handler(error_handler)
+    
+    # Set post_init callback
+    application.post_init = on_bot_start
+    application.post_stop = on_bot_stop
+    return application
+
 def main():
     """Start the bot."""
     # Bot token check करें
@@ -402,29 +552,12 @@ def main():
     
     # Create the Application with JobQueue enabled
     try:
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        application = build_application(TELEGRAM_BOT_TOKEN)
         logger.info("Application created successfully with multi-group support")
     except Exception as e:
         logger.error(f"Failed to create application: {e}")
         return
     
-    # Add handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("quiz", quiz_command))
-    application.add_handler(CommandHandler("stop", stop_command))
-    application.add_handler(CommandHandler("subjects", subjects_command))
-    application.add_handler(CommandHandler("status", status_command))
-    application.add_handler(CommandHandler("health", health_check))
-    application.add_handler(CallbackQueryHandler(button_handler))
-    application.add_handler(PollAnswerHandler(poll_answer_handler))
-    
-    # Add error handler
-    application.add_error_handler(error_handler)
-    
-    # Set post_init callback
-    application.post_init = on_bot_start
-    
     # For Render deployment, use webhooks
     if "RENDER" in os.environ:
         # Webhook mode for production
@@ -432,18 +565,20 @@ def main():
             webhook_url = f"https://{WEBHOOK_URL}"
             logger.info(f"Starting webhook at {webhook_url} with multi-group support")
             
-            # Set webhook
-            application.run_webhook(
-                listen="0.0.0.0",
-                port=PORT,
-                url_path=WEBHOOK_PATH,
-                webhook_url=f"{webhook_url}{WEBHOOK_PATH}",
-                secret_token=os.environ.get("WEBHOOK_SECRET", "your-secret-token")
-            )
+            # Webhook and /metrics share one HTTP server on PORT
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(run_webhook_server(
+                application,
+                PORT,
+                f"{webhook_url}{WEBHOOK_PATH}",
+                os.environ.get("WEBHOOK_SECRET", "your-secret-token")
+            ))
         except Exception as e:
             logger.error(f"Failed to start webhook: {e}")
             # Fallback to polling if webhook fails
             logger.info("Falling back to polling mode...")
+            asyncio.set_event_loop(asyncio.new_event_loop())
             application.run_polling(allowed_updates=Update.ALL_TYPES)
     else:
         # Polling mode for development
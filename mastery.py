@@ -0,0 +1,177 @@
+# mastery.py
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import time
+
+import bank
+
+logger = logging.getLogger(__name__)
+
+# Answers are buffered and written to the bank in one transaction every MASTERY_FLUSH_SECONDS
+MASTERY_FLUSH_SECONDS = float(os.environ.get("MASTERY_FLUSH_SECONDS", 2))
+# Due review questions mixed into each group quiz (0 = off)
+GROUP_REVIEW_QUESTIONS = int(os.environ.get("GROUP_REVIEW_QUESTIONS", 5))
+
+# Leitner boxes: a right answer moves a question up one box, a wrong one back to box 0.
+# A question in box n is due again BOX_INTERVALS[n] seconds after it was answered.
+BOX_INTERVALS = (10 * 60, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600, 16 * 24 * 3600, 35 * 24 * 3600)
+
+# Groups are tracked like users under their (negative) chat id, one result per poll
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    user_id INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    exam TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    box INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    last_seen REAL,
+    due REAL NOT NULL,
+    PRIMARY KEY (user_id, question_id)
+) WITHOUT ROWID;
+-- The due queue of each user and subject: selection is a range scan, never a table scan
+CREATE INDEX IF NOT EXISTS progress_due ON progress (user_id, exam, subject, due);
+-- Highest question id already introduced to a user; newer bank questions are new to them
+CREATE TABLE IF NOT EXISTS new_cursor (
+    user_id INTEGER NOT NULL,
+    exam TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    last_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, exam, subject)
+) WITHOUT ROWID;
+"""
+
+_schema_ready = False
+# (user_id, question_id, exam, subject, correct, answered_at) waiting to be written
+_pending = []
+_flush_task = None
+
+def _db():
+    global _schema_ready
+    db = bank.get_db()
+    if not _schema_ready:
+        db.executescript(SCHEMA)
+        _schema_ready = True
+    return db
+
+def record_answer(user_id: int, question_id: int, exam: str, subject: str, correct: bool):
+    """Queue an answer; cheap enough for the poll answer hot path."""
+    _pending.append((user_id, question_id, exam, subject, correct, time.time()))
+
+def flush():
+    """Write queued answers to the bank in one transaction."""
+    global _pending
+    if not _pending:
+        return
+    batch, _pending = _pending, []
+    with bank.db_lock, _db() as db:
+        for user_id, question_id, exam, subject, correct, answered_at in batch:
+            row = db.execute("SELECT box FROM progress WHERE user_id = ? AND question_id = ?",
+                             (user_id, question_id)).fetchone()
+            box = min((row[0] + 1) if row else 1, len(BOX_INTERVALS) - 1) if correct else 0
+            db.execute(
+                "INSERT INTO progress (user_id, question_id, exam, subject, box, attempts, correct, last_seen, due) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (user_id, question_id) DO UPDATE SET box = excluded.box, attempts = attempts + 1, "
+                "correct = correct + excluded.correct, last_seen = excluded.last_seen, due = excluded.due",
+                (user_id, question_id, exam, subject, box, int(correct), answered_at, answered_at + BOX_INTERVALS[box]))
+
+async def _flush_periodically():
+    while True:
+        await asyncio.sleep(MASTERY_FLUSH_SECONDS)
+        try:
+            # Off the event loop: the transaction may wait on the disk
+            await asyncio.to_thread(flush)
+        except Exception as e:
+            logger.error(f"Could not write answer history: {e}")
+
+def start():
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_periodically())
+
+async def stop():
+    """Stop the periodic writer and write what is left."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    flush()
+
+def due_ids(user_id: int, exam: str, subject: str, limit: int, now: float = None) -> list:
+    """Questions due for review, most overdue first. Answers still buffered are not counted (at most
+    MASTERY_FLUSH_SECONDS behind), so the callers on the event loop never run the flush transaction."""
+    with bank.db_lock:
+        return [row[0] for row in _db().execute(
+            "SELECT question_id FROM progress WHERE user_id = ? AND exam = ? AND subject = ? AND due <= ? "
+            "ORDER BY due LIMIT ?", (user_id, exam, subject, now or time.time(), limit))]
+
+def select_questions(user_id: int, exam: str, subject: str, limit: int, now: float = None) -> list:
+    """Question ids for a user's next quiz: due reviews, then questions new to them, then the
+    ones coming due soonest. Every step is an index range scan bounded by `limit`."""
+    now = now or time.time()
+    selected = due_ids(user_id, exam, subject, limit, now)
+    with bank.db_lock, _db() as db:
+        if len(selected) < limit:
+            row = db.execute("SELECT last_id FROM new_cursor WHERE user_id = ? AND exam = ? AND subject = ?",
+                             (user_id, exam, subject)).fetchone()
+            new = [row[0] for row in db.execute(
+                "SELECT id FROM questions WHERE exam = ? AND subject = ? AND id > ? ORDER BY id LIMIT ?",
+                (exam, subject, row[0] if row else 0, limit - len(selected)))]
+            if new:
+                # Introduced now: due straight away, so unanswered ones come back as reviews
+                db.executemany(
+                    "INSERT OR IGNORE INTO progress (user_id, question_id, exam, subject, due) VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, question_id, exam, subject, now) for question_id in new])
+                db.execute("INSERT INTO new_cursor (user_id, exam, subject, last_id) VALUES (?, ?, ?, ?) "
+                           "ON CONFLICT (user_id, exam, subject) DO UPDATE SET last_id = excluded.last_id",
+                           (user_id, exam, subject, new[-1]))
+                selected.extend(new)
+        if len(selected) < limit:
+            # Everything is learned and nothing is due: practise what comes due next
+            chosen = set(selected)
+            for (question_id,) in db.execute(
+                    "SELECT question_id FROM progress WHERE user_id = ? AND exam = ? AND subject = ? AND due > ? "
+                    "ORDER BY due LIMIT ?", (user_id, exam, subject, now, limit)):
+                if question_id not in chosen and len(selected) < limit:
+                    selected.append(question_id)
+    return selected
+
+def record_group_poll(chat_id: int, exam: str, subject: str, question: dict, answered: int, right: int):
+    """One result per group poll: the group got it if most of those who answered did."""
+    if 'id' in question and answered:
+        record_answer(chat_id, question['id'], exam, subject, right * 2 >= answered)
+
+def group_review_questions(chat_id: int, exam: str, subject: str) -> list:
+    """Banked questions this group got wrong (or has not seen for a while) that are due again."""
+    if GROUP_REVIEW_QUESTIONS <= 0:
+        return []
+    questions = []
+    try:
+        for question_id in due_ids(chat_id, exam, subject, GROUP_REVIEW_QUESTIONS):
+            question = bank.get_question(question_id)
+            if question is not None:
+                questions.append(question)
+    except sqlite3.Error as e:
+        logger.error(f"Could not read review questions for chat {chat_id}: {e}")
+    return questions
+
+def with_group_reviews(chat_id: int, exam: str, subject: str, questions: list) -> list:
+    """The quiz with up to GROUP_REVIEW_QUESTIONS of its questions swapped for due reviews, at random places."""
+    known = {question.get('id') for question in questions}
+    reviews = [question for question in group_review_questions(chat_id, exam, subject) if question['id'] not in known]
+    reviews = reviews[:len(questions) // 2]
+    if not reviews:
+        return questions
+    mixed = questions[:len(questions) - len(reviews)]
+    for review in reviews:
+        mixed.insert(random.randint(0, len(mixed)), review)
+    return mixed
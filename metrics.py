@@ -0,0 +1,144 @@
+# metrics.py
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Metric updates happen on the bot's single event loop thread, so they are plain
+# dict/list operations with no locks. Rendering reads a snapshot of the same dicts.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# name -> metric; registering a name again replaces the old metric (gauges of a rebuilt Application)
+registry = {}
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        registry[name] = self
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+class Gauge:
+    """Gauge that is either set directly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.value = 0
+        registry[name] = self
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        value = self.value
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logger.error(f"Error reading gauge {self.name}: {e}")
+                return
+        yield f"{self.name} {value}"
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        registry[name] = self
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for key, series in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                bucket_label = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, bucket_label)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+def render() -> str:
+    """Render all registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+# Handlers
+HANDLER_UPDATES = Counter("quizbot_handler_updates_total", "Updates processed per handler", ("handler", "outcome"))
+HANDLER_LATENCY = Histogram("quizbot_handler_latency_seconds", "Handler wall time", ("handler",))
+
+# Question generation
+PERPLEXITY_REQUESTS = Counter("quizbot_perplexity_requests_total", "Perplexity API calls by outcome", ("exam", "outcome"))
+PERPLEXITY_LATENCY = Histogram("quizbot_perplexity_latency_seconds", "Perplexity API call latency", ("exam",),
+                               buckets=(0.5, 1, 2, 4, 8, 12, 16, 20, 30, 45, 60, 90))
+PERPLEXITY_HEDGES = Counter("quizbot_perplexity_hedges_total", "Hedged duplicate Perplexity requests", ("exam", "outcome"))
+
+# Polls
+SEND_POLL_LATENCY = Histogram("quizbot_send_poll_latency_seconds", "send_poll round trip time", ("exam",))
+SEND_POLL_ERRORS = Counter("quizbot_send_poll_errors_total", "send_poll failures", ("exam", "error"))
+
+def register_runtime_gauges():
+    """Register gauges that read live bot state at scrape time."""
+    try:
+        import group
+        Gauge("quizbot_active_sessions", "Active group quiz sessions", group.get_active_quizzes_count)
+        Gauge("quizbot_poll_answers", "Tracked polls in poll_answers", lambda: len(group.poll_answers))
+        Gauge("quizbot_admin_cache_hit_ratio", "Admin cache hit ratio", lambda: group.get_admin_cache_stats()['hit_rate'])
+    except ImportError:
+        pass
+    try:
+        import personal
+        Gauge("quizbot_solo_sessions", "Private self-paced quiz sessions", lambda: len(personal.user_quizzes))
+    except ImportError:
+        pass
+    try:
+        import perplexity
+        Gauge("quizbot_perplexity_in_flight", "Perplexity requests holding a concurrency slot", perplexity.get_in_flight)
+    except ImportError:
+        pass
+    try:
+        import log
+        Gauge("quizbot_log_queue_depth", "Log events waiting for the log channel", log.get_log_queue_depth)
+        Gauge("quizbot_log_events_dropped", "Log events shed because the queue was full", lambda: log.log_stats['dropped'])
+    except ImportError:
+        pass
@@ -0,0 +1,242 @@
+# perplexity.py
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PERPLEXITY_API_KEY = os.environ.get("PERPLEXITY_API_KEY")
+PERPLEXITY_API_URL = os.environ.get("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
+PERPLEXITY_TIMEOUT = float(os.environ.get("PERPLEXITY_TIMEOUT", 60))
+# Requests allowed in flight at once; the rest wait for a slot
+PERPLEXITY_MAX_CONCURRENT = int(os.environ.get("PERPLEXITY_MAX_CONCURRENT", 4))
+
+# Hedging - when a request outlives the HEDGE_PERCENTILE of recent latencies, send a duplicate
+# and use whichever answers first. Past PERPLEXITY_DEADLINE seconds give up and use fallbacks.
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 90))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+HEDGE_BUDGET_PER_HOUR = int(os.environ.get("HEDGE_BUDGET_PER_HOUR", 20))
+PERPLEXITY_DEADLINE = float(os.environ.get("PERPLEXITY_DEADLINE", 45))
+
+# Circuit breaker - after repeated failures skip the API and use fallback questions
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", 60))
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half_open after a cool-down -> closed on success."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            # Let one trial request through
+            self.state = "half_open"
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Perplexity circuit breaker opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """The request ended without an answer either way (cancelled, or an unexpected error): a
+        half_open trial goes back to open for another cool-down, or no request would ever be let through."""
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+_client = None
+_slots = None
+_in_flight = 0
+# Durations of recent successful requests, and when recent hedges were sent
+_latencies = deque(maxlen=200)
+_hedge_budget = deque()
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=PERPLEXITY_TIMEOUT)
+    return _client
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PERPLEXITY_MAX_CONCURRENT)
+    return _slots
+
+def get_in_flight() -> int:
+    """Requests currently holding a concurrency slot."""
+    return _in_flight
+
+async def close():
+    """Close the shared HTTP client."""
+    global _client, _slots
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _slots = None
+
+def hedge_delay():
+    """Seconds after which a request is slow enough to hedge, or None while there is too little history."""
+    if len(_latencies) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))]
+
+def _may_hedge(exam: str) -> bool:
+    """A hedge is a second paid request: only with a healthy API, a free slot and budget left."""
+    if breaker.state != 'closed' or _get_slots().locked():
+        return False
+    now = time.monotonic()
+    while _hedge_budget and now - _hedge_budget[0] > 3600:
+        _hedge_budget.popleft()
+    if len(_hedge_budget) >= HEDGE_BUDGET_PER_HOUR:
+        metrics.PERPLEXITY_HEDGES.inc(exam=exam, outcome='budget_exhausted')
+        return False
+    _hedge_budget.append(now)
+    return True
+
+async def _post(headers: dict, payload: dict) -> httpx.Response:
+    """One request, holding a concurrency slot while it is in flight."""
+    global _in_flight
+    # Cancelling the caller (/stop, cancel) aborts the request and frees the slot at once
+    async with _get_slots():
+        _in_flight += 1
+        started = time.perf_counter()
+        try:
+            response = await _get_client().post(PERPLEXITY_API_URL, headers=headers, json=payload)
+        finally:
+            _in_flight -= 1
+    if response.status_code == 200:
+        _latencies.append(time.perf_counter() - started)
+    return response
+
+async def _hedged_post(exam: str, headers: dict, payload: dict) -> httpx.Response:
+    """_post, duplicated once the first attempt passes hedge_delay(); the first 200 response wins.
+
+    Raises asyncio.TimeoutError after PERPLEXITY_DEADLINE seconds."""
+    deadline = time.monotonic() + PERPLEXITY_DEADLINE
+    primary = asyncio.create_task(_post(headers, payload))
+    attempts = [primary]
+    try:
+        delay = hedge_delay()
+        if delay is not None and delay < PERPLEXITY_DEADLINE:
+            await asyncio.wait(attempts, timeout=delay)
+            if not primary.done() and _may_hedge(exam):
+                metrics.PERPLEXITY_HEDGES.inc(exam=exam, outcome='sent')
+                logger.info(f"Perplexity request ({exam}) slower than {delay:.1f}s, sending a hedge")
+                attempts.append(asyncio.create_task(_post(headers, payload)))
+        last = None
+        while attempts:
+            remaining = deadline - time.monotonic()
+            done, _ = await asyncio.wait(attempts, timeout=max(0.0, remaining), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                attempts.remove(task)
+                last = task
+                if task.exception() is None and task.result().status_code == 200:
+                    if task is not primary:
+                        metrics.PERPLEXITY_HEDGES.inc(exam=exam, outcome='won')
+                    return task.result()
+        # Every attempt failed - report the last failure
+        return last.result()
+    finally:
+        # The losing (or abandoned) attempt is cancelled, which frees its slot
+        for task in attempts:
+            if task.done() and not task.cancelled():
+                task.exception()
+            task.cancel()
+
+def extract_questions(content: str):
+    """Pull the JSON array of questions out of the model's reply."""
+    start_idx = content.find('[')
+    end_idx = content.rfind(']') + 1
+    return json.loads(content[start_idx:end_idx])
+
+async def generate(exam: str, system_prompt: str, prompt: str):
+    """Ask Perplexity for quiz questions; returns the parsed list or None."""
+    if not PERPLEXITY_API_KEY:
+        metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='disabled')
+        return None
+    if not breaker.allow():
+        metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='breaker_open')
+        return None
+
+    headers = {
+        "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "model": "sonar",
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 4000,
+        "temperature": 0.7
+    }
+
+    started = time.perf_counter()
+    try:
+        response = await _hedged_post(exam, headers, payload)
+    except asyncio.CancelledError:
+        metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='cancelled')
+        breaker.record_abandoned()
+        raise
+    except asyncio.TimeoutError:
+        metrics.PERPLEXITY_LATENCY.observe(time.perf_counter() - started, exam=exam)
+        metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='deadline')
+        breaker.record_failure()
+        logger.error(f"Perplexity request ({exam}) missed the {PERPLEXITY_DEADLINE:.0f}s deadline, using fallback questions")
+        return None
+    except httpx.HTTPError as e:
+        metrics.PERPLEXITY_LATENCY.observe(time.perf_counter() - started, exam=exam)
+        metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='exception')
+        breaker.record_failure()
+        logger.error(f"Perplexity request failed ({exam}): {e!r}")
+        return None
+    except Exception:
+        breaker.record_abandoned()
+        raise
+    metrics.PERPLEXITY_LATENCY.observe(time.perf_counter() - started, exam=exam)
+
+    if response.status_code != 200:
+        metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='http_error')
+        breaker.record_failure()
+        logger.error(f"Perplexity API error ({exam}): {response.status_code} - {response.text[:200]}")
+        return None
+
+    # The API answered, so the breaker closes even if the content is unusable
+    breaker.record_success()
+    try:
+        content = response.json()['choices'][0]['message']['content']
+        questions = extract_questions(content)
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError):
+        metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='parse_error')
+        logger.error(f"Failed to parse JSON from Perplexity response ({exam})")
+        return None
+    metrics.PERPLEXITY_REQUESTS.inc(exam=exam, outcome='ok')
+    return questions
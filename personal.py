@@ -1,13 +1,50 @@
 # personal.py
+import asyncio
 import logging
+import os
 import random
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import time
+from array import array
+from collections import OrderedDict
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Poll
 from telegram.ext import ContextTypes
+from telegram.error import BadRequest, Forbidden
+
+import bank
+import group
+import mastery
 
 logger = logging.getLogger(__name__)
 
-# Store user data
-user_quizzes = {}
+# Self-paced private quizzes, served only from the local question bank
+SOLO_QUESTIONS = int(os.environ.get("SOLO_QUESTIONS", 10))
+# At most this many sessions are kept; idle ones are dropped after SOLO_IDLE_SECONDS
+SOLO_MAX_SESSIONS = int(os.environ.get("SOLO_MAX_SESSIONS", 10000))
+SOLO_IDLE_SECONDS = float(os.environ.get("SOLO_IDLE_SECONDS", 900))
+# How often idle sessions are swept in the background
+SOLO_SWEEP_SECONDS = float(os.environ.get("SOLO_SWEEP_SECONDS", 60))
+
+SOLO_EXAMS = {'12th': "12th Board Commerce", 'upsc': "UPSC CSE"}
+
+# Store user data: user_id -> SoloSession, least recently active first
+user_quizzes = OrderedDict()
+# poll_id -> user_id for the open poll of each solo session
+solo_polls = {}
+
+class SoloSession:
+    """Compact state of one private quiz: question ids only, questions are read from the bank when posted."""
+
+    __slots__ = ('exam', 'subject', 'question_ids', 'index', 'score', 'poll_id', 'correct_option', 'last_active')
+
+    def __init__(self, exam: str, subject: str, question_ids: list):
+        self.exam = exam
+        self.subject = subject
+        self.question_ids = array('L', question_ids)
+        self.index = 0
+        self.score = 0
+        self.poll_id = None
+        self.correct_option = None
+        self.last_active = time.monotonic()
 
 # Commerce subjects instead of Science
 fallback_questions = {
@@ -95,8 +132,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Admin-only quiz control\n"
         "• Multi-group support\n"
         "• Real-time logging\n\n"
-        "I'm designed to provide quizzes in groups only with admin privileges. "
-        "Add me to your group and make me admin to start quizzing!\n\n"
+        "Add me to your group and make me admin to run quizzes there, "
+        "or send /quiz here for self-paced solo practice!\n\n"
         "Select an option below:"
     )
     
@@ -105,7 +142,6 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
     """Handle main menu button clicks."""
     query = update.callback_query
-    await query.answer()
     
     if action == 'add_group':
         # Add to group information
@@ -143,6 +179,7 @@ async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, a
             "• Answer questions and track scores\n\n"
             "*Commands:*\n"
             "/quiz - Start a new quiz in a group (Admin only)\n"
+            "/quiz - Solo practice when sent in private chat\n"
             "/stop - Stop ongoing quiz (Admin only)\n"
             "/help - Show this help message\n"
             "/status - Check bot status\n\n"
@@ -153,21 +190,19 @@ async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, a
         await query.edit_message_text(text=text, reply_markup=reply_markup, parse_mode='Markdown')
     
     elif action == 'status':
-        # Status information
+        # Status information from the cached health snapshot
         try:
-            from group import get_active_quizzes_count
-            active_quizzes = get_active_quizzes_count()
+            from health import render_status_lines
+            runtime_lines = render_status_lines()
         except ImportError:
-            active_quizzes = 0
+            runtime_lines = ""
             
         text = (
             "📊 *Bot Status Report*\n\n"
-            f"• Active quizzes: {active_quizzes}\n"
+            f"{runtime_lines}"
             f"• Multi-group support: ✅ Enabled\n"
             f"• Admin-only mode: ✅ Enabled\n"
-            f"• Available Exams: ✅ 12th Board & UPSC CSE\n"
-            f"• Logging system: ✅ Active\n"
-            f"• Security: ✅ Enhanced\n\n"
+            f"• Available Exams: ✅ 12th Board & UPSC CSE\n\n"
             "🤖 Bot is running smoothly with all enhanced features!"
         )
         keyboard = [[InlineKeyboardButton("🔙 Back", callback_data='main_back')]]
@@ -221,3 +256,178 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
             text=f"{exam.upper()} exam preparation is fully supported! Use /quiz in a group to start.",
             reply_markup=reply_markup
         )
+
+def _end_solo_session(user_id: int):
+    session = user_quizzes.pop(user_id, None)
+    if session is not None and session.poll_id is not None:
+        solo_polls.pop(session.poll_id, None)
+    return session
+
+def _expire_solo_sessions():
+    """Drop idle sessions, and the least recently active ones past SOLO_MAX_SESSIONS."""
+    now = time.monotonic()
+    while user_quizzes:
+        user_id, session = next(iter(user_quizzes.items()))
+        if len(user_quizzes) <= SOLO_MAX_SESSIONS and now - session.last_active < SOLO_IDLE_SECONDS:
+            break
+        _end_solo_session(user_id)
+
+async def _sweep_solo_sessions(context: ContextTypes.DEFAULT_TYPE):
+    _expire_solo_sessions()
+
+def start(application):
+    """Sweep idle sessions periodically (on bot start), not only when a new one begins."""
+    application.job_queue.run_repeating(_sweep_solo_sessions, interval=SOLO_SWEEP_SECONDS, first=SOLO_SWEEP_SECONDS, name="solo_sweeper")
+
+def is_solo_poll(poll_id: str) -> bool:
+    return poll_id in solo_polls
+
+def _solo_exam_keyboard() -> InlineKeyboardMarkup:
+    keyboard = [[InlineKeyboardButton(label, callback_data=f'solo_exam_{exam}')] for exam, label in SOLO_EXAMS.items()]
+    return InlineKeyboardMarkup(keyboard)
+
+def _solo_subjects(exam: str) -> list:
+    if exam == 'upsc':
+        from upsc import upsc_subjects
+        subjects = list(upsc_subjects)
+    else:
+        subjects = list(quiz_topics)
+    return [subject for subject in subjects if bank.count(exam, subject)]
+
+async def solo_quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/quiz in private chat - pick an exam for a self-paced quiz."""
+    await update.message.reply_text(
+        "📝 *Solo Practice*\n\n"
+        f"Answer {SOLO_QUESTIONS} questions at your own pace - the next one comes as soon as you answer.\n\n"
+        "Choose an examination:",
+        parse_mode='Markdown',
+        reply_markup=_solo_exam_keyboard()
+    )
+
+async def handle_solo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Buttons of the solo practice menus (solo_exam_*, solo_subject_*, solo_back)."""
+    query = update.callback_query
+    data = query.data
+    
+    if data == 'solo_back':
+        await query.edit_message_text("📝 *Solo Practice*\n\nChoose an examination:", parse_mode='Markdown',
+                                      reply_markup=_solo_exam_keyboard())
+    
+    elif data.startswith('solo_exam_'):
+        exam = data[len('solo_exam_'):]
+        subjects = _solo_subjects(exam) if exam in SOLO_EXAMS else []
+        if not subjects:
+            await query.edit_message_text("❌ No practice questions available for this exam yet.")
+            return
+        keyboard = [[InlineKeyboardButton(subject, callback_data=f'solo_subject_{exam}_{subject}')] for subject in subjects]
+        keyboard.append([InlineKeyboardButton("🔙 Back", callback_data='solo_back')])
+        await query.edit_message_text(
+            f"📚 *{SOLO_EXAMS[exam]} - Select Subject:*",
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    elif data.startswith('solo_subject_'):
+        exam, _, subject = data[len('solo_subject_'):].partition('_')
+        await start_solo_quiz(update, context, exam, subject)
+
+async def start_solo_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, exam: str, subject: str):
+    """Start (or restart) a user's private quiz and post the first question."""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    
+    # Due reviews first, then questions new to this user (spaced repetition); the selection
+    # writes the newly introduced questions, so it runs off the event loop
+    question_ids = []
+    if exam in SOLO_EXAMS:
+        question_ids = await asyncio.to_thread(mastery.select_questions, user_id, exam, subject, SOLO_QUESTIONS)
+    if not question_ids:
+        await query.edit_message_text("❌ No practice questions available for this subject yet.")
+        return
+    
+    _end_solo_session(user_id)
+    _expire_solo_sessions()
+    session = user_quizzes[user_id] = SoloSession(exam, subject, question_ids)
+    
+    await query.edit_message_text(
+        f"✅ *{subject} practice started!*\n\n"
+        f"• {len(question_ids)} questions, answer at your own pace\n"
+        f"• Use /stop to finish early",
+        parse_mode='Markdown'
+    )
+    
+    try:
+        import log
+        await log.log_user_activity(update, context, f"Started solo {SOLO_EXAMS[exam]} {subject} practice")
+    except ImportError:
+        pass
+    
+    await post_solo_question(context.bot, user_id, session)
+
+async def post_solo_question(bot, user_id: int, session: SoloSession):
+    """Post the session's next question, or the result once all are answered."""
+    while session.index < len(session.question_ids):
+        question = bank.get_question(session.question_ids[session.index])
+        if question is None:
+            # Removed from the bank since the session started
+            session.index += 1
+            continue
+        try:
+            message = await bot.send_poll(
+                chat_id=user_id,
+                question=f"❓ {session.index + 1}/{len(session.question_ids)}: {question['question']}",
+                options=question['options'],
+                type=Poll.QUIZ,
+                correct_option_id=question['correct_answer'],
+                explanation=group.poll_explanation(question),
+                is_anonymous=False
+            )
+        except (BadRequest, Forbidden) as e:
+            logger.error(f"Error sending solo question to {user_id}: {e}")
+            if isinstance(e, Forbidden):
+                # The user blocked the bot
+                _end_solo_session(user_id)
+                return
+            session.index += 1
+            continue
+        session.poll_id = message.poll.id
+        session.correct_option = question['correct_answer']
+        solo_polls[session.poll_id] = user_id
+        return
+    
+    _end_solo_session(user_id)
+    await bot.send_message(
+        chat_id=user_id,
+        text=f"🎉 *Practice complete!*\n\nYou scored *{session.score}/{len(session.question_ids)}* in {session.subject}.\n"
+             f"Use /quiz to practise again.",
+        parse_mode='Markdown'
+    )
+
+async def handle_solo_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Score a solo poll answer and post the next question straight away."""
+    answer = update.poll_answer
+    user_id = solo_polls.pop(answer.poll_id, None)
+    session = user_quizzes.get(user_id)
+    if session is None or answer.user.id != user_id:
+        return
+    
+    correct = bool(answer.option_ids) and answer.option_ids[0] == session.correct_option
+    if correct:
+        session.score += 1
+    mastery.record_answer(user_id, session.question_ids[session.index], session.exam, session.subject, correct)
+    session.index += 1
+    session.poll_id = None
+    session.last_active = time.monotonic()
+    user_quizzes.move_to_end(user_id)
+    
+    await post_solo_question(context.bot, user_id, session)
+
+async def stop_solo_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stop in private chat - end the user's practice with their score so far."""
+    session = _end_solo_session(update.effective_user.id)
+    if session is None:
+        await update.message.reply_text("❌ You have no practice quiz running. Use /quiz to start one.")
+        return
+    await update.message.reply_text(
+        f"✅ Practice stopped. You scored {session.score}/{session.index} in {session.subject}."
+    )
@@ -0,0 +1,129 @@
+# prefetch.py
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import Counter, deque
+
+import instrument
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Speculative generations started while an admin is still in the subject menu
+PREFETCH_SUBJECTS = int(os.environ.get("PREFETCH_SUBJECTS", 2))
+PREFETCH_BUDGET_PER_HOUR = int(os.environ.get("PREFETCH_BUDGET_PER_HOUR", 30))
+# Unclaimed results are dropped after this many seconds
+PREFETCH_TTL = float(os.environ.get("PREFETCH_TTL", 600))
+
+PREFETCH_EVENTS = metrics.Counter("quizbot_prefetch_total", "Speculative question generations by outcome", ("exam", "outcome"))
+
+# chat_id -> Counter of (exam, subject) picks; all chats together for groups without history
+subject_history = {}
+global_history = Counter()
+# chat_id -> {(exam, subject): {'task': asyncio.Task, 'expiry': TimerHandle dropping it after PREFETCH_TTL}}
+_speculative = {}
+_budget = deque()
+
+def record_pick(chat_id: int, exam: str, subject: str):
+    """Remember a group's subject choice for future predictions."""
+    subject_history.setdefault(chat_id, Counter())[(exam, subject)] += 1
+    global_history[(exam, subject)] += 1
+
+def predict_subjects(chat_id: int, exam: str, limit: int = PREFETCH_SUBJECTS) -> list:
+    """Most likely subjects for this group: its own history first, then everyone's."""
+    predicted = []
+    for history in (subject_history.get(chat_id, Counter()), global_history):
+        for (picked_exam, subject), _ in history.most_common():
+            if picked_exam == exam and subject not in predicted:
+                predicted.append(subject)
+            if len(predicted) >= limit:
+                return predicted
+    return predicted
+
+def _take_budget() -> bool:
+    now = time.monotonic()
+    while _budget and now - _budget[0] > 3600:
+        _budget.popleft()
+    if len(_budget) >= PREFETCH_BUDGET_PER_HOUR:
+        return False
+    _budget.append(now)
+    return True
+
+def _discard(chat_id: int):
+    """Cancel a chat's speculative generations and forget their results."""
+    for (exam, _), entry in _speculative.pop(chat_id, {}).items():
+        entry['task'].cancel()
+        entry['expiry'].cancel()
+        PREFETCH_EVENTS.inc(exam=exam, outcome='wasted')
+
+def _expire(chat_id: int, key: tuple, task: asyncio.Task):
+    """PREFETCH_TTL passed without a claim: free the speculation (and its questions)."""
+    entries = _speculative.get(chat_id, {})
+    entry = entries.get(key)
+    if entry is None or entry['task'] is not task:
+        return
+    del entries[key]
+    if not entries:
+        del _speculative[chat_id]
+    task.cancel()
+    PREFETCH_EVENTS.inc(exam=key[0], outcome='expired')
+
+def start(chat_id: int, exam: str, generate):
+    """Start background generation for the likely subjects of a group.
+
+    `generate(subject)` returns the coroutine the subject click would otherwise run."""
+    _discard(chat_id)
+    try:
+        import perplexity
+        if not perplexity.PERPLEXITY_API_KEY or perplexity.breaker.state != 'closed':
+            # Fallback questions are instant, nothing to win
+            return
+    except ImportError:
+        return
+    for subject in predict_subjects(chat_id, exam):
+        if not _take_budget():
+            PREFETCH_EVENTS.inc(exam=exam, outcome='budget_exhausted')
+            break
+        # A fresh context so the time is not charged to the menu click that started it
+        task = asyncio.create_task(generate(subject), context=contextvars.Context())
+        expiry = asyncio.get_running_loop().call_later(PREFETCH_TTL, _expire, chat_id, (exam, subject), task)
+        _speculative.setdefault(chat_id, {})[(exam, subject)] = {'task': task, 'expiry': expiry}
+        PREFETCH_EVENTS.inc(exam=exam, outcome='started')
+        logger.info(f"Prefetching {exam} {subject} questions for chat {chat_id}")
+
+async def claim(chat_id: int, exam: str, subject: str):
+    """Questions for the subject the admin clicked, from an in-flight or finished speculative
+    generation (other speculations for the chat are cancelled). Returns (found, questions);
+    found is False when there was none or it failed, so the caller generates itself."""
+    entry = _speculative.get(chat_id, {}).pop((exam, subject), None)
+    _discard(chat_id)
+    if entry is None:
+        PREFETCH_EVENTS.inc(exam=exam, outcome='miss')
+        return False, None
+    entry['expiry'].cancel()
+    started = time.perf_counter()
+    try:
+        questions = await entry['task']
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            # The click itself was cancelled (e.g. /stop), not just the speculation
+            raise
+        PREFETCH_EVENTS.inc(exam=exam, outcome='miss')
+        return False, None
+    except Exception as e:
+        logger.error(f"Prefetched generation failed for chat {chat_id}: {e}")
+        questions = None
+    finally:
+        instrument.add_time('generator', time.perf_counter() - started, 'prefetch')
+    if not questions:
+        # Not a hit: the click gets a real attempt of its own
+        PREFETCH_EVENTS.inc(exam=exam, outcome='failed')
+        return False, None
+    PREFETCH_EVENTS.inc(exam=exam, outcome='hit')
+    return True, questions
+
+def cancel(chat_id: int):
+    """The admin went back or cancelled: drop the chat's speculative generations."""
+    _discard(chat_id)
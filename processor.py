@@ -0,0 +1,109 @@
+# processor.py
+import asyncio
+import logging
+import os
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Updates of different chats run in parallel up to this limit
+MAX_CONCURRENT_UPDATES = int(os.environ.get("MAX_CONCURRENT_UPDATES", 32))
+# Updates accepted from the fetcher (running + waiting for their chat's turn)
+MAX_PENDING_UPDATES = int(os.environ.get("MAX_PENDING_UPDATES", 4096))
+
+# Updates that end what the chat is doing (e.g. a quiz start awaiting its questions) skip the
+# chat's queue: in order, they would only get their turn once there is nothing left to stop
+UNORDERED_COMMANDS = ('/stop',)
+UNORDERED_CALLBACKS = ('group_cancel',)
+
+def is_unordered(update: object) -> bool:
+    if not isinstance(update, Update):
+        return False
+    if update.callback_query is not None:
+        return update.callback_query.data in UNORDERED_CALLBACKS
+    text = (update.message.text or "") if update.message is not None else ""
+    return text.split('@', 1)[0].split(' ', 1)[0] in UNORDERED_COMMANDS
+
+def chat_key(update: object):
+    """Ordering key of an update: its chat, or for poll answers the chat the poll was posted in."""
+    if not isinstance(update, Update):
+        return None
+    if update.poll_answer is not None:
+        try:
+            import group
+            poll_data = group.poll_answers.get(update.poll_answer.poll_id)
+            if poll_data:
+                return poll_data['chat_id']
+        except ImportError:
+            pass
+        # Unknown poll - keep the user's own answers in order
+        return ('user', update.poll_answer.user.id) if update.poll_answer.user else None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return ('user', update.effective_user.id)
+    return None
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of one chat strictly in arrival order while different chats
+    run concurrently, with at most `max_concurrent` handlers running at once.
+    /stop and cancel buttons are the exception, they run straight away (outside the limit too).
+
+    The base class semaphore only bounds how many updates may wait here; the running
+    limit is applied after the chat lock so a busy chat cannot occupy every slot
+    while its own updates queue behind each other."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_UPDATES, max_pending: int = MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending, max_concurrent))
+        self.max_concurrent = max_concurrent
+        self._slots = None
+        self._chat_locks = {}
+        self._chat_pending = {}
+        self.pending = 0
+        # Set whenever an update finishes; ingest waits on it for room
+        self.update_done = asyncio.Event()
+
+    async def initialize(self):
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+
+    async def shutdown(self):
+        self._chat_locks.clear()
+        self._chat_pending.clear()
+
+    async def do_process_update(self, update, coroutine):
+        if self._slots is None:
+            await self.initialize()
+        unordered = is_unordered(update)
+        key = None if unordered else chat_key(update)
+        self.pending += 1
+        try:
+            if unordered:
+                # Not behind the slots either: quiz starts hold those while their questions are generated
+                await coroutine
+                return
+            if key is None:
+                async with self._slots:
+                    await coroutine
+                return
+
+            lock = self._chat_locks.get(key)
+            if lock is None:
+                lock = self._chat_locks[key] = asyncio.Lock()
+            self._chat_pending[key] = self._chat_pending.get(key, 0) + 1
+            try:
+                async with lock:
+                    async with self._slots:
+                        await coroutine
+            finally:
+                remaining = self._chat_pending[key] - 1
+                if remaining:
+                    self._chat_pending[key] = remaining
+                else:
+                    # Last update of this chat - drop its lock so idle chats cost nothing
+                    del self._chat_pending[key]
+                    del self._chat_locks[key]
+        finally:
+            self.pending -= 1
+            self.update_done.set()
@@ -0,0 +1,164 @@
+# profiler.py
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Telegram user id allowed to run /profile
+OWNER_ID = int(os.environ.get("OWNER_ID", 0)) or None
+# Profile this many seconds right after start-up (0 = off)
+PROFILE_ON_START = float(os.environ.get("PROFILE_ON_START", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join("logs", "profiles"))
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+TOP_N = 25
+# The event loop waiting in the selector is idle time, not a hot spot
+IDLE_MARKERS = ("'poll' of", "'select' of", "'control' of", "select.select")
+
+# Nothing is hooked in until a window starts, so there is no cost while idle
+_active = None
+_task = None
+
+def is_running() -> bool:
+    return _active is not None
+
+class ProfileWindow:
+    """cProfile for CPU hot spots plus tracemalloc for allocations over one time window."""
+
+    def __init__(self, seconds: float, requested_by: str):
+        self.seconds = seconds
+        self.requested_by = requested_by
+        self.profile = cProfile.Profile()
+        self.started_at = time.time()
+        self.started_tracemalloc = False
+        self.baseline = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.baseline = tracemalloc.take_snapshot()
+        self.profile.enable()
+
+    def stop(self):
+        """Stop collecting; returns (report text, summary lines)."""
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+        stats = pstats.Stats(self.profile)
+        report = io.StringIO()
+        report.write(f"Profile window of {self.seconds:.0f}s started {time.ctime(self.started_at)} by {self.requested_by}\n\n")
+        for sort_key in ('tottime', 'cumulative'):
+            report.write(f"=== CPU: top {TOP_N} by {sort_key} ===\n")
+            stats.stream = report
+            stats.sort_stats(sort_key).print_stats(TOP_N)
+        allocations = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )).compare_to(self.baseline, 'lineno')
+        report.write(f"=== Allocations: top {TOP_N} by growth (traced now {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB) ===\n")
+        for stat in allocations[:TOP_N]:
+            report.write(f"{stat}\n")
+
+        summary = []
+        busy = [item for item in stats.stats.items() if not any(marker in item[0][2] for marker in IDLE_MARKERS)]
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in sorted(
+                busy, key=lambda item: item[1][2], reverse=True)[:5]:
+            summary.append(f"• `{function}` ({os.path.basename(filename)}:{line}) {tottime * 1000:.0f} ms self, {calls} calls")
+        summary.append("")
+        for stat in allocations[:5]:
+            frame = stat.traceback[0]
+            summary.append(f"• `{os.path.basename(frame.filename)}:{frame.lineno}` +{stat.size_diff / 1024:.0f} KiB ({stat.count_diff:+d} blocks)")
+        return report.getvalue(), summary
+
+    def write(self, report: str) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S.txt", time.localtime(self.started_at)))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(report)
+        return path
+
+async def _run_window(window: ProfileWindow, bot=None, reply_chat_id: int = None):
+    global _active, _task
+    try:
+        await asyncio.sleep(window.seconds)
+    except asyncio.CancelledError:
+        # Shutting down - still report what was collected
+        window.seconds = time.time() - window.started_at
+    report, summary = window.stop()
+    _active = None
+    _task = None
+    try:
+        path = window.write(report)
+    except OSError as e:
+        logger.error(f"Could not write profile report: {e}")
+        path = None
+    logger.info(f"Profile window finished, report at {path}")
+    try:
+        import log
+        await log.log_profile_report(window.seconds, summary, path)
+    except ImportError:
+        pass
+    if bot is not None and reply_chat_id is not None:
+        text = (f"🔬 *Profile finished* ({window.seconds:.0f}s)\n\n" + "\n".join(summary) +
+                f"\n\nReport: `{path}`")
+        try:
+            await bot.send_message(chat_id=reply_chat_id, text=text, parse_mode='Markdown')
+        except Exception as e:
+            logger.error(f"Could not send profile summary: {e}")
+
+def start_profile(application, seconds: float, requested_by: str, reply_chat_id: int = None) -> bool:
+    """Start a profiling window; False if one is already running."""
+    global _active, _task
+    if _active is not None:
+        return False
+    _active = ProfileWindow(min(seconds, PROFILE_MAX_SECONDS), requested_by)
+    _active.start()
+    logger.info(f"Profiling for {_active.seconds:.0f}s (requested by {requested_by})")
+    # Not application.create_task: Application.stop() would wait out the whole window
+    _task = asyncio.create_task(_run_window(_active, application.bot, reply_chat_id))
+    return True
+
+async def stop_profiler():
+    """End a running window early (on shutdown); its report is still written."""
+    if _task is not None:
+        task = _task
+        task.cancel()
+        await task
+
+def start_profile_on_boot(application):
+    """Honour PROFILE_ON_START."""
+    if PROFILE_ON_START > 0:
+        start_profile(application, PROFILE_ON_START, "PROFILE_ON_START")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [seconds] - owner only."""
+    if OWNER_ID is None or update.effective_user.id != OWNER_ID:
+        # Stay silent so the command is not discoverable
+        return
+    try:
+        seconds = float(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+    if seconds <= 0:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+    if not start_profile(context.application, seconds, f"user {update.effective_user.id}", update.effective_chat.id):
+        await update.message.reply_text("⏳ A profile is already running.")
+        return
+    await update.message.reply_text(
+        f"🔬 Profiling for {min(seconds, PROFILE_MAX_SECONDS):.0f}s. The summary will be posted here and to the log channel."
+    )
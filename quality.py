@@ -0,0 +1,187 @@
+# quality.py
+import asyncio
+import difflib
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for question checks (they are CPU bound and would stall the event loop)
+QUALITY_WORKERS = int(os.environ.get("QUALITY_WORKERS", 1))
+# A generated batch with fewer usable questions than this is treated as a failed generation
+QUALITY_MIN_QUESTIONS = int(os.environ.get("QUALITY_MIN_QUESTIONS", 10))
+
+# Telegram poll limits (UTF-16 code units)
+MAX_QUESTION_LENGTH = 300
+MAX_OPTION_LENGTH = 100
+# The longest number prefix a quiz puts before the question text (UPSC group polls)
+QUESTION_PREFIX = "🎯 UPSC 99/99: "
+# Questions at least this similar to an earlier one in the batch are near-duplicates
+DUPLICATE_RATIO = 0.9
+# Share of letters outside the Latin script above which a question is not in English
+MAX_NON_LATIN = 0.3
+
+PROFANITY = ("fuck", "fucking", "shit", "bitch", "bastard", "asshole", "dick", "cunt", "slut", "whore", "crap", "damn")
+
+QUESTION_CHECKS = metrics.Counter("quizbot_question_checks_total", "Generated questions by quality verdict", ("exam", "outcome"))
+
+_NUMBERING = re.compile(r"^\s*(?:q(?:uestion)?\s*)?\d+\s*[.):-]\s*", re.IGNORECASE)
+_NON_WORD = re.compile(r"[^\w\s]")
+_PROFANITY = frozenset(PROFANITY)
+_WORD = re.compile(r"\w+")
+# "option c is correct", "the correct answer is (b)", "answer: a." - a bare letter needs punctuation
+# after it so "the answer is a company" does not count
+_ANSWER_LETTER = re.compile(r"\boption\s*\(?([a-d])\)?(?![\w'])|\banswer\s*(?:is|:)\s*(?:\(([a-d])\)|([a-d])(?=[.,;:)]|$))",
+                            re.IGNORECASE)
+
+_executor = None
+
+def telegram_length(text: str) -> int:
+    """Length as Telegram limits count it: UTF-16 code units (an emoji is usually two)."""
+    return len(text.encode('utf-16-le')) // 2
+
+def _normalise(text: str) -> str:
+    text = _NUMBERING.sub("", text.lower())
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+def _shingles(text: str) -> set:
+    return {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+
+def _option_key(option: str) -> str:
+    # Symbols stay: "Assets = Liabilities + Equity" and "... - Equity" are different options
+    return " ".join(option.lower().split()).strip(".,;:")
+
+def _non_latin_share(text: str) -> float:
+    if text.isascii():
+        return 0.0
+    letters = [char for char in text if char.isalpha()]
+    if not letters:
+        return 0.0
+    return sum(1 for char in letters if ord(char) > 0x24F) / len(letters)
+
+def _structure_problem(question) -> str:
+    if not isinstance(question, dict):
+        return "malformed"
+    text, options, answer = question.get('question'), question.get('options'), question.get('correct_answer')
+    if not isinstance(text, str) or not text.strip():
+        return "missing_question"
+    if not isinstance(options, list) or len(options) < 2 or not all(isinstance(o, str) and o.strip() for o in options):
+        return "bad_options"
+    if not isinstance(answer, int) or isinstance(answer, bool) or not 0 <= answer < len(options):
+        return "bad_answer_index"
+    if (telegram_length(text) > MAX_QUESTION_LENGTH - telegram_length(QUESTION_PREFIX)
+            or any(telegram_length(o) > MAX_OPTION_LENGTH for o in options)):
+        return "too_long"
+    return None
+
+def _options_problem(options: list) -> str:
+    normalised = [_option_key(option) for option in options]
+    if len(set(normalised)) < len(normalised):
+        return "duplicate_options"
+    for i, option in enumerate(normalised):
+        for j, other in enumerate(normalised):
+            # Short options ("A", "10") legitimately appear inside longer ones
+            if i != j and len(option) >= 4 and option in other:
+                return "option_substring"
+    return None
+
+def _explanation_problem(question: dict) -> str:
+    explanation = question.get('explanation') or ""
+    if not isinstance(explanation, str) or not explanation:
+        return None
+    options, answer = question['options'], question['correct_answer']
+    letters = {letter.lower() for match in _ANSWER_LETTER.findall(explanation) for letter in match if letter}
+    if letters and answer < 4 and "abcd"[answer] not in letters:
+        return "explanation_mismatch"
+    # The explanation names exactly one option and it is not the marked one
+    lowered = explanation.lower()
+    named = [i for i, option in enumerate(options) if len(option) >= 4 and option.lower() in lowered]
+    if len(named) == 1 and named[0] != answer:
+        return "explanation_mismatch"
+    return None
+
+def question_problem(question) -> str:
+    """The first check a single question fails (the reason), or None if it is usable."""
+    reason = _structure_problem(question)
+    if reason is not None:
+        return reason
+    text = " ".join([question['question'], *question['options'], str(question.get('explanation') or "")])
+    # A set lookup per word is twice as fast as one alternation regex over the text
+    if not _PROFANITY.isdisjoint(_WORD.findall(text.lower())):
+        return "profanity"
+    if max(_non_latin_share(question['question']), _non_latin_share(" ".join(question['options']))) > MAX_NON_LATIN:
+        return "language"
+    return _options_problem(question['options']) or _explanation_problem(question)
+
+def check_batch(questions: list) -> tuple:
+    """Run every check over a generated batch (in a worker process).
+
+    Returns (accepted questions, [(question, reason), ...] rejected)."""
+    accepted, rejected = [], []
+    seen = []
+    for question in questions:
+        reason = question_problem(question)
+        if reason is None:
+            normalised = _normalise(question['question'])
+            shingles = _shingles(normalised)
+            for other, other_shingles in seen:
+                # Cheap shingle overlap first, the exact ratio only for likely matches
+                overlap = len(shingles & other_shingles) / len(shingles | other_shingles)
+                if overlap >= 0.5 and difflib.SequenceMatcher(None, normalised, other).ratio() >= DUPLICATE_RATIO:
+                    reason = "near_duplicate"
+                    break
+            else:
+                seen.append((normalised, shingles))
+        if reason is None:
+            accepted.append(question)
+        else:
+            rejected.append((question, reason))
+    return accepted, rejected
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=QUALITY_WORKERS)
+    return _executor
+
+def start():
+    """Start the worker processes now so the first quiz does not pay for it."""
+    _get_executor().submit(check_batch, [])
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def check(questions: list) -> tuple:
+    """check_batch in the process pool; (accepted, rejected)."""
+    global _executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_executor(), check_batch, questions)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next batch and let this one through unchecked
+        logger.error("Question quality pool broke, batch not checked")
+        _executor = None
+        return list(questions), []
+
+async def filter_questions(exam: str, questions):
+    """Quality stage for generated questions: the accepted ones, or None when too few survive."""
+    if not questions:
+        return questions
+    accepted, rejected = await check(questions)
+    QUESTION_CHECKS.inc(len(accepted), exam=exam, outcome='accepted')
+    for question, reason in rejected:
+        QUESTION_CHECKS.inc(exam=exam, outcome=reason)
+    if rejected:
+        reasons = ", ".join(sorted({reason for _, reason in rejected}))
+        logger.info(f"Rejected {len(rejected)}/{len(questions)} generated {exam} questions ({reasons})")
+    if len(accepted) < min(QUALITY_MIN_QUESTIONS, len(questions)):
+        return None
+    return accepted
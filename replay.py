@@ -0,0 +1,287 @@
+# replay.py
+"""Record incoming updates and replay them against a fake Bot API.
+
+Recording is switched on with RECORD_UPDATES=<capture file>; replaying runs offline:
+
+    python replay.py capture.jsonl.gz --speed max --api-latency 0.05 --json after.json
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import secrets
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+logger = logging.getLogger(__name__)
+
+RECORD_UPDATES = os.environ.get("RECORD_UPDATES")
+# Replace ids, names and free text in captures (`1` or `0`)
+RECORD_ANONYMISE = os.environ.get("RECORD_ANONYMISE", "1") == "1"
+
+NAME_KEYS = ('first_name', 'last_name', 'username', 'title')
+
+class Anonymiser:
+    """Consistently replaces user/chat ids (keeping their sign) and drops personal text."""
+
+    def __init__(self, salt: bytes = None):
+        self.salt = salt or secrets.token_bytes(16)
+
+    def id(self, value: int) -> int:
+        digest = hashlib.sha256(self.salt + str(abs(value)).encode()).digest()
+        fake = int.from_bytes(digest[:6], 'big') % 10**12 + 1
+        return -fake if value < 0 else fake
+
+    def text(self, value: str) -> str:
+        # Commands (and their arguments) drive the handlers, so they are kept
+        return value if value.startswith('/') else "x" * len(value)
+
+    def scrub(self, data):
+        if isinstance(data, list):
+            return [self.scrub(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        # Users and chats have int ids; polls also have a 'type' but a string id
+        is_peer = isinstance(data.get('id'), int) and ('is_bot' in data or 'type' in data)
+        scrubbed = {}
+        for key, value in data.items():
+            if is_peer and key == 'id':
+                scrubbed[key] = self.id(value)
+            elif key in NAME_KEYS and isinstance(value, str):
+                scrubbed[key] = f"{key}_{abs(self.id(data['id'] if is_peer else 0)) % 10000}"
+            elif key in ('chat_id', 'user_id') and isinstance(value, int):
+                scrubbed[key] = self.id(value)
+            elif key in ('text', 'caption') and isinstance(value, str):
+                scrubbed[key] = self.text(value)
+            else:
+                scrubbed[key] = self.scrub(value)
+        return scrubbed
+
+class UpdateRecorder:
+    """Appends every update to a gzip JSONL capture: {"t": arrival time, "update": ..., "chat_id": ...}.
+
+    Poll answers carry no chat, so the chat the poll was posted in is stored alongside
+    for the replayer to map them onto the polls it creates."""
+
+    def __init__(self, path: str, anonymise: bool = RECORD_ANONYMISE):
+        self.path = path
+        self.anonymiser = Anonymiser() if anonymise else None
+        self.recorded = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+
+    def record(self, update: Update):
+        entry = {'t': time.time(), 'update': update.to_dict()}
+        if update.poll_answer is not None:
+            try:
+                import group
+                poll_data = group.poll_answers.get(update.poll_answer.poll_id)
+                if poll_data:
+                    entry['chat_id'] = poll_data['chat_id']
+            except ImportError:
+                pass
+        if self.anonymiser:
+            entry = self.anonymiser.scrub(entry)
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.recorded += 1
+
+    def close(self):
+        self._file.close()
+
+_recorder = None
+
+async def _record_update(update: Update, context):
+    if _recorder is not None:
+        try:
+            _recorder.record(update)
+        except Exception as e:
+            logger.error(f"Could not record update {update.update_id}: {e}")
+
+def add_recorder(application, path: str = RECORD_UPDATES):
+    """Record every update before the handlers see it (no-op unless RECORD_UPDATES is set)."""
+    global _recorder
+    if not path or _recorder is not None:
+        return
+    _recorder = UpdateRecorder(path)
+    application.add_handler(TypeHandler(Update, _record_update), group=-1)
+    logger.info(f"Recording updates to {path} (anonymised: {_recorder.anonymiser is not None})")
+
+def stop_recorder():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        logger.info(f"Recorded {_recorder.recorded} updates to {_recorder.path}")
+        _recorder = None
+
+def load_capture(path: str) -> list:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarise_handlers(samples: dict, errors: dict) -> dict:
+    """Per-handler count, errors and latency percentiles from lists of wall times (seconds)."""
+    handlers = {}
+    for handler, values in sorted(samples.items()):
+        values = sorted(values)
+        handlers[handler] = {
+            'count': len(values),
+            'errors': errors.get(handler, 0),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    return handlers
+
+def format_handler_table(handlers: dict) -> list:
+    lines = [f"{'handler':<14}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for handler, stats in handlers.items():
+        lines.append(
+            f"{handler:<14}{stats['count']:>8}{stats['errors']:>8}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+        )
+    return lines
+
+def format_api_calls(calls: dict) -> str:
+    return ", ".join(f"{method}×{count}" for method, count in sorted(calls.items())) or "none"
+
+def _remap_poll_answer(data: dict, chat_id, api):
+    """Point a recorded poll answer at the poll the replayed quiz posted in that chat."""
+    poll_id = api.last_poll.get(chat_id)
+    if poll_id is not None:
+        data = dict(data, poll_answer=dict(data['poll_answer'], poll_id=poll_id))
+    return data
+
+async def wait_idle(application, timeout: float):
+    """Wait until every fed update has been handled (idle for a few consecutive checks,
+    since an update is briefly in neither the queue nor the processor while being dispatched)."""
+    deadline = time.monotonic() + timeout
+    idle_checks = 0
+    while time.monotonic() < deadline:
+        if application.update_queue.empty() and not getattr(application.update_processor, 'pending', 0):
+            idle_checks += 1
+            if idle_checks >= 5:
+                return True
+        else:
+            idle_checks = 0
+        await asyncio.sleep(0.01)
+    return False
+
+async def replay(entries: list, speed, api, drain_timeout: float = 60.0) -> dict:
+    """Feed captured updates into a fully built Application; returns the report dict.
+
+    `speed` is a playback multiplier (1 = real time) or None for as fast as possible."""
+    import instrument
+    import main
+    from fakebot import FakeBotRequest
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+
+    def observe(handler, wall, outcome):
+        samples[handler].append(wall)
+        if outcome != "ok":
+            errors[handler] += 1
+
+    instrument.handler_observers.append(observe)
+    application = main.build_application("123456:REPLAY", request=FakeBotRequest(api))
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    started = time.perf_counter()
+    try:
+        first_t = entries[0]['t'] if entries else 0
+        for entry in entries:
+            if speed:
+                delay = (entry['t'] - first_t) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            data = entry['update']
+            if 'poll_answer' in data:
+                data = _remap_poll_answer(data, entry.get('chat_id'), api)
+            update = Update.de_json(data, application.bot)
+            if update.effective_chat and update.effective_user:
+                api.note_user(update.effective_chat.id, update.effective_user.id)
+            await application.update_queue.put(update)
+            # Let handlers run between updates so poll answers find the polls they belong to
+            await asyncio.sleep(0)
+        drained = await wait_idle(application, drain_timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        instrument.handler_observers.remove(observe)
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+
+    return {
+        'updates': len(entries),
+        'speed': speed or 'max',
+        'elapsed_seconds': elapsed,
+        'updates_per_second': len(entries) / elapsed if elapsed else 0.0,
+        'drained': drained,
+        'handlers': summarise_handlers(samples, errors),
+        'api_calls': dict(api.calls),
+    }
+
+def format_report(report: dict) -> str:
+    speed_text = "max speed" if report['speed'] == 'max' else f"{report['speed']:g}x"
+    lines = [
+        f"Replayed {report['updates']} updates at {speed_text} in {report['elapsed_seconds']:.2f}s "
+        f"({report['updates_per_second']:.1f} updates/s)" + ("" if report['drained'] else " - NOT DRAINED"),
+    ]
+    lines.extend(format_handler_table(report['handlers']))
+    lines.append(f"Bot API calls: {format_api_calls(report['api_calls'])}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a captured update stream against a fake Bot API")
+    parser.add_argument("capture", help="Capture file written with RECORD_UPDATES")
+    parser.add_argument("--speed", default="max", help="Playback speed: 1 (real time), N (N times faster) or max")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds added to every fake Bot API call")
+    parser.add_argument("--perplexity-url", help="Question API to use (default: none, fallback questions are used)")
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON (for before/after diffs)")
+    args = parser.parse_args(argv)
+
+    # Never talk to the real services or the log channel during a replay, nor touch the real question bank
+    import bank
+    import log
+    import perplexity
+    from fakebot import FakeBotAPI
+    log.LOG_CHANNEL_ID = None
+    bank.QUESTION_BANK_PATH = os.path.join(tempfile.mkdtemp(prefix="quizbot-replay-"), "questions.db")
+    if args.perplexity_url:
+        perplexity.PERPLEXITY_API_URL = args.perplexity_url
+        perplexity.PERPLEXITY_API_KEY = perplexity.PERPLEXITY_API_KEY or "replay"
+    else:
+        perplexity.PERPLEXITY_API_KEY = None
+
+    speed = None if args.speed == "max" else float(args.speed)
+    entries = load_capture(args.capture)
+    report = asyncio.run(replay(entries, speed, FakeBotAPI(latency=args.api_latency)))
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['drained'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
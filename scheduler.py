@@ -0,0 +1,343 @@
+# scheduler.py
+"""Recurring group quizzes set by admins with /schedule, kept in the question bank database.
+
+A planner job runs every minute and looks SCHEDULE_LEAD_SECONDS ahead. For each upcoming slot it
+spreads the question generations over the first half of the lead window (one per exam and subject,
+shared by every group that picked it) and gives each group of the slot its own start offset within
+SCHEDULE_STAGGER_SECONDS, so the groups' polls interleave instead of all going out on the same second.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from telegram import Update
+from telegram.error import Forbidden
+from telegram.ext import ContextTypes
+
+import bank
+import bank_tool
+import group
+import mastery
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Schedule times are in this UTC offset in hours (India by default)
+SCHEDULE_UTC_OFFSET = float(os.environ.get("SCHEDULE_UTC_OFFSET", 5.5))
+# Questions for a slot are generated within this many seconds before it
+SCHEDULE_LEAD_SECONDS = float(os.environ.get("SCHEDULE_LEAD_SECONDS", 600))
+# Groups sharing a slot start spread over this many seconds (one question interval interleaves their polls)
+SCHEDULE_STAGGER_SECONDS = float(os.environ.get("SCHEDULE_STAGGER_SECONDS", group.QUESTION_INTERVAL))
+MAX_SCHEDULES_PER_CHAT = 5
+PLAN_INTERVAL = 60
+
+SCHEDULED_QUIZZES = metrics.Counter("quizbot_scheduled_quizzes_total", "Scheduled quiz slots by outcome", ("exam", "outcome"))
+SCHEDULE_START_DELAY = metrics.Histogram("quizbot_schedule_start_delay_seconds",
+                                         "Scheduled quiz start after its planned (staggered) time",
+                                         buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    exam TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    minute INTEGER NOT NULL,
+    days INTEGER NOT NULL,
+    created_by INTEGER NOT NULL,
+    group_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS schedules_by_chat ON schedules (chat_id);
+"""
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+# Bit n of `days` is weekday n (Monday = 0)
+EVERY_DAY = 0b1111111
+DAY_SETS = {"daily": EVERY_DAY, "weekdays": 0b0011111, "weekends": 0b1100000}
+
+USAGE = ("Usage: /schedule HH:MM [daily|weekdays|weekends|mon,wed,...] <12th|upsc> <subject>\n"
+         "e.g. /schedule 20:00 12th Accountancy or /schedule 19:30 mon,thu upsc Polity\n"
+         "/unschedule <number|all> removes one")
+
+_schema_ready = False
+# (schedule id, slot) already handed to the job queue
+_planned = set()
+# (exam, subject, slot) -> generation task shared by the groups of that slot
+_generations = {}
+
+def _db():
+    global _schema_ready
+    db = bank.get_db()
+    if not _schema_ready:
+        db.executescript(SCHEMA)
+        _schema_ready = True
+    return db
+
+def _tz() -> timezone:
+    return timezone(timedelta(hours=SCHEDULE_UTC_OFFSET))
+
+def parse_days(text: str):
+    """Day bitmask from 'daily', 'weekdays', 'weekends' or 'mon,wed,fri'; None if it is not a day list."""
+    text = text.lower()
+    if text in DAY_SETS:
+        return DAY_SETS[text]
+    days = 0
+    for day in text.split(","):
+        if day[:3] not in WEEKDAYS:
+            return None
+        days |= 1 << WEEKDAYS.index(day[:3])
+    return days
+
+def format_days(days: int) -> str:
+    for name, mask in DAY_SETS.items():
+        if days == mask:
+            return name
+    return ",".join(day for i, day in enumerate(WEEKDAYS) if days & (1 << i))
+
+def next_slot(minute: int, days: int, after: float) -> float:
+    """Timestamp of the first scheduled time strictly after `after`."""
+    tz = _tz()
+    today = datetime.fromtimestamp(after, tz).date()
+    for offset in range(8):
+        day = today + timedelta(days=offset)
+        slot = datetime(day.year, day.month, day.day, minute // 60, minute % 60, tzinfo=tz)
+        if days & (1 << slot.weekday()) and slot.timestamp() > after:
+            return slot.timestamp()
+    return None
+
+def add_schedule(chat_id: int, exam: str, subject: str, minute: int, days: int, created_by: int, group_name: str):
+    with bank.db_lock, _db() as db:
+        db.execute("INSERT INTO schedules (chat_id, exam, subject, minute, days, created_by, group_name) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?)", (chat_id, exam, subject, minute, days, created_by, group_name))
+
+def chat_schedules(chat_id: int) -> list:
+    with bank.db_lock:
+        return _db().execute("SELECT * FROM schedules WHERE chat_id = ? ORDER BY minute, id", (chat_id,)).fetchall()
+
+def remove_schedules(chat_id: int, schedule_id: int = None) -> int:
+    """Remove one schedule of a chat, or all of them; returns how many went."""
+    with bank.db_lock, _db() as db:
+        if schedule_id is None:
+            return db.execute("DELETE FROM schedules WHERE chat_id = ?", (chat_id,)).rowcount
+        return db.execute("DELETE FROM schedules WHERE chat_id = ? AND id = ?", (chat_id, schedule_id)).rowcount
+
+def _get_schedule(schedule_id: int):
+    with bank.db_lock:
+        return _db().execute("SELECT * FROM schedules WHERE id = ?", (schedule_id,)).fetchone()
+
+async def _generate(exam: str, subject: str):
+    if exam == 'upsc':
+        from upsc import generate_upsc_questions
+        return await generate_upsc_questions(subject, "advanced", 20)
+    return await group.generate_quiz_with_perplexity(subject, "medium", 20)
+
+def plan(job_queue, now: float = None):
+    """Hand the slots starting within the lead window to the job queue (each once)."""
+    now = now or time.time()
+    horizon = now + SCHEDULE_LEAD_SECONDS + PLAN_INTERVAL
+    with bank.db_lock:
+        schedules = _db().execute("SELECT * FROM schedules").fetchall()
+    by_slot = {}
+    for schedule in schedules:
+        slot = next_slot(schedule['minute'], schedule['days'], now)
+        if slot is not None and slot <= horizon:
+            by_slot.setdefault(slot, []).append(schedule)
+    for slot, slot_schedules in by_slot.items():
+        # Every group of the slot sees the same order, so offsets stay put across planner runs
+        slot_schedules.sort(key=lambda schedule: (schedule['chat_id'], schedule['id']))
+        keys = sorted({(schedule['exam'], schedule['subject']) for schedule in slot_schedules})
+        for rank, schedule in enumerate(slot_schedules):
+            if (schedule['id'], slot) in _planned:
+                continue
+            _planned.add((schedule['id'], slot))
+            key = (schedule['exam'], schedule['subject'], slot)
+            if key not in _generations:
+                # Spread the generations over the first half of the lead window
+                generate_at = slot - SCHEDULE_LEAD_SECONDS + keys.index(key[:2]) * SCHEDULE_LEAD_SECONDS / 2 / len(keys)
+                _generations[key] = None
+                job_queue.run_once(_pregenerate, when=max(0, generate_at - now), data=key,
+                                   name=f"schedule_generate_{key[0]}_{key[1]}_{slot:.0f}")
+            start_at = slot + rank * SCHEDULE_STAGGER_SECONDS / len(slot_schedules)
+            job_queue.run_once(_start, when=max(0, start_at - now), data=(schedule['id'], slot, start_at),
+                               name=f"schedule_start_{schedule['id']}_{slot:.0f}")
+    # Forget slots long gone
+    for planned in [planned for planned in _planned if planned[1] < now - 3600]:
+        _planned.discard(planned)
+    for key in [key for key in _generations if key[2] < now - 3600]:
+        del _generations[key]
+
+async def _plan_job(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        plan(context.job_queue)
+    except Exception as e:
+        logger.error(f"Could not plan scheduled quizzes: {e}")
+
+async def _pregenerate(context: ContextTypes.DEFAULT_TYPE):
+    exam, subject, slot = key = context.job.data
+    if _generations.get(key) is None:
+        logger.info(f"Generating {exam} {subject} questions for the {datetime.fromtimestamp(slot, _tz()):%H:%M} slot")
+        _generations[key] = asyncio.create_task(_generate(exam, subject))
+
+async def _questions_for(exam: str, subject: str, slot: float):
+    task = _generations.get((exam, subject, slot))
+    if task is None:
+        # Planned too late for a head start (e.g. just after a restart)
+        task = _generations[(exam, subject, slot)] = asyncio.create_task(_generate(exam, subject))
+    try:
+        questions = await task
+    except Exception as e:
+        logger.error(f"Scheduled {exam} {subject} generation failed: {e}")
+        questions = None
+    if questions:
+        SCHEDULED_QUIZZES.inc(exam=exam, outcome='generated')
+        return list(questions)
+    SCHEDULED_QUIZZES.inc(exam=exam, outcome='fallback')
+    return group.fallback_quiz(exam, subject)
+
+async def _start(context: ContextTypes.DEFAULT_TYPE):
+    schedule_id, slot, start_at = context.job.data
+    schedule = _get_schedule(schedule_id)
+    if schedule is None:
+        # Removed after it was planned
+        return
+    chat_id, exam, subject = schedule['chat_id'], schedule['exam'], schedule['subject']
+    questions = await _questions_for(exam, subject, slot)
+    label = f"UPSC {subject}" if exam == 'upsc' else subject
+    try:
+        if chat_id in group.group_quizzes and group.group_quizzes[chat_id].get('active', False):
+            SCHEDULED_QUIZZES.inc(exam=exam, outcome='busy')
+            await context.bot.send_message(chat_id=chat_id, text=f"⏰ Skipped the scheduled {label} quiz: a quiz is already running.")
+            return
+        if not questions:
+            SCHEDULED_QUIZZES.inc(exam=exam, outcome='no_questions')
+            await context.bot.send_message(chat_id=chat_id, text=f"❌ Sorry, I couldn't get questions for the scheduled {label} quiz.")
+            return
+        group.user_scores[chat_id] = {}
+        group.group_quizzes[chat_id] = {
+            'exam_type': group.EXAM_TYPES[exam],
+            'subject': subject,
+            'questions': mastery.with_group_reviews(chat_id, exam, subject, questions),
+            'current_question': 0,
+            'active': True,
+            'poll_ids': [],
+            'started_by': schedule['created_by'],
+            'group_name': schedule['group_name']
+        }
+        group.active_group_quizzes.add(chat_id)
+        SCHEDULE_START_DELAY.observe(max(0.0, time.time() - start_at))
+        SCHEDULED_QUIZZES.inc(exam=exam, outcome='started')
+        if exam == 'upsc':
+            from upsc import post_upsc_question as post_question
+        else:
+            post_question = group.post_group_question
+        context.job_queue.run_repeating(post_question, interval=group.QUESTION_INTERVAL, first=1, data=chat_id, name=str(chat_id))
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"⏰ **Scheduled {label} Quiz Started!**\n\n"
+                 f"• Questions will be posted every {group.QUESTION_INTERVAL} seconds\n"
+                 f"• Each poll stays open for {group.POLL_OPEN_PERIOD} seconds\n"
+                 f"• Use /stop to end quiz early\n"
+                 f"• Leaderboard at the end!",
+            parse_mode='Markdown'
+        )
+    except Forbidden:
+        # The bot was removed from the group: its schedules are of no use any more
+        removed = remove_schedules(chat_id)
+        logger.info(f"Removed {removed} schedules of chat {chat_id}, the bot can no longer post there")
+        session = group.group_quizzes.pop(chat_id, None)
+        if session is not None:
+            session['active'] = False
+        group.active_group_quizzes.discard(chat_id)
+        return
+    try:
+        import log
+        await log.send_log_to_channel(
+            context,
+            f"⏰ *Scheduled Group Quiz Started*\n\n"
+            f"**Group:** {schedule['group_name']}\n"
+            f"**Group ID:** {chat_id}\n"
+            f"**Subject:** {label}\n"
+            f"**Planned:** {datetime.fromtimestamp(start_at, _tz()):%H:%M:%S}",
+            "QUIZ STARTED", event='quiz_started', chat_id=chat_id, group=schedule['group_name'], subject=label, scheduled=True)
+    except ImportError:
+        pass
+
+def start(application):
+    """Start the planner (on bot start)."""
+    application.job_queue.run_repeating(_plan_job, interval=PLAN_INTERVAL, first=0, name="schedule_planner")
+
+async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/schedule - list the group's scheduled quizzes; /schedule HH:MM [days] <exam> <subject> - add one (admins only)."""
+    chat_id = update.effective_chat.id
+    if update.effective_chat.type == "private":
+        await update.message.reply_text("⏰ Quizzes can only be scheduled in groups.")
+        return
+    if not await group.is_group_admin(update, context):
+        await update.message.reply_text("❌ Only group admins can schedule quizzes!")
+        return
+    words = list(context.args or [])
+    if not words:
+        await update.message.reply_text(_format_schedules(chat_id) + "\n\n" + USAGE)
+        return
+    try:
+        hours, minutes = (int(part) for part in words.pop(0).split(":"))
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text(USAGE)
+        return
+    days = parse_days(words[0]) if words else None
+    if days is not None:
+        words.pop(0)
+    exam = words.pop(0).lower() if words else None
+    subject = bank_tool.canonical_subject(exam, " ".join(words)) if exam in group.EXAM_TYPES else None
+    if subject is None:
+        await update.message.reply_text(USAGE)
+        return
+    if len(chat_schedules(chat_id)) >= MAX_SCHEDULES_PER_CHAT:
+        await update.message.reply_text(f"⚠️ A group can have up to {MAX_SCHEDULES_PER_CHAT} scheduled quizzes. Remove one with /unschedule.")
+        return
+    days = days or EVERY_DAY
+    group_name = update.effective_chat.title or f"Group {chat_id}"
+    add_schedule(chat_id, exam, subject, hours * 60 + minutes, days, update.effective_user.id, group_name)
+    # A slot within the lead window is planned now rather than at the next planner run
+    plan(context.job_queue)
+    label = f"UPSC {subject}" if exam == 'upsc' else subject
+    await update.message.reply_text(
+        f"⏰ {label} quiz scheduled at {hours:02d}:{minutes:02d} ({format_days(days)}).\n"
+        f"It starts within {SCHEDULE_STAGGER_SECONDS:.0f} seconds of that time.")
+    try:
+        import log
+        await log.log_admin_action(update, context, f"Scheduled {label} quiz at {hours:02d}:{minutes:02d} {format_days(days)}", group_name)
+    except ImportError:
+        pass
+
+async def unschedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/unschedule <number|all> - remove scheduled quizzes (admins only)."""
+    chat_id = update.effective_chat.id
+    if update.effective_chat.type == "private" or not await group.is_group_admin(update, context):
+        await update.message.reply_text("❌ Only group admins can remove scheduled quizzes!")
+        return
+    schedules = chat_schedules(chat_id)
+    choice = context.args[0].lower() if context.args else ""
+    if choice == "all":
+        removed = remove_schedules(chat_id)
+    elif choice.isdigit() and 1 <= int(choice) <= len(schedules):
+        removed = remove_schedules(chat_id, schedules[int(choice) - 1]['id'])
+    else:
+        await update.message.reply_text(_format_schedules(chat_id) + "\n\nUsage: /unschedule <number|all>")
+        return
+    await update.message.reply_text(f"🗑 Removed {removed} scheduled quiz{'zes' if removed != 1 else ''}.")
+
+def _format_schedules(chat_id: int) -> str:
+    schedules = chat_schedules(chat_id)
+    if not schedules:
+        return "⏰ No scheduled quizzes in this group."
+    lines = ["⏰ Scheduled quizzes:"]
+    for number, schedule in enumerate(schedules, 1):
+        label = f"UPSC {schedule['subject']}" if schedule['exam'] == 'upsc' else schedule['subject']
+        lines.append(f"{number}. {schedule['minute'] // 60:02d}:{schedule['minute'] % 60:02d} "
+                     f"{format_days(schedule['days'])} - {label}")
+    return "\n".join(lines)
@@ -0,0 +1,275 @@
+# simulate.py
+"""Drive N groups x M users through group quizzes against the local fake Bot API.
+
+    python simulate.py --groups 50 --users 30 --questions 5 --interval 6 --api-latency 0.05
+
+Run it for growing --groups to find where poll lateness, update delay or loop lag take off.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import replay
+from fakebot import BOT_USER, FakeBotAPI, FakeTelegramServer, PerplexityMock
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS = ("Accountancy", "Business Studies", "Economics", "Mathematics", "English")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Simulation:
+    """Pushes admin commands, button presses and poll answers into the fake server and
+    measures how the bot keeps up."""
+
+    def __init__(self, api: FakeBotAPI, groups: int, users: int, questions: int, ramp: float, seed: int = None):
+        self.api = api
+        self.groups = groups
+        self.users = users
+        self.questions = questions
+        self.ramp = ramp
+        self.random = random.Random(seed)
+        self.loop = None
+        self.pushed_at = {}
+        self.arrival_delays = []
+        self.poll_times = defaultdict(list)
+        self.stopped_groups = 0
+        self.pushed = 0
+        self.all_stopped = asyncio.Event()
+
+    @staticmethod
+    def chat_id(index: int) -> int:
+        return -1000000000 - index
+
+    @staticmethod
+    def admin_id(index: int) -> int:
+        return 10000000 + index * 1000
+
+    def push(self, data: dict):
+        update_id = self.api.push_update(data)
+        self.pushed_at[update_id] = time.perf_counter()
+        self.pushed += 1
+
+    def _message(self, index: int, text: str) -> dict:
+        user = {'id': self.admin_id(index), 'is_bot': False, 'first_name': f"Admin {index}"}
+        chat = {'id': self.chat_id(index), 'type': 'supergroup', 'title': f"Group {index}"}
+        entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] if text.startswith('/') else []
+        return {'message': {'message_id': self.pushed + 1, 'date': int(time.time()), 'chat': chat, 'from': user,
+                            'text': text, 'entities': entities}}
+
+    def _button(self, index: int, data: str) -> dict:
+        user = {'id': self.admin_id(index), 'is_bot': False, 'first_name': f"Admin {index}"}
+        chat = {'id': self.chat_id(index), 'type': 'supergroup', 'title': f"Group {index}"}
+        message = {'message_id': 1, 'date': int(time.time()), 'chat': chat, 'from': BOT_USER, 'text': "Select"}
+        return {'callback_query': {'id': f"{index}-{self.pushed}", 'chat_instance': str(index), 'from': user,
+                                   'message': message, 'data': data}}
+
+    async def start_group(self, index: int):
+        """An admin opens a quiz the way a person would: /quiz, exam, subject."""
+        await asyncio.sleep(self.random.uniform(0, self.ramp))
+        self.push(self._message(index, "/quiz"))
+        await asyncio.sleep(0.5)
+        self.push(self._button(index, 'exam_12th'))
+        await asyncio.sleep(0.5)
+        self.push(self._button(index, f"group_subject_{self.random.choice(SUBJECTS)}"))
+
+    def on_poll(self, chat_id: int, poll: dict):
+        """Called from the fake server's thread for every poll the bot sends."""
+        self.loop.call_soon_threadsafe(self._answer_poll, chat_id, poll)
+
+    def _answer_poll(self, chat_id: int, poll: dict):
+        index = -1000000000 - chat_id
+        self.poll_times[chat_id].append(time.perf_counter())
+        open_period = poll.get('open_period') or 25
+        for n in range(1, self.users + 1):
+            answer = {'poll_answer': {'poll_id': poll['id'], 'option_ids': [self.random.randrange(len(poll['options']))],
+                                      'user': {'id': self.admin_id(index) + n, 'is_bot': False, 'first_name': f"Player {n}"}}}
+            self.loop.call_later(self.random.uniform(0.2, open_period * 0.8), self.push, answer)
+        if len(self.poll_times[chat_id]) == self.questions:
+            self.loop.call_later(open_period, self._stop_group, index)
+
+    def _stop_group(self, index: int):
+        self.push(self._message(index, "/stop"))
+        self.stopped_groups += 1
+        if self.stopped_groups == self.groups:
+            self.all_stopped.set()
+
+    async def on_arrival(self, update: Update, context):
+        pushed = self.pushed_at.pop(update.update_id, None)
+        if pushed is not None:
+            self.arrival_delays.append(time.perf_counter() - pushed)
+
+def _lateness(poll_times: dict, interval: float) -> list:
+    """How much later than the schedule each question after the first was posted (seconds)."""
+    late = []
+    for times in poll_times.values():
+        for previous, current in zip(times, times[1:]):
+            late.append(max(0.0, current - previous - interval))
+    return sorted(late)
+
+async def simulate(args) -> dict:
+    import bank
+    import group
+    import health
+    import instrument
+    import log
+    import main
+    import perplexity
+    import webserver
+    from ingest import UpdateIngest
+    # main configures INFO logging on import; per-update lines would swamp the report
+    logging.getLogger().setLevel(logging.WARNING)
+
+    api = FakeBotAPI(args.api_latency, error_rate=args.error_rate, retry_after_rate=args.retry_after_rate,
+                     retry_after=args.retry_after, seed=args.seed)
+    mock = PerplexityMock(args.perplexity_delay, jitter=args.perplexity_delay / 4, seed=args.seed)
+    server = FakeTelegramServer(api, mock)
+    server.start_in_thread()
+
+    # Point the bot at the stand-ins and shorten the quiz pacing
+    group.QUESTION_INTERVAL = args.interval
+    group.POLL_OPEN_PERIOD = max(5, args.interval - 1)
+    perplexity.PERPLEXITY_API_URL = server.perplexity_url
+    perplexity.PERPLEXITY_API_KEY = "simulate"
+    log.LOG_CHANNEL_ID = None
+    bank.QUESTION_BANK_PATH = os.path.join(tempfile.mkdtemp(prefix="quizbot-simulate-"), "questions.db")
+
+    sim = Simulation(api, args.groups, args.users, args.questions, args.ramp, args.seed)
+    sim.loop = asyncio.get_running_loop()
+    api.poll_listeners.append(sim.on_poll)
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+
+    def observe(handler, wall, outcome):
+        samples[handler].append(wall)
+        if outcome != "ok":
+            errors[handler] += 1
+
+    instrument.handler_observers.append(observe)
+    application = main.build_application("123456:SIMULATE", base_url=server.bot_url)
+    application.add_handler(TypeHandler(Update, sim.on_arrival), group=-2)
+    update_ingest = None
+    http_server = None
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    if args.delivery == "webhook":
+        port = _free_port()
+        update_ingest = UpdateIngest(application)
+        update_ingest.start()
+        http_server = webserver.start_server(application, port, "/webhook", "simulate", update_ingest)
+        await application.bot.set_webhook(url=f"http://127.0.0.1:{port}/webhook", secret_token="simulate")
+    else:
+        await application.updater.start_polling(poll_interval=0, timeout=1, allowed_updates=Update.ALL_TYPES)
+
+    started = time.perf_counter()
+    try:
+        for index in range(args.groups):
+            application.create_task(sim.start_group(index))
+        expected = args.ramp + 1 + args.questions * args.interval + group.POLL_OPEN_PERIOD
+        try:
+            await asyncio.wait_for(sim.all_stopped.wait(), timeout=expected * 3 + 30)
+        except asyncio.TimeoutError:
+            logger.warning(f"Only {sim.stopped_groups}/{args.groups} groups finished in time")
+        # Let the final answers and /stop commands drain
+        while api.take_updates():
+            await asyncio.sleep(0.05)
+        drained = await replay.wait_idle(application, 30)
+        elapsed = time.perf_counter() - started
+        loop_lag = health.get_loop_lag()
+    finally:
+        instrument.handler_observers.remove(observe)
+        if update_ingest is not None:
+            await update_ingest.stop()
+            http_server.stop()
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        server.stop_thread()
+
+    arrival = sorted(sim.arrival_delays)
+    lateness = _lateness(sim.poll_times, args.interval)
+    return {
+        'groups': args.groups,
+        'users': args.users,
+        'delivery': args.delivery,
+        'elapsed_seconds': elapsed,
+        'updates_pushed': sim.pushed,
+        'updates_per_second': sim.pushed / elapsed if elapsed else 0.0,
+        'groups_finished': sim.stopped_groups,
+        'drained': drained,
+        'polls_sent': sum(len(times) for times in sim.poll_times.values()),
+        'update_delay_ms': {pct: replay.percentile(arrival, pct) * 1000 for pct in (50, 95, 99)},
+        'poll_lateness_ms': {pct: replay.percentile(lateness, pct) * 1000 for pct in (50, 95, 99)},
+        'loop_lag_max_ms': loop_lag['max'] * 1000,
+        'handlers': replay.summarise_handlers(samples, errors),
+        'api_calls': dict(api.calls),
+        'injected_errors': dict(api.injected),
+        'perplexity_requests': mock.requests,
+    }
+
+def format_report(report: dict) -> str:
+    delay = report['update_delay_ms']
+    lateness = report['poll_lateness_ms']
+    lines = [
+        f"{report['groups']} groups x {report['users']} users ({report['delivery']}): "
+        f"{report['updates_pushed']} updates in {report['elapsed_seconds']:.1f}s "
+        f"({report['updates_per_second']:.1f} updates/s), {report['groups_finished']} groups finished"
+        + ("" if report['drained'] else " - NOT DRAINED"),
+        f"Update delay (pushed -> handled) p50/p95/p99: {delay[50]:.0f} / {delay[95]:.0f} / {delay[99]:.0f} ms",
+        f"Question lateness p50/p95/p99: {lateness[50]:.0f} / {lateness[95]:.0f} / {lateness[99]:.0f} ms "
+        f"over {report['polls_sent']} polls",
+        f"Max event loop lag: {report['loop_lag_max_ms']:.0f} ms",
+    ]
+    lines.extend(replay.format_handler_table(report['handlers']))
+    lines.append(f"Bot API calls: {replay.format_api_calls(report['api_calls'])}")
+    if report['injected_errors']:
+        lines.append(f"Injected errors: {replay.format_api_calls(report['injected_errors'])}")
+    lines.append(f"Perplexity requests: {report['perplexity_requests']}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate groups of users playing quizzes against fake APIs")
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20, help="Players answering every poll in each group")
+    parser.add_argument("--questions", type=int, default=3, help="Questions per group before an admin sends /stop")
+    parser.add_argument("--interval", type=int, default=6, help="Seconds between questions (QUESTION_INTERVAL)")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Groups start at random times within this many seconds")
+    parser.add_argument("--delivery", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds per fake Bot API call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Bot API calls failing with 500")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="Fraction of Bot API calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--perplexity-delay", type=float, default=2.0, help="Seconds the question API takes")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(simulate(args))
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['drained'] and report['groups_finished'] == args.groups else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The bot's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# A throwaway question bank and event log, and no channel logging
+_DATA_DIR = tempfile.mkdtemp(prefix="quizbot-tests-")
+os.environ.setdefault("QUESTION_BANK_PATH", os.path.join(_DATA_DIR, "questions.db"))
+os.environ.setdefault("EVENT_LOG_DIR", os.path.join(_DATA_DIR, "logs"))
+os.environ.pop("LOG_CHANNEL_ID", None)
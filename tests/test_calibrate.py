@@ -0,0 +1,41 @@
+import numpy as np
+
+import bank
+import calibrate
+
+def test_fit_recovers_difficulty_order():
+    rng = np.random.default_rng(7)
+    difficulty = np.linspace(-2, 2, 20)
+    ability = rng.normal(0, 1, 300)
+    # Every user answers every question once or twice: 6000 records
+    users, questions = np.meshgrid(np.arange(1, 301), np.arange(100, 120), indexing='ij')
+    users, questions = users.ravel(), questions.ravel()
+    attempts = rng.integers(1, 3, len(users)).astype(np.float64)
+    p = 1 / (1 + np.exp(-(ability[users - 1] - difficulty[questions - 100])))
+    correct = rng.binomial(attempts.astype(np.int64), p).astype(np.float64)
+    # Records arrive in no particular order
+    shuffle = rng.permutation(len(users))
+    result = calibrate.fit(users[shuffle], questions[shuffle], attempts[shuffle], correct[shuffle])
+    assert list(result['question_ids']) == list(range(100, 120))
+    assert result['iterations'] < calibrate.MAX_ITERATIONS
+    ranks = np.argsort(np.argsort(result['difficulty']))
+    assert np.corrcoef(ranks, np.arange(20))[0, 1] > 0.95
+    assert result['difficulty'][0] < -1 and result['difficulty'][-1] > 1
+
+def test_set_calibration_leaves_search_index_untouched():
+    bank.add_questions('12th', "Business Studies", [
+        {'question': f"Which calibration principle is number {i}?", 'options': ["Planning", "Staffing", "Directing", "Control"],
+         'correct_answer': 0, 'explanation': "Principles of management"} for i in range(3)], 'generated')
+    with bank.db_lock:
+        db = bank.get_db()
+        ids = [row[0] for row in db.execute("SELECT id FROM questions WHERE question LIKE 'Which calibration principle%'")]
+        index = db.execute("SELECT * FROM questions_fts_data").fetchall()
+        changes = db.total_changes
+    bank.set_calibration([(i - 1.0, 1.0, question_id) for i, question_id in enumerate(ids)])
+    with bank.db_lock:
+        db = bank.get_db()
+        assert db.total_changes - changes == len(ids)
+        assert db.execute("SELECT * FROM questions_fts_data").fetchall() == index
+    # Still found by search, now by difficulty band too
+    assert len(bank.search("calibration principle", '12th')) == 3
+    assert len(bank.search("calibration principle", '12th', band='hard')) == 1
@@ -0,0 +1,24 @@
+import os
+import time
+
+import eventlog
+
+def _write(directory, rotate_seconds):
+    writer = eventlog.EventLogWriter(str(directory), rotate_seconds=rotate_seconds, compress=False, flush_interval=0.01)
+    writer.start()
+    writer.write({'event': 'test'})
+    writer.close()
+
+def test_reopened_log_keeps_its_age_for_rotation(tmp_path):
+    _write(tmp_path, rotate_seconds=3600)
+    # Started two hours ago, last written just now
+    with open(tmp_path / eventlog.OPENED_FILE, "w") as f:
+        f.write(repr(time.time() - 7200))
+    _write(tmp_path, rotate_seconds=3600)
+    assert len(list(eventlog._log_files(str(tmp_path)))) == 2
+    assert os.path.getsize(tmp_path / eventlog.CURRENT_FILE) == 0
+
+def test_fresh_log_is_not_rotated(tmp_path):
+    _write(tmp_path, rotate_seconds=3600)
+    _write(tmp_path, rotate_seconds=3600)
+    assert eventlog._log_files(str(tmp_path)) == [str(tmp_path / eventlog.CURRENT_FILE)]
@@ -0,0 +1,265 @@
+import asyncio
+import time
+
+from telegram import Update
+
+import group
+import main
+import processor
+from fakebot import BOT_USER, FakeBotAPI, FakeBotRequest
+
+CHAT_ID = -1005
+ADMIN_ID = 77
+
+def _chat(chat_id: int = CHAT_ID) -> dict:
+    return {'id': chat_id, 'type': 'supergroup', 'title': "Test Group"}
+
+def _user() -> dict:
+    return {'id': ADMIN_ID, 'is_bot': False, 'first_name': "Admin"}
+
+def _button(update_id: int, data: str, chat_id: int = CHAT_ID) -> dict:
+    message = {'message_id': 1, 'date': 0, 'chat': _chat(chat_id), 'from': BOT_USER, 'text': "Menu"}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'chat_instance': "test", 'from': _user(), 'message': message, 'data': data}}
+
+def _command(update_id: int, text: str, chat_id: int = CHAT_ID) -> dict:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'chat': _chat(chat_id), 'from': _user(), 'text': text,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]}}
+
+def test_stop_cancels_generation_in_progress(monkeypatch):
+    generation = {}
+
+    async def slow_generation(subject, difficulty, num_questions=20, topic=None):
+        generation['task'] = asyncio.current_task()
+        await asyncio.sleep(5)
+        return []
+
+    monkeypatch.setattr(group, 'generate_quiz_with_perplexity', slow_generation)
+    edits = []
+
+    async def run():
+        api = FakeBotAPI()
+        api.note_user(CHAT_ID, ADMIN_ID)
+        result = api.result
+
+        def spy(method, params):
+            if method == 'editMessageText':
+                edits.append(params)
+            return result(method, params)
+
+        api.result = spy
+        application = main.build_application("1:TEST", request=FakeBotRequest(api))
+        application.post_init = application.post_stop = None
+        await application.initialize()
+        await application.start()
+        try:
+            started = time.monotonic()
+            await application.update_queue.put(Update.de_json(_button(1, 'group_subject_Economics'), application.bot))
+            while 'task' not in generation:
+                await asyncio.sleep(0.01)
+            await application.update_queue.put(Update.de_json(_command(2, "/stop"), application.bot))
+            while CHAT_ID in group.group_quizzes:
+                assert time.monotonic() - started < 2, "/stop waited for the generation to finish"
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            return generation['task']
+        finally:
+            await application.stop()
+            await application.shutdown()
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert CHAT_ID not in group.active_group_quizzes
+    # The "Generating..." message is closed and loses its Cancel button
+    assert "Generating" in edits[0]['text'] and 'reply_markup' in edits[0]
+    assert "stopped" in edits[-1]['text'] and not edits[-1].get('reply_markup')
+
+def test_stop_is_not_held_up_by_starts_filling_every_slot(monkeypatch):
+    generations = []
+
+    async def slow_generation(subject, difficulty, num_questions=20, topic=None):
+        generations.append(asyncio.current_task())
+        await asyncio.sleep(5)
+        return []
+
+    monkeypatch.setattr(group, 'generate_quiz_with_perplexity', slow_generation)
+    chats = [CHAT_ID - 100 - i for i in range(processor.MAX_CONCURRENT_UPDATES)]
+
+    async def run():
+        api = FakeBotAPI()
+        for chat_id in chats:
+            api.note_user(chat_id, ADMIN_ID)
+        application = main.build_application("1:TEST", request=FakeBotRequest(api))
+        application.post_init = application.post_stop = None
+        await application.initialize()
+        await application.start()
+        try:
+            for i, chat_id in enumerate(chats):
+                await application.update_queue.put(
+                    Update.de_json(_button(i + 1, 'group_subject_Economics', chat_id), application.bot))
+            while len(generations) < len(chats):
+                await asyncio.sleep(0.01)
+            started = time.monotonic()
+            await application.update_queue.put(Update.de_json(_command(100, "/stop", chats[0]), application.bot))
+            while chats[0] in group.group_quizzes:
+                assert time.monotonic() - started < 2, "/stop waited for a free slot"
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            cancelled = [task.cancelled() for task in generations]
+            for chat_id in chats[1:]:
+                group.cancel_generation(chat_id)
+            await asyncio.sleep(0.05)
+            return cancelled
+        finally:
+            await application.stop()
+            await application.shutdown()
+            for chat_id in chats:
+                group.group_quizzes.pop(chat_id, None)
+                group.active_group_quizzes.discard(chat_id)
+
+    assert asyncio.run(run()).count(True) == 1
+
+def test_keyword_quiz_records_answers_under_each_question_subject(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(group.mastery, 'record_answer', lambda *args: recorded.append(args))
+    question = {'id': 9, 'subject': "Economics", 'question': "Q?", 'options': ["a", "b", "c", "d"], 'correct_answer': 1}
+    group.poll_answers["poll-9"] = {'chat_id': CHAT_ID, 'question_index': 0, 'answered': 3, 'right': 2}
+    quiz_data = {'exam_type': '12th Board', 'subject': "demand supply", 'questions': [question], 'poll_ids': ["poll-9"]}
+    group.record_last_poll(CHAT_ID, quiz_data)
+    assert recorded == [(CHAT_ID, 9, '12th', "Economics", True)]
+
+def test_keyword_quiz_without_matches_or_generation_reports_it(monkeypatch):
+    # With no minimum nothing is generated, so there is no "Generating..." message to edit
+    monkeypatch.setattr(group, 'SEARCH_MIN_QUESTIONS', 0)
+    sent = []
+
+    async def run():
+        api = FakeBotAPI()
+        api.note_user(CHAT_ID, ADMIN_ID)
+        result = api.result
+
+        def spy(method, params):
+            if method == 'sendMessage':
+                sent.append(params['text'])
+            return result(method, params)
+
+        api.result = spy
+        application = main.build_application("1:TEST", request=FakeBotRequest(api))
+        application.post_init = application.post_stop = None
+        await application.initialize()
+        await application.start()
+        try:
+            await application.update_queue.put(Update.de_json(_command(1, "/quiz zzqx nonexistent"), application.bot))
+            for _ in range(200):
+                if any("Sorry" in text for text in sent):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await application.stop()
+            await application.shutdown()
+
+    asyncio.run(run())
+    assert any("couldn't find or generate questions on zzqx nonexistent" in text for text in sent)
+    assert CHAT_ID not in group.group_quizzes and CHAT_ID not in group.active_group_quizzes
+
+def test_generation_without_a_subject_is_not_banked(monkeypatch):
+    banked = []
+    batch = [{'question': "What is demand?", 'options': ["a", "b", "c", "d"], 'correct_answer': 0, 'explanation': "x"}]
+
+    prompts = []
+
+    async def generate(exam, system_prompt, prompt):
+        prompts.append(prompt)
+        return batch
+
+    async def keep(exam, questions):
+        return questions
+
+    monkeypatch.setattr(group.perplexity, 'generate', generate)
+    monkeypatch.setattr(group.quality, 'filter_questions', keep)
+    monkeypatch.setattr(group.bank, 'cache_generated', lambda *args: banked.append(args))
+    assert asyncio.run(group.generate_quiz_with_perplexity(None, "medium", 20, topic="demand supply")) == batch
+    assert not banked
+    assert "quiz on demand supply for" in prompts[0]
+    asyncio.run(group.generate_quiz_with_perplexity("Economics", "medium", 20, topic="demand supply"))
+    assert banked == [('12th', "Economics", batch)]
+
+def test_failed_generation_starts_on_fallback_questions(monkeypatch):
+    async def failed_generation(subject, difficulty, num_questions=20, topic=None):
+        return None
+
+    monkeypatch.setattr(group, 'generate_quiz_with_perplexity', failed_generation)
+
+    async def run():
+        api = FakeBotAPI()
+        api.note_user(CHAT_ID, ADMIN_ID)
+        application = main.build_application("1:TEST", request=FakeBotRequest(api))
+        application.post_init = application.post_stop = None
+        await application.initialize()
+        await application.start()
+        try:
+            await application.update_queue.put(Update.de_json(_button(1, 'group_subject_Economics'), application.bot))
+            for _ in range(200):
+                if group.group_quizzes.get(CHAT_ID, {}).get('questions'):
+                    break
+                await asyncio.sleep(0.01)
+            jobs = application.job_queue.get_jobs_by_name(str(CHAT_ID))
+            for job in jobs:
+                job.schedule_removal()
+            return group.group_quizzes.pop(CHAT_ID), len(jobs)
+        finally:
+            group.active_group_quizzes.discard(CHAT_ID)
+            await application.stop()
+            await application.shutdown()
+
+    session, jobs = asyncio.run(run())
+    assert len(session['questions']) == 20 and jobs == 1
+
+def test_fallback_prefers_distinct_banked_questions():
+    subject = "Information Practices"
+    # Only the built-in question so far: it is repeated to fill the quiz
+    assert len({question['question'] for question in group.fallback_quiz('12th', subject)}) == 20
+    group.bank.add_questions('12th', subject, [
+        {'question': f"Which SQL clause is number {i}?", 'options': ["WHERE", "HAVING", "GROUP BY", "ORDER BY"],
+         'correct_answer': i % 4, 'explanation': ""} for i in range(25)], 'generated')
+    questions = group.fallback_quiz('12th', subject)
+    assert len(questions) == 20 and all('id' in question for question in questions)
+    assert len({question['id'] for question in questions}) == 20
+
+def test_review_packs_whole_entries_in_order_within_message_limit():
+    def question(number, explanation):
+        return {'question': f"Review question {number} about <ratios> & 📈?", 'options': ["a", "b", "c", "d"],
+                'correct_answer': number % 4, 'explanation': explanation}
+
+    questions = []
+    for number in range(1, 41):
+        if number % 5 == 0:
+            explanation = "Short enough for the poll."
+        elif number % 5 == 1:
+            explanation = "One.\nTwo.\nThree.\nFour."  # Too many lines for the poll
+        else:
+            explanation = f"Because {number}: " + "📈 ratio & <margin> " * 40
+        questions.append(question(number, explanation))
+    questions[6]['explanation'] = ""
+    sent = []
+
+    async def send_message(**kwargs):
+        sent.append(kwargs)
+
+    context = type('Context', (), {'bot': type('Bot', (), {'send_message': staticmethod(send_message)})})
+    # Questions after the 36th were never posted
+    asyncio.run(group.send_review(context, CHAT_ID, {'questions': questions, 'current_question': 36}))
+
+    assert len(sent) > 1 and all(message['parse_mode'] == 'HTML' for message in sent)
+    texts = [message['text'] for message in sent]
+    assert all(group.quality.telegram_length(text) <= 4096 for text in texts)
+    assert not any("<ratios>" in text or "<margin>" in text for text in texts)
+    numbers = [int(line[3:].split(".")[0]) for text in texts for line in text.split("\n") if line.startswith("<b>") and "Review question" in line]
+    assert numbers == [number for number in range(1, 37) if number % 5 != 0 and number != 7]
+    for text in texts:
+        # Every entry is whole: heading, answer and explanation in the same message
+        entries = [entry for entry in text.split("\n\n") if "Review question" in entry]
+        assert all(entry.count("\n") == 2 or "One." in entry for entry in entries)
+        assert all("✅" in entry and "💡" in entry for entry in entries)
+    assert not any(group.poll_explanation(questions[number - 1]) for number in numbers)
@@ -0,0 +1,26 @@
+import asyncio
+
+import log
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+def test_pipeline_restarts_on_a_new_event_loop(monkeypatch):
+    monkeypatch.setattr(log, 'LOG_CHANNEL_ID', "-100")
+    bot = _Bot()
+
+    async def run(message):
+        log.start_log_pipeline(bot)
+        log._enqueue_log("INFO", message)
+        queue = log._log_queue
+        await log.stop_log_pipeline()
+        return queue
+
+    first = asyncio.run(run("first run"))
+    second = asyncio.run(run("second run"))
+    assert first is not second and log._log_queue is None
+    assert any("first run" in text for text in bot.sent) and any("second run" in text for text in bot.sent)
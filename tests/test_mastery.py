@@ -0,0 +1,22 @@
+import time
+
+import bank
+import mastery
+
+def test_due_ids_leave_the_answer_buffer_alone(monkeypatch):
+    bank.get_db()
+    flushed = []
+    monkeypatch.setattr(mastery, 'flush', lambda: flushed.append(True))
+    mastery.due_ids(1, '12th', "Economics", 5)
+    mastery.select_questions(1, '12th', "Economics", 5)
+    assert not flushed
+
+def test_answers_are_due_after_a_flush():
+    question_ids = mastery.select_questions(2, '12th', "Economics", 3)
+    assert question_ids
+    for question_id in question_ids:
+        mastery.record_answer(2, question_id, '12th', "Economics", False)
+    mastery.flush()
+    # Wrong answers go back to box 0, due again after the first interval
+    due = mastery.due_ids(2, '12th', "Economics", 10, now=time.time() + mastery.BOX_INTERVALS[0] + 1)
+    assert set(question_ids) <= set(due)
@@ -0,0 +1,11 @@
+import metrics
+from ingest import UpdateIngest
+
+def test_rebuilding_registers_each_metric_family_once():
+    metrics.register_runtime_gauges()
+    metrics.register_runtime_gauges()
+    UpdateIngest(application=None)
+    UpdateIngest(application=None)
+    families = [line.split()[2] for line in metrics.render().splitlines() if line.startswith("# TYPE")]
+    assert len(families) == len(set(families))
+    assert "quizbot_active_sessions" in families and "quizbot_ingest_queue_depth" in families
@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+import main
+import personal
+from fakebot import FakeBotAPI, FakeBotRequest
+
+def test_idle_solo_sessions_are_swept_without_new_sessions(monkeypatch):
+    monkeypatch.setattr(personal, 'SOLO_SWEEP_SECONDS', 0.05)
+    idle = personal.SoloSession('12th', "Economics", [1, 2, 3])
+    idle.poll_id = "idle-poll"
+    idle.last_active = time.monotonic() - personal.SOLO_IDLE_SECONDS - 1
+    personal.user_quizzes[501] = idle
+    personal.solo_polls[idle.poll_id] = 501
+    personal.user_quizzes[502] = personal.SoloSession('12th', "Economics", [4, 5, 6])
+
+    async def run():
+        application = main.build_application("1:TEST", request=FakeBotRequest(FakeBotAPI()))
+        await application.initialize()
+        await application.start()
+        try:
+            personal.start(application)
+            await asyncio.sleep(0.3)
+        finally:
+            await application.stop()
+            await application.shutdown()
+
+    try:
+        asyncio.run(run())
+        assert 501 not in personal.user_quizzes and not personal.is_solo_poll("idle-poll")
+        assert 502 in personal.user_quizzes
+    finally:
+        personal.user_quizzes.clear()
+        personal.solo_polls.clear()
@@ -0,0 +1,34 @@
+import asyncio
+
+import perplexity
+import prefetch
+
+def _start(monkeypatch, generate, ttl=600):
+    monkeypatch.setattr(perplexity, 'PERPLEXITY_API_KEY', "test")
+    monkeypatch.setattr(prefetch, 'PREFETCH_TTL', ttl)
+    prefetch.record_pick(-1, '12th', "Economics")
+    prefetch.start(-1, '12th', generate)
+
+def test_failed_speculation_is_not_a_hit(monkeypatch):
+    async def failing(subject):
+        return None
+
+    async def run():
+        _start(monkeypatch, failing)
+        return await prefetch.claim(-1, '12th', "Economics")
+
+    assert asyncio.run(run()) == (False, None)
+
+def test_unclaimed_speculation_expires(monkeypatch):
+    async def slow(subject):
+        await asyncio.sleep(10)
+
+    async def run():
+        _start(monkeypatch, slow, ttl=0.05)
+        task = prefetch._speculative[-1][('12th', "Economics")]['task']
+        await asyncio.sleep(0.1)
+        return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert -1 not in prefetch._speculative
@@ -0,0 +1,33 @@
+import bank_tool
+import quality
+
+def _question(text: str, options=("Profit", "Loss", "Capital", "Reserve")) -> dict:
+    return {'question': text, 'options': list(options), 'correct_answer': 0, 'explanation': ""}
+
+def _posted(text: str) -> int:
+    """Length of the longest poll question a quiz sends for this text."""
+    return quality.telegram_length(f"🎯 UPSC 20/20: {text}")
+
+def test_question_length_leaves_room_for_the_number_prefix():
+    fits = "x" * (quality.MAX_QUESTION_LENGTH - quality.telegram_length(quality.QUESTION_PREFIX))
+    assert quality.question_problem(_question(fits)) is None
+    assert _posted(fits) <= quality.MAX_QUESTION_LENGTH
+    assert quality.question_problem(_question("x" * 297)) == "too_long"
+
+def test_lengths_count_utf16_units():
+    emoji = "📈" * 150
+    assert len(emoji) == 150 and quality.telegram_length(emoji) == 300
+    assert quality.question_problem(_question("Which chart? " + emoji)) == "too_long"
+    assert quality.question_problem(_question("Which chart?", ("📈" * 51, "b", "c", "d"))) == "too_long"
+
+def test_import_rejects_rows_too_long_to_post():
+    row = {'exam': '12th', 'subject': "Economics", 'question': "y" * 297,
+           'options': ["Profit", "Loss", "Capital", "Reserve"], 'correct_answer': "A"}
+    assert bank_tool.validate(row) == (None, None, "too_long")
+
+def test_import_rejects_rows_with_non_text_exam_or_subject():
+    row = {'exam': '12th', 'subject': "Economics", 'question': "What is GDP?",
+           'options': ["Output", "Debt", "Tax", "Rent"], 'correct_answer': "A"}
+    assert bank_tool.validate({**row, 'exam': 12}) == (None, None, "malformed")
+    assert bank_tool.validate({**row, 'subject': 5}) == (None, None, "malformed")
+    assert bank_tool.validate(row)[0] == '12th'
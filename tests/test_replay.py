@@ -0,0 +1,37 @@
+import gzip
+import json
+
+from telegram import Bot, Update
+
+import replay
+
+BOT = Bot("1:TEST")
+
+def _update(data):
+    return Update.de_json(data, BOT)
+
+def test_recorder_anonymises_messages_and_polls(tmp_path):
+    path = str(tmp_path / "capture.jsonl.gz")
+    recorder = replay.UpdateRecorder(path, anonymise=True)
+    user = {'id': 42, 'is_bot': False, 'first_name': "Asha", 'username': "asha"}
+    recorder.record(_update({'update_id': 1, 'message': {
+        'message_id': 1, 'date': 0, 'chat': {'id': -100, 'type': 'supergroup', 'title': "Commerce"},
+        'from': user, 'text': "hello"}}))
+    # A poll state update: the poll's 'id' is a string and its 'type' is 'quiz'
+    recorder.record(_update({'update_id': 2, 'poll': {
+        'id': "5012345", 'question': "Q?", 'options': [{'text': "a", 'voter_count': 1}, {'text': "b", 'voter_count': 0}],
+        'total_voter_count': 1, 'is_closed': False, 'is_anonymous': False, 'type': 'quiz',
+        'allows_multiple_answers': False, 'correct_option_id': 0}}))
+    recorder.record(_update({'update_id': 3, 'poll_answer': {'poll_id': "5012345", 'user': user, 'option_ids': [0]}}))
+    recorder.close()
+
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry['update']['update_id'] for entry in entries] == [1, 2, 3]
+    message = entries[0]['update']['message']
+    assert message['from']['id'] != 42 and message['chat']['id'] < 0
+    assert message['text'] == "xxxxx"
+    assert message['chat']['title'].startswith("title_")
+    assert entries[1]['update']['poll']['id'] == "5012345"
+    # The same user maps to the same anonymous id everywhere
+    assert entries[2]['update']['poll_answer']['user']['id'] == message['from']['id']
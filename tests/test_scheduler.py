@@ -0,0 +1,44 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import group
+import main
+import perplexity
+import scheduler
+from fakebot import FakeBotAPI, FakeBotRequest
+
+CHAT_ID = -1009
+
+def test_fallback_quiz_is_a_plain_list():
+    questions = group.fallback_quiz('12th', "Economics")
+    assert isinstance(questions, list) and len(questions) == 20
+    assert group.fallback_quiz('12th', "No Such Subject") is None
+
+def test_scheduled_quiz_starts_on_fallback_questions(monkeypatch):
+    # No API key: generation fails and the slot falls back to the built-in questions
+    monkeypatch.setattr(perplexity, 'PERPLEXITY_API_KEY', None)
+    scheduler.add_schedule(CHAT_ID, '12th', "Economics", 9 * 60, 0b1111111, 77, "Test Group")
+    schedule_id = scheduler.chat_schedules(CHAT_ID)[-1]['id']
+    sent = []
+
+    async def run():
+        api = FakeBotAPI()
+        application = main.build_application("1:TEST", request=FakeBotRequest(api))
+        await application.initialize()
+        try:
+            bot = SimpleNamespace(send_message=lambda **kwargs: _record(sent, kwargs))
+            job = SimpleNamespace(data=(schedule_id, time.time(), time.time()))
+            context = SimpleNamespace(job=job, bot=bot, job_queue=application.job_queue)
+            await scheduler._start(context)
+        finally:
+            await application.shutdown()
+
+    asyncio.run(run())
+    session = group.group_quizzes.pop(CHAT_ID)
+    group.active_group_quizzes.discard(CHAT_ID)
+    assert session['subject'] == "Economics" and len(session['questions']) == 20
+    assert "Scheduled Economics Quiz Started" in sent[0]['text']
+
+async def _record(sent: list, kwargs: dict):
+    sent.append(kwargs)
@@ -1,10 +1,20 @@
 # upsc.py
 import logging
 import random
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Poll
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest, Forbidden
 
+import bank
+import group
+import instrument
+import mastery
+import metrics
+import perplexity
+import prefetch
+import quality
+
 logger = logging.getLogger(__name__)
 
 # UPSC Subjects and topics
@@ -87,6 +97,10 @@ async def start_upsc_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start UPSC quiz by asking for subject."""
     query = update.callback_query
     
+    # Start generating the group's likely subjects while the admin is still choosing
+    if await group.is_group_admin(update, context):
+        prefetch.start(query.message.chat_id, 'upsc', lambda subject: generate_upsc_questions(subject, "advanced", 20))
+    
     keyboard = [
         [
             InlineKeyboardButton("History", callback_data='upsc_subject_History'),
@@ -120,8 +134,6 @@ async def handle_upsc_subject_selection(update: Update, context: ContextTypes.DE
     chat_id = query.message.chat_id
     group_name = query.message.chat.title or f"Group {chat_id}"
     
-    await query.answer()
-    
     # Import group module functions
     from group import group_quizzes, active_group_quizzes, user_scores, poll_answers
     from group import is_group_admin, send_leaderboard
@@ -151,78 +163,55 @@ async def handle_upsc_subject_selection(update: Update, context: ContextTypes.DE
     # Add to active quizzes
     active_group_quizzes.add(chat_id)
     
-    await query.edit_message_text(text=f"🔄 Generating UPSC {subject} quiz...")
+    await query.edit_message_text(text=f"🔄 Generating UPSC {subject} quiz...", reply_markup=group.generating_markup())
     
-    # Generate UPSC questions
-    quiz = await generate_upsc_questions(subject, "advanced", 20)
+    # Use the speculative generation started from the subject menu, if there is one
+    prefetch.record_pick(chat_id, 'upsc', subject)
+    wanted, quiz = await group.run_generation(chat_id, 'upsc', subject, lambda: generate_upsc_questions(subject, "advanced", 20),
+                                             query.message)
+    if not wanted:
+        # /stop or cancel ended the session and already answered
+        return
     
-    if quiz:
-        group_quizzes[chat_id]['questions'] = quiz
-        
-        # Log quiz start
-        try:
-            import log
-            await log.log_group_quiz_started(update, context, f"UPSC {subject}", group_name)
-            await log.log_admin_action(update, context, f"Started UPSC {subject} quiz", group_name)
-        except ImportError:
-            pass
-        
-        # Start posting questions every 30 seconds
-        context.job_queue.run_repeating(
-            post_upsc_question, 
-            interval=30, 
-            first=1, 
-            data=chat_id, 
-            name=str(chat_id)
-        )
+    fallback = not quiz
+    if fallback:
+        # Use fallback questions
+        quiz = group.fallback_quiz('upsc', subject)
+    if not quiz:
+        group_quizzes[chat_id]['active'] = False
+        active_group_quizzes.discard(chat_id)
+        del group_quizzes[chat_id]
         await query.edit_message_text(
-            text=f"✅ **UPSC {subject} Quiz Started!**\n\n"
-                 f"• UPSC-level questions will be posted every 30 seconds\n"
-                 f"• Each poll stays open for 25 seconds\n"
-                 f"• Use /stop to end quiz early\n"
-                 f"• Leaderboard at the end!",
-            parse_mode='Markdown'
+            text="❌ Sorry, I couldn't generate UPSC questions right now. Please try again later."
         )
-    else:
-        # Use fallback questions
-        if subject in upsc_fallback_questions:
-            questions = []
-            for i in range(20):
-                base_q = upsc_fallback_questions[subject][i % len(upsc_fallback_questions[subject])]
-                new_q = base_q.copy()
-                new_q['question'] = f"{i+1}. {base_q['question']}"
-                questions.append(new_q)
-            
-            group_quizzes[chat_id]['questions'] = questions
-            
-            # Log quiz start
-            try:
-                import log
-                await log.log_group_quiz_started(update, context, f"UPSC {subject}", group_name)
-                await log.log_admin_action(update, context, f"Started UPSC {subject} quiz (Fallback)", group_name)
-            except ImportError:
-                pass
-            
-            # Start posting questions
-            context.job_queue.run_repeating(
-                post_upsc_question, 
-                interval=30, 
-                first=1, 
-                data=chat_id, 
-                name=str(chat_id)
-            )
-            await query.edit_message_text(
-                text=f"✅ **UPSC {subject} Quiz Started!**\n\n"
-                     f"• UPSC-level questions will be posted every 30 seconds\n"
-                     f"• Each poll stays open for 25 seconds\n"
-                     f"• Use /stop to end quiz early\n"
-                     f"• Leaderboard at the end!",
-                parse_mode='Markdown'
-            )
-        else:
-            await query.edit_message_text(
-                text="❌ Sorry, I couldn't generate UPSC questions right now. Please try again later."
-            )
+        return
+    
+    group_quizzes[chat_id]['questions'] = mastery.with_group_reviews(chat_id, 'upsc', subject, quiz)
+    
+    # Log quiz start
+    try:
+        import log
+        await log.log_group_quiz_started(update, context, f"UPSC {subject}", group_name)
+        await log.log_admin_action(update, context, f"Started UPSC {subject} quiz{' (Fallback)' if fallback else ''}", group_name)
+    except ImportError:
+        pass
+    
+    # Start posting a question every QUESTION_INTERVAL seconds
+    context.job_queue.run_repeating(
+        post_upsc_question, 
+        interval=group.QUESTION_INTERVAL, 
+        first=1, 
+        data=chat_id, 
+        name=str(chat_id)
+    )
+    await query.edit_message_text(
+        text=f"✅ **UPSC {subject} Quiz Started!**\n\n"
+             f"• UPSC-level questions will be posted every {group.QUESTION_INTERVAL} seconds\n"
+             f"• Each poll stays open for {group.POLL_OPEN_PERIOD} seconds\n"
+             f"• Use /stop to end quiz early\n"
+             f"• Leaderboard at the end!",
+        parse_mode='Markdown'
+    )
 
 async def post_upsc_question(context: ContextTypes.DEFAULT_TYPE):
     """Post UPSC question as poll to group."""
@@ -239,6 +228,8 @@ async def post_upsc_question(context: ContextTypes.DEFAULT_TYPE):
     
     quiz_data = group_quizzes[chat_id]
     current_index = quiz_data['current_question']
+    # The previous poll has closed by now
+    group.record_last_poll(chat_id, quiz_data)
     
     if current_index >= len(quiz_data['questions']):
         # End of quiz
@@ -251,9 +242,10 @@ async def post_upsc_question(context: ContextTypes.DEFAULT_TYPE):
             text="🎉 UPSC Quiz completed! Use /quiz to start a new one."
         )
         
-        # Send leaderboard
+        # Send leaderboard, then the explanations that did not fit in the polls
         from group import send_leaderboard
         await send_leaderboard(context, chat_id, quiz_data['group_name'])
+        await group.send_review(context, chat_id, quiz_data)
         
         # Log completion
         try:
@@ -279,16 +271,20 @@ async def post_upsc_question(context: ContextTypes.DEFAULT_TYPE):
         poll_question = f"🎯 UPSC {current_index + 1}/{len(quiz_data['questions'])}: {question['question']}"
         poll_options = question['options']
         
+        started = time.perf_counter()
         message = await context.bot.send_poll(
             chat_id=chat_id,
             question=poll_question,
             options=poll_options,
             type=Poll.QUIZ,
             correct_option_id=question['correct_answer'],
+            explanation=group.poll_explanation(question),
             is_anonymous=False,
-            open_period=25
+            open_period=group.POLL_OPEN_PERIOD
         )
         
+        metrics.SEND_POLL_LATENCY.observe(time.perf_counter() - started, exam='upsc')
+        
         # Store poll info
         poll_id = message.poll.id
         quiz_data['poll_ids'].append(poll_id)
@@ -296,24 +292,28 @@ async def post_upsc_question(context: ContextTypes.DEFAULT_TYPE):
             'chat_id': chat_id,
             'question_index': current_index,
             'correct': False,
-            'explanation': question.get('explanation', '')
+            'explanation': question.get('explanation', ''),
+            'answered': 0,
+            'right': 0
         }
         
         quiz_data['current_question'] += 1
         
     except (BadRequest, Forbidden) as e:
+        metrics.SEND_POLL_ERRORS.inc(exam='upsc', error=type(e).__name__)
         logger.error(f"Error sending UPSC poll to group {chat_id}: {e}")
         quiz_data['current_question'] += 1
 
-async def generate_upsc_questions(subject: str, difficulty: str, num_questions: int = 20):
-    """Generate UPSC-level questions using Perplexity AI."""
+@instrument.timed_section('generator')
+async def generate_upsc_questions(subject: str, difficulty: str, num_questions: int = 20, topic: str = None):
+    """Generate UPSC-level questions using Perplexity AI (on `topic`, or a random topic of the subject).
+
+    With no subject (a keyword quiz outside the menu subjects) the questions are not banked."""
     try:
-        topic = random.choice(upsc_subjects[subject])
-        
-        url = "https://api.perplexity.ai/chat/completions"
+        topic = topic or random.choice(upsc_subjects[subject])
         
         prompt = f"""
-        Create {num_questions} UPSC Civil Services Examination level multiple choice questions on {subject}.
+        Create {num_questions} UPSC Civil Services Examination level multiple choice questions on {subject or topic}.
         Focus on: {topic}
         Difficulty: {difficulty} (UPSC CSE level)
         
@@ -340,42 +340,16 @@ async def generate_upsc_questions(subject: str, difficulty: str, num_questions:
         ]
         """
         
-        from main import PERPLEXITY_API_KEY
-        headers = {
-            "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "sonar",
-            "messages": [
-                {"role": "system", "content": "You are an expert UPSC CSE examination coach creating high-quality questions."},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 4000,
-            "temperature": 0.7
-        }
-        
-        import requests
-        response = requests.post(url, headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            response_data = response.json()
-            content = response_data['choices'][0]['message']['content']
-            
-            import json
-            try:
-                start_idx = content.find('[')
-                end_idx = content.rfind(']') + 1
-                json_str = content[start_idx:end_idx]
-                quiz_data = json.loads(json_str)
-                return quiz_data
-            except (json.JSONDecodeError, KeyError, IndexError):
-                logger.error("Failed to parse JSON from Perplexity for UPSC")
-                return None
-        else:
-            logger.error(f"Perplexity API error for UPSC: {response.status_code}")
-            return None
+        questions = await perplexity.generate(
+            'upsc',
+            "You are an expert UPSC CSE examination coach creating high-quality questions.",
+            prompt
+        )
+        # Drop unusable questions off the event loop, then keep the rest for solo practice
+        questions = await quality.filter_questions('upsc', questions)
+        if questions and subject:
+            bank.cache_generated('upsc', subject, questions)
+        return questions
             
     except Exception as e:
         logger.error(f"Error generating UPSC questions: {e}")
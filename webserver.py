@@ -0,0 +1,94 @@
+# webserver.py
+import json
+import logging
+import os
+import time
+from http import HTTPStatus
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+import health
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Readiness fails when the loop lag sampler reports more lag than this, or has stopped sampling
+READY_MAX_LOOP_LAG = float(os.environ.get("READY_MAX_LOOP_LAG", 2))
+READY_MAX_SAMPLE_AGE = 5.0
+
+# One access log line per webhook call is noise at INFO level
+logging.getLogger("tornado.access").setLevel(logging.WARNING)
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Acknowledge Telegram at once and leave dedupe, shedding and dispatch to the ingest queue."""
+
+    SUPPORTED_METHODS = ("POST",)
+
+    def initialize(self, update_ingest, secret_token):
+        self.update_ingest = update_ingest
+        self.secret_token = secret_token
+
+    def post(self):
+        if self.secret_token and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret_token:
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST)
+        # Shed and duplicate updates are acknowledged too, so Telegram stops redelivering them
+        self.update_ingest.accept(data)
+        self.set_status(HTTPStatus.OK)
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Expose the metrics registry in Prometheus text format."""
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(metrics.render())
+
+class LivenessHandler(tornado.web.RequestHandler):
+    """Answers as long as the event loop is turning - a hung loop makes the monitor time out."""
+
+    def get(self):
+        self.write("ok")
+
+    head = get
+
+class ReadinessHandler(tornado.web.RequestHandler):
+    """Ready when the bot is started, the loop is responsive and the job scheduler runs."""
+
+    def initialize(self, bot_application):
+        self.bot_application = bot_application
+
+    def get(self):
+        lag = health.get_loop_lag()
+        job_queue = self.bot_application.job_queue
+        checks = {
+            'bot_running': self.bot_application.running,
+            'loop_responsive': (
+                lag['current'] <= READY_MAX_LOOP_LAG
+                and time.time() - lag['sampled_at'] <= READY_MAX_SAMPLE_AGE
+            ),
+            'scheduler_running': bool(job_queue and job_queue.scheduler.running),
+        }
+        ready = all(checks.values())
+        self.set_status(HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps({'ready': ready, 'checks': checks, 'loop_lag_ms': round(lag['current'] * 1000, 1)}))
+
+    head = get
+
+def start_server(application, port: int, webhook_path: str = None, secret_token: str = None, update_ingest=None):
+    """Start the HTTP server on the running event loop; the webhook route needs an UpdateIngest."""
+    routes = [
+        (r"/metrics", MetricsHandler),
+        (r"/healthz", LivenessHandler),
+        (r"/readyz", ReadinessHandler, {'bot_application': application}),
+    ]
+    if webhook_path:
+        routes.append((webhook_path, WebhookHandler, {'update_ingest': update_ingest, 'secret_token': secret_token}))
+    server = HTTPServer(tornado.web.Application(routes))
+    server.listen(port, address="0.0.0.0")
+    logger.info(f"HTTP server listening on port {port} ({', '.join(route[0] for route in routes)})")
+    return server